@@ -49,6 +49,8 @@ class A2C(OnPolicyAlgorithm):
     :param seed: Seed for the pseudo random generators
     :param device: Device (cpu, cuda, ...) on which the code should be run.
         Setting it to auto, the code will be run on the GPU if possible.
+    :param rollout_buffer_kwargs: Keyword arguments to pass to the rollout buffer on creation
+        (for instance ``dict(dtypes=dict(observations=np.uint8))``).
     :param _init_setup_model: Whether or not to build the network at the creation of the instance
     """
 
@@ -74,6 +76,7 @@ class A2C(OnPolicyAlgorithm):
         verbose: int = 0,
         seed: Optional[int] = None,
         device: Union[th.device, str] = "auto",
+        rollout_buffer_kwargs: Optional[Dict[str, Any]] = None,
         _init_setup_model: bool = True,
     ):
 
@@ -95,6 +98,7 @@ class A2C(OnPolicyAlgorithm):
             device=device,
             create_eval_env=create_eval_env,
             seed=seed,
+            rollout_buffer_kwargs=rollout_buffer_kwargs,
             _init_setup_model=False,
             supported_action_spaces=(
                 spaces.Box,
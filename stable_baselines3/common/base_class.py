@@ -30,7 +30,7 @@ from stable_baselines3.common.utils import (check_for_correct_spaces,
                                             get_device, get_schedule_fn,
                                             get_system_info, set_random_seed,
                                             update_learning_rate)
-from stable_baselines3.common.vec_env import (DummyVecEnv, VecEnv,
+from stable_baselines3.common.vec_env import (DummyVecEnv, VecEnv, VecEnvInfos,
                                               VecNormalize, VecTransposeImage,
                                               is_vecenv_wrapped,
                                               unwrap_vec_normalize)
@@ -485,6 +485,14 @@ class BaseAlgorithm(ABC):
         :param infos: List of additional information about the transition.
         :param dones: Termination signals
         """
+        if isinstance(infos, VecEnvInfos):
+            # Only the envs whose episode ended have statistics
+            for idx in infos.episode_indices:
+                self.ep_info_buffer.extend([infos[idx]["episode"]])
+            if dones is not None:
+                is_success = infos.is_success[np.asarray(dones, dtype=bool)]
+                self.ep_success_buffer.extend(is_success[~np.isnan(is_success)])
+            return
         if dones is None:
             dones = np.array([False] * len(infos))
         for idx, info in enumerate(infos):
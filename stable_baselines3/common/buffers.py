@@ -1,17 +1,34 @@
+import functools
+import inspect
+import json
+import lzma
+import multiprocessing
+import os
+import threading
 import warnings
+import weakref
+import zlib
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Generator, List, Optional, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (Any, Callable, Dict, Generator, List, NamedTuple, Optional,
+                    Tuple, Union)
 
 import numpy as np
 import torch as th
 from gym import spaces
 from stable_baselines3.common.preprocessing import (get_action_dim,
                                                     get_obs_shape)
-from stable_baselines3.common.type_aliases import (DictReplayBufferSamples,
-                                                   DictRolloutBufferSamples,
-                                                   ReplayBufferSamples,
-                                                   RolloutBufferSamples)
-from stable_baselines3.common.vec_env import VecNormalize
+from stable_baselines3.common.segment_tree import (MinSegmentTree,
+                                                   SumSegmentTree)
+from stable_baselines3.common.type_aliases import (
+    DictNStepReplayBufferSamples, DictPrioritizedReplayBufferSamples,
+    DictReplayBufferSamples, DictRolloutBufferSamples,
+    NStepReplayBufferSamples, PrioritizedReplayBufferSamples,
+    ReplayBufferSamples, RolloutBufferSamples)
+from stable_baselines3.common.utils import discounted_reverse_scan, get_device
+from stable_baselines3.common.vec_env import (StackedObservations,
+                                              VecNormalize, get_timeouts)
 
 try:
     # Check memory used by replay buffer when possible
@@ -19,6 +36,18 @@ try:
 except ImportError:
     psutil = None
 
+try:
+    # Fast compression of observations when possible
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    # Replay buffers shared between processes (Python >= 3.8)
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
 
 class BaseBuffer(ABC):
     """
@@ -30,8 +59,16 @@ class BaseBuffer(ABC):
     :param device: PyTorch device
         to which the values will be converted
     :param n_envs: Number of parallel environments
+    :param dtypes: Storage dtype of the fields of the buffer, by field name
+        (for instance ``dict(observations=np.float16, dones=np.bool_)``),
+        the fields that are not in this schema use the default dtype of the buffer.
+        For dict observations, the dtype of ``observations`` can also be a dict of dtypes by key.
+        The sampled data is cast back to the dtype used for training.
     """
 
+    # Fields whose storage dtype can be set with `dtypes`
+    _dtype_fields = ()
+
     def __init__(
         self,
         buffer_size: int,
@@ -39,6 +76,7 @@ class BaseBuffer(ABC):
         action_space: spaces.Space,
         device: Union[th.device, str] = "cpu",
         n_envs: int = 1,
+        dtypes: Optional[Dict[str, Any]] = None,
     ):
         super(BaseBuffer, self).__init__()
         self.buffer_size = buffer_size
@@ -51,6 +89,11 @@ class BaseBuffer(ABC):
         self.full = False
         self.device = device
         self.n_envs = n_envs
+        self.dtypes = {} if dtypes is None else dict(dtypes)
+        unknown_fields = set(self.dtypes.keys()) - set(self._dtype_fields)
+        assert (
+            not unknown_fields
+        ), f"Unknown fields {unknown_fields} in dtypes, the fields are {self._dtype_fields}"
 
     @staticmethod
     def swap_and_flatten(arr: np.ndarray) -> np.ndarray:
@@ -89,6 +132,31 @@ class BaseBuffer(ABC):
         for data in zip(*args):
             self.add(*data)
 
+    def _write_batch(self, array: np.ndarray, data: np.ndarray) -> None:
+        """
+        Write a batch of consecutive entries along the first axis of ``array``,
+        starting at ``self.pos`` and wrapping around at ``buffer_size``.
+        It uses at most two slice assignments.
+        When the batch is larger than the buffer, only the last entries are kept.
+
+        :param array: Storage of one field, of shape ``(buffer_size, ...)``
+        :param data: Batch to write, of shape ``(batch_size, ...)``
+        """
+        batch_size = len(data)
+        start = self.pos
+        if batch_size > self.buffer_size:
+            start += batch_size - self.buffer_size
+            data = data[-self.buffer_size :]
+            batch_size = self.buffer_size
+        start %= self.buffer_size
+        end = start + batch_size
+        if end <= self.buffer_size:
+            array[start:end] = data
+        else:
+            split = self.buffer_size - start
+            array[start:] = data[:split]
+            array[: end - self.buffer_size] = data[split:]
+
     def reset(self) -> None:
         """
         Reset the buffer.
@@ -96,6 +164,20 @@ class BaseBuffer(ABC):
         self.pos = 0
         self.full = False
 
+    def _storage_dtype(
+        self, name: str, default: Any, key: Optional[str] = None
+    ) -> np.dtype:
+        """
+        :param name: Name of the field
+        :param default: Default dtype of the field
+        :param key: Key of the observation, for dict observations
+        :return: The dtype used to store the field
+        """
+        dtype = self.dtypes.get(name, default)
+        if isinstance(dtype, dict):
+            dtype = dtype.get(key, default)
+        return np.dtype(dtype)
+
     def sample(self, batch_size: int, env: Optional[VecNormalize] = None):
         """
         :param batch_size: Number of element to sample
@@ -147,7 +229,167 @@ class BaseBuffer(ABC):
     ) -> np.ndarray:
         if env is not None:
             return env.normalize_reward(reward).astype(np.float32)
-        return reward
+        return reward.astype(np.float32, copy=False)
+
+
+class ReplayBufferPrefetcher(object):
+    """
+    Assemble the next batches of a replay buffer in a background thread,
+    so sampling (index generation, gathers, normalization, conversion to tensors)
+    overlaps with the gradient steps.
+    The thread holds ``lock`` while it samples a batch, the buffer must hold it
+    while it is modified and then call ``invalidate()``.
+
+    After each modification, the first batch is sampled on request
+    and the following ones are prefetched, so it is mostly useful
+    with several gradient steps per rollout.
+    The batches are sampled with the global NumPy random generator
+    from another thread, so the order of the random draws is not reproducible.
+
+    :param replay_buffer: Replay buffer to sample from,
+        only a weak reference is kept
+    :param n_batches: Maximum number of batches assembled in advance
+    """
+
+    def __init__(self, replay_buffer: "ReplayBuffer", n_batches: int):
+        assert n_batches > 0, "At least one batch must be prefetched"
+        self._replay_buffer_ref = weakref.ref(replay_buffer)
+        self.n_batches = n_batches
+        # Protects the content of the buffer
+        self.lock = threading.RLock()
+        # Protects the queue of batches
+        self._condition = threading.Condition()
+        self._batches = deque()
+        # Incremented each time the prefetched batches become invalid
+        self._generation = 0
+        # Batch size and env of the last request
+        self._request = None
+        # Whether batches should be prefetched for the current request
+        self._active = False
+        self._error = None
+        self._closed = False
+        self._thread = None
+
+    def get(
+        self, batch_size: int, env: Optional[VecNormalize] = None
+    ) -> Union[ReplayBufferSamples, DictReplayBufferSamples]:
+        """
+        Return the next batch, starting the prefetching of the following ones.
+
+        :param batch_size: Number of element to sample
+        :param env: associated gym VecEnv
+            to normalize the observations/rewards when sampling
+        :return:
+        """
+        with self._condition:
+            if self._request != (batch_size, env):
+                self._request = (batch_size, env)
+                self._batches.clear()
+                self._generation += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            while not self._batches:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                # (Re-)activate in case the buffer was modified from another thread
+                self._active = True
+                self._condition.notify_all()
+                self._condition.wait()
+            self._active = True
+            batch = self._batches.popleft()
+            # Let the thread assemble a new batch
+            self._condition.notify_all()
+            return batch
+
+    def invalidate(self) -> None:
+        """
+        Drop the prefetched batches, they do not include the new transitions.
+        Prefetching resumes with the next call to ``get()``.
+        """
+        with self._condition:
+            self._batches.clear()
+            self._generation += 1
+            self._active = False
+
+    def close(self) -> None:
+        """
+        Stop the background thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not (self._active and len(self._batches) < self.n_batches):
+                    if self._closed or self._replay_buffer_ref() is None:
+                        return
+                    # Wake up regularly to exit once the buffer is garbage collected
+                    self._condition.wait(timeout=1.0)
+                generation, (batch_size, env) = self._generation, self._request
+
+            replay_buffer = self._replay_buffer_ref()
+            if replay_buffer is None:
+                return
+            batch, error = None, None
+            with self.lock:
+                try:
+                    batch = replay_buffer._sample_batch(batch_size, env)
+                except Exception as error_:
+                    error = error_
+            # Do not keep the buffer alive while waiting
+            del replay_buffer
+
+            with self._condition:
+                # Discard the batch if the buffer was modified in the meantime
+                if generation == self._generation:
+                    if error is None:
+                        self._batches.append(batch)
+                    else:
+                        # Raised in the thread calling `get()`
+                        self._error = error
+                        self._active = False
+                    self._condition.notify_all()
+
+
+def _writes_transitions(batched: bool = False) -> Callable[[Callable], Callable]:
+    """
+    Decorator for the methods that add transitions to a replay buffer:
+    the buffer is not sampled by the prefetcher while it is modified,
+    the batches prefetched before are dropped
+    and the number of rows written is counted for incremental checkpoints.
+
+    :param batched: Whether the method writes a batch of steps (one per entry of ``reward``),
+        otherwise it writes a single row
+    """
+
+    def decorator(method: Callable) -> Callable:
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            prefetcher = getattr(self, "_prefetcher", None)
+            if prefetcher is None:
+                result = method(self, *args, **kwargs)
+            else:
+                with prefetcher.lock:
+                    result = method(self, *args, **kwargs)
+                    prefetcher.invalidate()
+            # Counted from the batch and not from `pos`, which cannot tell
+            # how many times the batch went around the buffer
+            rows_written = 1
+            if batched:
+                reward = signature.bind(self, *args, **kwargs).arguments["reward"]
+                rows_written = min(len(reward), self.buffer_size)
+            self._rows_written = getattr(self, "_rows_written", 0) + rows_written
+            return result
+
+        return wrapper
+
+    return decorator
 
 
 class ReplayBuffer(BaseBuffer):
@@ -167,8 +409,23 @@ class ReplayBuffer(BaseBuffer):
     :param handle_timeout_termination: Handle timeout termination (due to timelimit)
         separately and treat the task as infinite horizon task.
         https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param storage_path: If not ``None``, every field of the buffer is stored
+        in a memory-mapped file (``np.memmap``) inside that directory instead of RAM,
+        the OS page cache then decides which part of the buffer is resident.
+        Existing files with matching size are reopened (together with ``pos`` and ``full``
+        when ``flush()`` was called), so the buffer can be reused after a restart.
+    :param prefetch_batches: If positive, ``sample()`` returns batches assembled
+        in advance by a background thread (see ``ReplayBufferPrefetcher``),
+        at most ``prefetch_batches`` are kept ready. The batches prefetched
+        before the addition of new transitions are dropped.
+    :param dtypes: Storage dtype of ``observations`` (default: dtype of the observation space),
+        ``actions`` (default: dtype of the action space), ``rewards``, ``dones``
+        and ``timeouts`` (default: ``float32``), for instance ``dict(dones=np.bool_)``.
+        The sampled data is cast back to the default dtypes.
     """
 
+    _dtype_fields = ("observations", "actions", "rewards", "dones", "timeouts")
+
     def __init__(
         self,
         buffer_size: int,
@@ -178,13 +435,28 @@ class ReplayBuffer(BaseBuffer):
         n_envs: int = 1,
         optimize_memory_usage: bool = False,
         handle_timeout_termination: bool = True,
+        storage_path: Optional[str] = None,
+        prefetch_batches: int = 0,
+        dtypes: Optional[Dict[str, Any]] = None,
     ):
         super(ReplayBuffer, self).__init__(
-            buffer_size, observation_space, action_space, device, n_envs=n_envs
+            buffer_size,
+            observation_space,
+            action_space,
+            device,
+            n_envs=n_envs,
+            dtypes=dtypes,
         )
 
         # Adjust buffer size
         self.buffer_size = max(buffer_size // n_envs, 1)
+        self.storage_path = storage_path
+        self._storage_reused = True
+        self.prefetch_batches = prefetch_batches
+        # Created on first sampling
+        self._prefetcher = None
+        # Total number of rows written, for incremental checkpoints
+        self._rows_written = 0
 
         # Check that the replay buffer can fit into the memory
         if psutil is not None:
@@ -192,32 +464,34 @@ class ReplayBuffer(BaseBuffer):
 
         self.optimize_memory_usage = optimize_memory_usage
 
-        self.observations = np.zeros(
+        self.observations = self._allocate(
+            "observations",
             (self.buffer_size, self.n_envs) + self.obs_shape,
-            dtype=observation_space.dtype,
+            dtype=self._storage_dtype("observations", observation_space.dtype),
         )
 
         if optimize_memory_usage:
             # `observations` contains also the next observation
             self.next_observations = None
         else:
-            self.next_observations = np.zeros(
+            self.next_observations = self._allocate(
+                "next_observations",
                 (self.buffer_size, self.n_envs) + self.obs_shape,
-                dtype=observation_space.dtype,
+                dtype=self._storage_dtype("observations", observation_space.dtype),
             )
 
-        self.actions = np.zeros(
-            (self.buffer_size, self.n_envs, self.action_dim), dtype=action_space.dtype
-        )
-
-        self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
-        self.dones = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self._allocate_transition_fields()
         # Handle timeouts termination properly if needed
         # see https://github.com/DLR-RM/stable-baselines3/issues/284
         self.handle_timeout_termination = handle_timeout_termination
-        self.timeouts = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
-
-        if psutil is not None:
+        self._load_storage_state()
+
+        # Memory-mapped and device storages do not use RAM
+        if (
+            psutil is not None
+            and storage_path is None
+            and isinstance(self.observations, np.ndarray)
+        ):
             total_memory_usage = (
                 self.observations.nbytes
                 + self.actions.nbytes
@@ -237,6 +511,161 @@ class ReplayBuffer(BaseBuffer):
                     f"replay buffer {total_memory_usage:.2f}GB > {mem_available:.2f}GB"
                 )
 
+    def _allocate(self, name: str, shape: Tuple[int, ...], dtype: Any) -> np.ndarray:
+        """
+        Allocate the storage for one field of the buffer,
+        either in RAM or as a memory-mapped file when ``storage_path`` is set.
+
+        :param name: Name of the field, used as file name
+        :param shape: Shape of the field
+        :param dtype: Data type of the field
+        :return: The (zero-initialized or reopened) array
+        """
+        if self.storage_path is None:
+            return np.zeros(shape, dtype=dtype)
+
+        os.makedirs(self.storage_path, exist_ok=True)
+        filename = os.path.join(self.storage_path, f"{name}.dat")
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        # Reopen existing file only if it matches the requested layout
+        if os.path.exists(filename) and os.path.getsize(filename) == nbytes:
+            mode = "r+"
+        else:
+            mode = "w+"
+            # The content of the other files cannot be trusted anymore
+            self._storage_reused = False
+        return np.memmap(filename, dtype=dtype, mode=mode, shape=shape)
+
+    def _allocate_transition_fields(self) -> None:
+        """
+        Allocate the storage for the fields that do not depend on the observation space.
+        """
+        self.actions = self._allocate(
+            "actions",
+            (self.buffer_size, self.n_envs, self.action_dim),
+            dtype=self._storage_dtype("actions", self.action_space.dtype),
+        )
+        for name in ["rewards", "dones", "timeouts"]:
+            array = self._allocate(
+                name,
+                (self.buffer_size, self.n_envs),
+                dtype=self._storage_dtype(name, np.float32),
+            )
+            setattr(self, name, array)
+
+    def _restore_obs_dtype(
+        self, obs: Union[np.ndarray, Dict[str, np.ndarray]]
+    ) -> Union[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Cast sampled observations back to the dtype of the observation space.
+
+        :param obs: Sampled observations, in their storage dtype
+        :return: The observations, in the dtype of the observation space
+        """
+        if isinstance(obs, dict):
+            return {
+                key: obs_.astype(self.observation_space[key].dtype, copy=False)
+                for key, obs_ in obs.items()
+            }
+        return obs.astype(self.observation_space.dtype, copy=False)
+
+    def _sampled_dones(
+        self, batch_inds: np.ndarray, env_indices: np.ndarray
+    ) -> np.ndarray:
+        """
+        :param batch_inds: Indices of the sampled transitions
+        :param env_indices: Env index of the sampled transitions
+        :return: The termination signals, as float32 column vector.
+            Only use dones that are not due to timeouts
+            deactivated by default (timeouts is initialized as an array of False)
+        """
+        dones = self.dones[batch_inds, env_indices].astype(np.float32)
+        timeouts = self.timeouts[batch_inds, env_indices].astype(np.float32)
+        return (dones * (1 - timeouts)).reshape(-1, 1)
+
+    def _storage_state_file(self) -> str:
+        return os.path.join(self.storage_path, "replay_buffer.json")
+
+    def _load_storage_state(self) -> None:
+        """
+        Restore ``pos`` and ``full`` when reopening memory-mapped storage
+        that was written by a buffer with the same layout.
+        """
+        if self.storage_path is None:
+            return
+        state_file = self._storage_state_file()
+        if self._storage_reused and os.path.exists(state_file):
+            with open(state_file, "r") as file_handler:
+                state = json.load(file_handler)
+            if (state["buffer_size"], state["n_envs"]) == (
+                self.buffer_size,
+                self.n_envs,
+            ):
+                self.pos = state["pos"]
+                self.full = state["full"]
+
+    def flush(self) -> None:
+        """
+        When using memory-mapped storage, write the pending changes to disk
+        together with ``pos`` and ``full`` so the buffer can be reopened later
+        by passing the same ``storage_path``.
+        """
+        if self.storage_path is None:
+            return
+        for array in self.__dict__.values():
+            arrays = array.values() if isinstance(array, dict) else [array]
+            for array_ in arrays:
+                if isinstance(array_, np.memmap):
+                    array_.flush()
+        with open(self._storage_state_file(), "w") as file_handler:
+            json.dump(
+                dict(
+                    pos=self.pos,
+                    full=self.full,
+                    buffer_size=self.buffer_size,
+                    n_envs=self.n_envs,
+                ),
+                file_handler,
+            )
+
+    def _checkpoint_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Arrays indexed by buffer position that incremental checkpoints
+        save in chunks along their first axis (instead of pickling them).
+        The values of dict attributes are named ``<attribute>.<key>``.
+
+        :return: The arrays, by name
+        """
+        arrays = {}
+        for name in [
+            "observations",
+            "next_observations",
+            "actions",
+            "rewards",
+            "dones",
+            "timeouts",
+        ]:
+            value = getattr(self, name)
+            if isinstance(value, dict):
+                arrays.update({f"{name}.{key}": array for key, array in value.items()})
+            elif value is not None:
+                arrays[name] = value
+        return arrays
+
+    def _load_checkpoint_array(self, name: str, array: np.ndarray) -> None:
+        """
+        Set an array loaded from an incremental checkpoint.
+
+        :param name: Name of the array (see ``_checkpoint_arrays()``)
+        :param array: The loaded array
+        """
+        attribute, _, key = name.partition(".")
+        if key:
+            getattr(self, attribute)[key] = array
+        else:
+            setattr(self, attribute, array)
+
+    @_writes_transitions()
     def add(
         self,
         obs: np.ndarray,
@@ -272,17 +701,130 @@ class ReplayBuffer(BaseBuffer):
         self.dones[self.pos] = np.array(done).copy()
 
         if self.handle_timeout_termination:
-            self.timeouts[self.pos] = np.array(
-                [info.get("TimeLimit.truncated", False) for info in infos]
-            )
+            self.timeouts[self.pos] = get_timeouts(infos)
 
         self.pos += 1
         if self.pos == self.buffer_size:
             self.full = True
             self.pos = 0
 
+    @_writes_transitions(batched=True)
+    def extend(
+        self,
+        obs: np.ndarray,
+        next_obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: Optional[List[List[Dict[str, Any]]]] = None,
+    ) -> None:
+        """
+        Add a batch of consecutive steps to the buffer at once.
+        Each argument has the shape of the argument of ``add()``
+        with an additional first (batch) dimension.
+
+        :param obs: Observations, of shape ``(batch_size, n_envs, ...)``
+        :param next_obs: Next observations
+        :param action: Actions
+        :param reward: Rewards
+        :param done: Termination signals
+        :param infos: For each step, the list of infos of each env.
+            If ``None``, no timeout is recorded.
+        """
+        batch_size = len(reward)
+        # Reshape needed when using multiple envs with discrete observations
+        if isinstance(self.observation_space, spaces.Discrete):
+            obs = obs.reshape((batch_size, self.n_envs) + self.obs_shape)
+            next_obs = next_obs.reshape((batch_size, self.n_envs) + self.obs_shape)
+        # Same, for actions
+        if isinstance(self.action_space, spaces.Discrete):
+            action = action.reshape((batch_size, self.n_envs, self.action_dim))
+
+        self._write_batch(self.observations, obs)
+        if self.optimize_memory_usage:
+            # Each next observation is overwritten by the observation
+            # of the following step, except for the last one
+            self.observations[(self.pos + batch_size) % self.buffer_size] = next_obs[-1]
+        else:
+            self._write_batch(self.next_observations, next_obs)
+        self._write_batch(self.actions, action)
+        self._write_batch(self.rewards, np.reshape(reward, (batch_size, self.n_envs)))
+        self._write_batch(self.dones, np.reshape(done, (batch_size, self.n_envs)))
+
+        if self.handle_timeout_termination:
+            if infos is None:
+                timeouts = np.zeros((batch_size, self.n_envs))
+            else:
+                timeouts = np.array([get_timeouts(infos_) for infos_ in infos])
+            self._write_batch(self.timeouts, timeouts)
+
+        self.full = self.full or self.pos + batch_size >= self.buffer_size
+        self.pos = (self.pos + batch_size) % self.buffer_size
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        # Threads cannot be pickled, the prefetcher is re-created lazily
+        state["_prefetcher"] = None
+        return state
+
     def sample(
         self, batch_size: int, env: Optional[VecNormalize] = None
+    ) -> ReplayBufferSamples:
+        """
+        Sample elements from the replay buffer,
+        or return a prefetched batch when ``prefetch_batches`` is positive.
+
+        :param batch_size: Number of element to sample
+        :param env: associated gym VecEnv
+            to normalize the observations/rewards when sampling
+        :return:
+        """
+        # Buffers saved before prefetching was added do not have the attribute
+        if getattr(self, "prefetch_batches", 0) > 0:
+            if self._prefetcher is None:
+                self._prefetcher = ReplayBufferPrefetcher(self, self.prefetch_batches)
+            return self._prefetcher.get(batch_size, env)
+        return self._sample_batch(batch_size, env)
+
+    def sample_many(
+        self, n_batches: int, batch_size: int, env: Optional[VecNormalize] = None
+    ) -> List[ReplayBufferSamples]:
+        """
+        Sample several batches at once, with a single index draw and a single gather.
+        Each field is sampled as one ``(n_batches, batch_size, ...)`` tensor
+        and the returned batches are views of it.
+
+        :param n_batches: Number of batches
+        :param batch_size: Number of element in each batch
+        :param env: associated gym VecEnv
+            to normalize the observations/rewards when sampling
+        :return: The batches
+        """
+        samples = self.sample(n_batches * batch_size, env=env)
+
+        def split(data: Union[th.Tensor, np.ndarray]) -> Union[th.Tensor, np.ndarray]:
+            return data.reshape((n_batches, batch_size) + tuple(data.shape[1:]))
+
+        fields = [
+            {key: split(value) for key, value in data.items()}
+            if isinstance(data, dict)
+            else split(data)
+            for data in samples
+        ]
+        return [
+            type(samples)(
+                *[
+                    {key: value[idx] for key, value in data.items()}
+                    if isinstance(data, dict)
+                    else data[idx]
+                    for data in fields
+                ]
+            )
+            for idx in range(n_batches)
+        ]
+
+    def _sample_batch(
+        self, batch_size: int, env: Optional[VecNormalize] = None
     ) -> ReplayBufferSamples:
         """
         Sample elements from the replay buffer.
@@ -308,31 +850,34 @@ class ReplayBuffer(BaseBuffer):
         return self._get_samples(batch_inds, env=env)
 
     def _get_samples(
-        self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None
+        self,
+        batch_inds: np.ndarray,
+        env: Optional[VecNormalize] = None,
+        env_indices: Optional[np.ndarray] = None,
     ) -> ReplayBufferSamples:
         # Sample randomly the env idx
-        env_indices = np.random.randint(0, high=self.n_envs, size=(len(batch_inds),))
+        if env_indices is None:
+            env_indices = np.random.randint(
+                0, high=self.n_envs, size=(len(batch_inds),)
+            )
 
         if self.optimize_memory_usage:
-            next_obs = self._normalize_obs(
-                self.observations[(batch_inds + 1) % self.buffer_size, env_indices, :],
-                env,
-            )
+            next_obs = self.observations[
+                (batch_inds + 1) % self.buffer_size, env_indices, :
+            ]
         else:
-            next_obs = self._normalize_obs(
-                self.next_observations[batch_inds, env_indices, :], env
-            )
+            next_obs = self.next_observations[batch_inds, env_indices, :]
 
         data = (
-            self._normalize_obs(self.observations[batch_inds, env_indices, :], env),
-            self.actions[batch_inds, env_indices, :],
-            next_obs,
-            # Only use dones that are not due to timeouts
-            # deactivated by default (timeouts is initialized as an array of False)
-            (
-                self.dones[batch_inds, env_indices]
-                * (1 - self.timeouts[batch_inds, env_indices])
-            ).reshape(-1, 1),
+            self._normalize_obs(
+                self._restore_obs_dtype(self.observations[batch_inds, env_indices, :]),
+                env,
+            ),
+            self.actions[batch_inds, env_indices, :].astype(
+                self.action_space.dtype, copy=False
+            ),
+            self._normalize_obs(self._restore_obs_dtype(next_obs), env),
+            self._sampled_dones(batch_inds, env_indices),
             self._normalize_reward(
                 self.rewards[batch_inds, env_indices].reshape(-1, 1), env
             ),
@@ -361,8 +906,27 @@ class RolloutBuffer(BaseBuffer):
         Equivalent to classic advantage when set to 1.
     :param gamma: Discount factor
     :param n_envs: Number of parallel environments
+    :param dtypes: Storage dtype of ``observations``, ``actions``, ``rewards``, ``returns``,
+        ``episode_starts``, ``values``, ``log_probs`` and ``advantages`` (default: ``float32``),
+        for instance ``dict(observations=np.uint8)`` for images.
+        The sampled data is cast back to ``float32``.
+    :param persistent_storage: Allocate the storage once and reuse it for every rollout
+        (zeroed in place by ``reset()``), flattening into a second preallocated array in ``get()``,
+        instead of allocating new arrays for each rollout.
+        This keeps both layouts in memory between rollouts.
     """
 
+    _dtype_fields = (
+        "observations",
+        "actions",
+        "rewards",
+        "returns",
+        "episode_starts",
+        "values",
+        "log_probs",
+        "advantages",
+    )
+
     def __init__(
         self,
         buffer_size: int,
@@ -372,10 +936,17 @@ class RolloutBuffer(BaseBuffer):
         gae_lambda: float = 1,
         gamma: float = 0.99,
         n_envs: int = 1,
+        dtypes: Optional[Dict[str, Any]] = None,
+        persistent_storage: bool = False,
     ):
 
         super(RolloutBuffer, self).__init__(
-            buffer_size, observation_space, action_space, device, n_envs=n_envs
+            buffer_size,
+            observation_space,
+            action_space,
+            device,
+            n_envs=n_envs,
+            dtypes=dtypes,
         )
         self.gae_lambda = gae_lambda
         self.gamma = gamma
@@ -392,27 +963,93 @@ class RolloutBuffer(BaseBuffer):
             None,
         )
         self.generator_ready = False
+        self.persistent_storage = persistent_storage
+        # Arrays allocated by the first reset and flattened copies, in persistent storage mode
+        self._storage, self._flat_storage = None, {}
         self.reset()
 
     def reset(self) -> None:
-
-        self.observations = np.zeros(
-            (self.buffer_size, self.n_envs) + self.obs_shape, dtype=np.float32
-        )
-        self.actions = np.zeros(
-            (self.buffer_size, self.n_envs, self.action_dim), dtype=np.float32
-        )
-        self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
-        self.returns = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
-        self.episode_starts = np.zeros(
-            (self.buffer_size, self.n_envs), dtype=np.float32
-        )
-        self.values = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
-        self.log_probs = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
-        self.advantages = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        if self._storage is not None:
+            self._reuse_storage()
+        else:
+            self.observations = np.zeros(
+                (self.buffer_size, self.n_envs) + self.obs_shape,
+                dtype=self._storage_dtype("observations", np.float32),
+            )
+            self.actions = np.zeros(
+                (self.buffer_size, self.n_envs, self.action_dim),
+                dtype=self._storage_dtype("actions", np.float32),
+            )
+            self._reset_scalar_fields()
+            self._keep_storage()
         self.generator_ready = False
+        self._rollout_samples = None
         super(RolloutBuffer, self).reset()
 
+    def _keep_storage(self) -> None:
+        """
+        Keep a reference to the arrays just allocated, in persistent storage mode,
+        as ``get()`` replaces them with their flattened version.
+        """
+        if self.persistent_storage:
+            self._storage = {}
+            for name in self._dtype_fields:
+                array = getattr(self, name)
+                self._storage[name] = dict(array) if isinstance(array, dict) else array
+
+    def _reuse_storage(self) -> None:
+        """
+        Zero the persistent storage in place and use it again.
+        """
+        for name, array in self._storage.items():
+            if isinstance(array, dict):
+                for sub_array in array.values():
+                    sub_array.fill(0)
+                array = dict(array)
+            else:
+                array.fill(0)
+            setattr(self, name, array)
+
+    def _flatten(self, array: np.ndarray, name: Any) -> np.ndarray:
+        """
+        Swap and flatten the first two axes of a field (see ``swap_and_flatten()``),
+        into a preallocated array in persistent storage mode.
+
+        :param array: Array of shape (buffer_size, n_envs, ...)
+        :param name: Identifier of the field
+        :return: Array of shape (buffer_size * n_envs, ...)
+        """
+        if not self.persistent_storage:
+            return self.swap_and_flatten(array)
+        if name not in self._flat_storage:
+            shape = array.shape[2:] if array.ndim > 2 else (1,)
+            self._flat_storage[name] = np.empty(
+                (self.buffer_size * self.n_envs,) + shape, dtype=array.dtype
+            )
+        flat_array = self._flat_storage[name]
+        # Write through a (contiguous) view with the swapped shape
+        swapped = flat_array.reshape((self.n_envs, self.buffer_size) + array.shape[2:])
+        swapped[...] = array.swapaxes(0, 1)
+        return flat_array
+
+    def _reset_scalar_fields(self) -> None:
+        """
+        Allocate the fields with one value per step and env.
+        """
+        for name in [
+            "rewards",
+            "returns",
+            "episode_starts",
+            "values",
+            "log_probs",
+            "advantages",
+        ]:
+            array = np.zeros(
+                (self.buffer_size, self.n_envs),
+                dtype=self._storage_dtype(name, np.float32),
+            )
+            setattr(self, name, array)
+
     def compute_returns_and_advantage(
         self, last_values: th.Tensor, dones: np.ndarray
     ) -> None:
@@ -436,27 +1073,31 @@ class RolloutBuffer(BaseBuffer):
         """
         # Convert to numpy
         last_values = last_values.clone().cpu().numpy().flatten()
-
-        last_gae_lam = 0
-        for step in reversed(range(self.buffer_size)):
-            if step == self.buffer_size - 1:
-                next_non_terminal = 1.0 - dones
-                next_values = last_values
-            else:
-                next_non_terminal = 1.0 - self.episode_starts[step + 1]
-                next_values = self.values[step + 1]
-            delta = (
-                self.rewards[step]
-                + self.gamma * next_values * next_non_terminal
-                - self.values[step]
-            )
-            last_gae_lam = (
-                delta + self.gamma * self.gae_lambda * next_non_terminal * last_gae_lam
-            )
-            self.advantages[step] = last_gae_lam
+        # Compute in float32 whatever the storage dtypes
+        rewards = self.rewards.astype(np.float32, copy=False)
+        values = self.values.astype(np.float32, copy=False)
+        episode_starts = self.episode_starts.astype(np.float32, copy=False)
+
+        # One-step TD errors of all the steps at once,
+        # the last step bootstraps from ``last_values`` instead of the next stored value
+        last_non_terminal = 1.0 - dones
+        last_delta = (
+            rewards[-1] + self.gamma * last_values * last_non_terminal - values[-1]
+        )
+        next_non_terminal = 1.0 - episode_starts[1:]
+        # Keep the precision of the last step (float64 with boolean dones) for the recursion
+        deltas = np.empty(rewards.shape, dtype=np.result_type(rewards, last_delta))
+        deltas[:-1] = (
+            rewards[:-1] + self.gamma * values[1:] * next_non_terminal - values[:-1]
+        )
+        deltas[-1] = last_delta
+        discounts = np.empty(rewards.shape, dtype=np.float32)
+        discounts[:-1] = self.gamma * self.gae_lambda * next_non_terminal
+        discounts[-1] = self.gamma * self.gae_lambda * last_non_terminal
+        discounted_reverse_scan(deltas, discounts, out=self.advantages)
         # TD(lambda) estimator, see Github PR #375 or "Telescoping in TD(lambda)"
         # in David Silver Lecture 4: https://www.youtube.com/watch?v=PnHCvfgC_ZA
-        self.returns = self.advantages + self.values
+        self.returns[:] = self.advantages + values
 
     def add(
         self,
@@ -496,27 +1137,61 @@ class RolloutBuffer(BaseBuffer):
         if self.pos == self.buffer_size:
             self.full = True
 
+    def extend(
+        self,
+        obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        episode_start: np.ndarray,
+        value: th.Tensor,
+        log_prob: th.Tensor,
+    ) -> None:
+        """
+        Add a batch of consecutive steps to the buffer at once.
+        Each argument has the shape of the argument of ``add()``
+        with an additional first (batch) dimension.
+
+        :param obs: Observations, of shape ``(batch_size, n_envs, ...)``
+        :param action: Actions
+        :param reward: Rewards
+        :param episode_start: Start of episode signals
+        :param value: estimated values of the states
+        :param log_prob: log probabilities of the actions
+        """
+        batch_size = len(reward)
+        assert (
+            self.pos + batch_size <= self.buffer_size
+        ), "The batch does not fit in the rollout buffer"
+        shape = (batch_size, self.n_envs)
+        self._extend_observations(obs, batch_size)
+        self._write_batch(self.actions, np.reshape(action, shape + (self.action_dim,)))
+        self._write_batch(self.rewards, np.reshape(reward, shape))
+        self._write_batch(self.episode_starts, np.reshape(episode_start, shape))
+        self._write_batch(self.values, value.clone().cpu().numpy().reshape(shape))
+        self._write_batch(self.log_probs, log_prob.clone().cpu().numpy().reshape(shape))
+        self.pos += batch_size
+        if self.pos == self.buffer_size:
+            self.full = True
+
+    def _extend_observations(self, obs: np.ndarray, batch_size: int) -> None:
+        self._write_batch(
+            self.observations,
+            np.reshape(obs, (batch_size, self.n_envs) + self.obs_shape),
+        )
+
     def get(
         self, batch_size: Optional[int] = None
     ) -> Generator[RolloutBufferSamples, None, None]:
         assert self.full, ""
-        indices = np.random.permutation(self.buffer_size * self.n_envs)
-        # Prepare the data
+        # Prepare the data, once per rollout
         if not self.generator_ready:
-
-            _tensor_names = [
-                "observations",
-                "actions",
-                "values",
-                "log_probs",
-                "advantages",
-                "returns",
-            ]
-
-            for tensor in _tensor_names:
-                self.__dict__[tensor] = self.swap_and_flatten(self.__dict__[tensor])
+            self._flatten_fields()
+            # Convert the whole rollout to tensors only once,
+            # the minibatches of every epoch are then gathered from them
+            self._rollout_samples = self._get_rollout_samples()
             self.generator_ready = True
 
+        indices = th.randperm(self.buffer_size * self.n_envs, device=self.device)
         # Return everything, don't create minibatches
         if batch_size is None:
             batch_size = self.buffer_size * self.n_envs
@@ -526,18 +1201,58 @@ class RolloutBuffer(BaseBuffer):
             yield self._get_samples(indices[start_idx : start_idx + batch_size])
             start_idx += batch_size
 
+    def _flatten_fields(self) -> None:
+        """
+        Swap and flatten the fields used for training (see ``swap_and_flatten()``).
+        """
+        _tensor_names = [
+            "observations",
+            "actions",
+            "values",
+            "log_probs",
+            "advantages",
+            "returns",
+        ]
+
+        for tensor in _tensor_names:
+            self.__dict__[tensor] = self._flatten(self.__dict__[tensor], tensor)
+
+    def _to_torch_float(self, array: np.ndarray) -> th.Tensor:
+        # Cast back from the storage dtypes, no extra copy when it is already float32
+        return self.to_torch(array.astype(np.float32, copy=False), copy=False)
+
+    def _get_rollout_samples(self) -> RolloutBufferSamples:
+        """
+        :return: The whole (flattened) rollout, as tensors
+        """
+        return RolloutBufferSamples(
+            observations=self._to_torch_float(self.observations),
+            actions=self._to_torch_float(self.actions),
+            old_values=self._to_torch_float(self.values.flatten()),
+            old_log_prob=self._to_torch_float(self.log_probs.flatten()),
+            advantages=self._to_torch_float(self.advantages.flatten()),
+            returns=self._to_torch_float(self.returns.flatten()),
+        )
+
     def _get_samples(
-        self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None
+        self,
+        batch_inds: Union[np.ndarray, th.Tensor],
+        env: Optional[VecNormalize] = None,
     ) -> RolloutBufferSamples:
-        data = (
-            self.observations[batch_inds],
-            self.actions[batch_inds],
-            self.values[batch_inds].flatten(),
-            self.log_probs[batch_inds].flatten(),
-            self.advantages[batch_inds].flatten(),
-            self.returns[batch_inds].flatten(),
-        )
-        return RolloutBufferSamples(*tuple(map(self.to_torch, data)))
+        batch_inds = th.as_tensor(batch_inds, device=self.device)
+
+        def select(tensor: th.Tensor) -> th.Tensor:
+            return tensor.index_select(0, batch_inds)
+
+        samples = self._rollout_samples
+        if isinstance(samples.observations, dict):
+            observations = {
+                key: select(obs) for (key, obs) in samples.observations.items()
+            }
+        else:
+            observations = select(samples.observations)
+        # Same type (``RolloutBufferSamples`` or ``DictRolloutBufferSamples``) as the rollout
+        return type(samples)(observations, *[select(tensor) for tensor in samples[1:]])
 
 
 class DictReplayBuffer(ReplayBuffer):
@@ -555,6 +1270,12 @@ class DictReplayBuffer(ReplayBuffer):
     :param handle_timeout_termination: Handle timeout termination (due to timelimit)
         separately and treat the task as infinite horizon task.
         https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param storage_path: If not ``None``, store the buffer in memory-mapped files
+        inside that directory (see ``ReplayBuffer``)
+    :param prefetch_batches: Number of batches assembled in advance
+        by a background thread (see ``ReplayBuffer``)
+    :param dtypes: Storage dtype of the fields (see ``ReplayBuffer``),
+        the dtype of ``observations`` can be a dict of dtypes by key
     """
 
     def __init__(
@@ -566,15 +1287,28 @@ class DictReplayBuffer(ReplayBuffer):
         n_envs: int = 1,
         optimize_memory_usage: bool = False,
         handle_timeout_termination: bool = True,
+        storage_path: Optional[str] = None,
+        prefetch_batches: int = 0,
+        dtypes: Optional[Dict[str, Any]] = None,
     ):
         super(ReplayBuffer, self).__init__(
-            buffer_size, observation_space, action_space, device, n_envs=n_envs
+            buffer_size,
+            observation_space,
+            action_space,
+            device,
+            n_envs=n_envs,
+            dtypes=dtypes,
         )
 
         assert isinstance(
             self.obs_shape, dict
         ), "DictReplayBuffer must be used with Dict obs space only"
         self.buffer_size = max(buffer_size // n_envs, 1)
+        self.storage_path = storage_path
+        self._storage_reused = True
+        self.prefetch_batches = prefetch_batches
+        self._prefetcher = None
+        self._rows_written = 0
 
         # Check that the replay buffer can fit into the memory
         if psutil is not None:
@@ -588,32 +1322,34 @@ class DictReplayBuffer(ReplayBuffer):
         self.optimize_memory_usage = optimize_memory_usage
 
         self.observations = {
-            key: np.zeros(
+            key: self._allocate(
+                f"observations_{key}",
                 (self.buffer_size, self.n_envs) + _obs_shape,
-                dtype=observation_space[key].dtype,
+                dtype=self._storage_dtype(
+                    "observations", observation_space[key].dtype, key
+                ),
             )
             for key, _obs_shape in self.obs_shape.items()
         }
         self.next_observations = {
-            key: np.zeros(
+            key: self._allocate(
+                f"next_observations_{key}",
                 (self.buffer_size, self.n_envs) + _obs_shape,
-                dtype=observation_space[key].dtype,
+                dtype=self._storage_dtype(
+                    "observations", observation_space[key].dtype, key
+                ),
             )
             for key, _obs_shape in self.obs_shape.items()
         }
 
-        self.actions = np.zeros(
-            (self.buffer_size, self.n_envs, self.action_dim), dtype=action_space.dtype
-        )
-        self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
-        self.dones = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self._allocate_transition_fields()
 
         # Handle timeouts termination properly if needed
         # see https://github.com/DLR-RM/stable-baselines3/issues/284
         self.handle_timeout_termination = handle_timeout_termination
-        self.timeouts = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self._load_storage_state()
 
-        if psutil is not None:
+        if psutil is not None and storage_path is None:
             obs_nbytes = 0
             for _, obs in self.observations.items():
                 obs_nbytes += obs.nbytes
@@ -639,6 +1375,7 @@ class DictReplayBuffer(ReplayBuffer):
                     f"replay buffer {total_memory_usage:.2f}GB > {mem_available:.2f}GB"
                 )
 
+    @_writes_transitions()
     def add(
         self,
         obs: Dict[str, np.ndarray],
@@ -672,16 +1409,61 @@ class DictReplayBuffer(ReplayBuffer):
         self.dones[self.pos] = np.array(done).copy()
 
         if self.handle_timeout_termination:
-            self.timeouts[self.pos] = np.array(
-                [info.get("TimeLimit.truncated", False) for info in infos]
-            )
+            self.timeouts[self.pos] = get_timeouts(infos)
 
         self.pos += 1
         if self.pos == self.buffer_size:
             self.full = True
             self.pos = 0
 
-    def sample(
+    @_writes_transitions(batched=True)
+    def extend(
+        self,
+        obs: Dict[str, np.ndarray],
+        next_obs: Dict[str, np.ndarray],
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: Optional[List[List[Dict[str, Any]]]] = None,
+    ) -> None:
+        """
+        Add a batch of consecutive steps to the buffer at once,
+        see ``ReplayBuffer.extend()``.
+
+        :param obs: Observations, each value of shape ``(batch_size, n_envs, ...)``
+        :param next_obs: Next observations
+        :param action: Actions
+        :param reward: Rewards
+        :param done: Termination signals
+        :param infos: For each step, the list of infos of each env.
+            If ``None``, no timeout is recorded.
+        """
+        batch_size = len(reward)
+        for key in self.observations.keys():
+            shape = (batch_size, self.n_envs) + self.obs_shape[key]
+            self._write_batch(self.observations[key], np.reshape(obs[key], shape))
+            self._write_batch(
+                self.next_observations[key], np.reshape(next_obs[key], shape)
+            )
+
+        self._write_batch(
+            self.actions,
+            np.reshape(action, (batch_size, self.n_envs, self.action_dim)),
+        )
+        self._write_batch(self.rewards, np.reshape(reward, (batch_size, self.n_envs)))
+        self._write_batch(self.dones, np.reshape(done, (batch_size, self.n_envs)))
+
+        if self.handle_timeout_termination:
+            if infos is None:
+                timeouts = np.zeros((batch_size, self.n_envs))
+            else:
+                timeouts = np.array([get_timeouts(infos_) for infos_ in infos])
+            self._write_batch(self.timeouts, timeouts)
+
+        self.full = self.full or self.pos + batch_size >= self.buffer_size
+        self.pos = (self.pos + batch_size) % self.buffer_size
+
+    def _sample_batch(
         self, batch_size: int, env: Optional[VecNormalize] = None
     ) -> DictReplayBufferSamples:
         """
@@ -695,23 +1477,33 @@ class DictReplayBuffer(ReplayBuffer):
         return super(ReplayBuffer, self).sample(batch_size=batch_size, env=env)
 
     def _get_samples(
-        self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None
+        self,
+        batch_inds: np.ndarray,
+        env: Optional[VecNormalize] = None,
+        env_indices: Optional[np.ndarray] = None,
     ) -> DictReplayBufferSamples:
         # Sample randomly the env idx
-        env_indices = np.random.randint(0, high=self.n_envs, size=(len(batch_inds),))
+        if env_indices is None:
+            env_indices = np.random.randint(
+                0, high=self.n_envs, size=(len(batch_inds),)
+            )
 
         # Normalize if needed and remove extra dimension (we are using only one env for now)
         obs_ = self._normalize_obs(
-            {
-                key: obs[batch_inds, env_indices, :]
-                for key, obs in self.observations.items()
-            }
+            self._restore_obs_dtype(
+                {
+                    key: obs[batch_inds, env_indices, :]
+                    for key, obs in self.observations.items()
+                }
+            )
         )
         next_obs_ = self._normalize_obs(
-            {
-                key: obs[batch_inds, env_indices, :]
-                for key, obs in self.next_observations.items()
-            }
+            self._restore_obs_dtype(
+                {
+                    key: obs[batch_inds, env_indices, :]
+                    for key, obs in self.next_observations.items()
+                }
+            )
         )
 
         # Convert to torch tensor
@@ -720,14 +1512,13 @@ class DictReplayBuffer(ReplayBuffer):
 
         return DictReplayBufferSamples(
             observations=observations,
-            actions=self.to_torch(self.actions[batch_inds, env_indices]),
+            actions=self.to_torch(
+                self.actions[batch_inds, env_indices].astype(
+                    self.action_space.dtype, copy=False
+                )
+            ),
             next_observations=next_observations,
-            # Only use dones that are not due to timeouts
-            # deactivated by default (timeouts is initialized as an array of False)
-            dones=self.to_torch(
-                self.dones[batch_inds, env_indices]
-                * (1 - self.timeouts[batch_inds, env_indices])
-            ).reshape(-1, 1),
+            dones=self.to_torch(self._sampled_dones(batch_inds, env_indices)),
             rewards=self.to_torch(
                 self._normalize_reward(
                     self.rewards[batch_inds, env_indices].reshape(-1, 1), env
@@ -759,6 +1550,9 @@ class DictRolloutBuffer(RolloutBuffer):
         Equivalent to Monte-Carlo advantage estimate when set to 1.
     :param gamma: Discount factor
     :param n_envs: Number of parallel environments
+    :param dtypes: Storage dtype of the fields (see ``RolloutBuffer``),
+        the dtype of ``observations`` can be a dict of dtypes by key
+    :param persistent_storage: Reuse the storage between rollouts (see ``RolloutBuffer``)
     """
 
     def __init__(
@@ -770,10 +1564,17 @@ class DictRolloutBuffer(RolloutBuffer):
         gae_lambda: float = 1,
         gamma: float = 0.99,
         n_envs: int = 1,
+        dtypes: Optional[Dict[str, Any]] = None,
+        persistent_storage: bool = False,
     ):
 
         super(RolloutBuffer, self).__init__(
-            buffer_size, observation_space, action_space, device, n_envs=n_envs
+            buffer_size,
+            observation_space,
+            action_space,
+            device,
+            n_envs=n_envs,
+            dtypes=dtypes,
         )
 
         assert isinstance(
@@ -795,29 +1596,32 @@ class DictRolloutBuffer(RolloutBuffer):
             None,
         )
         self.generator_ready = False
+        self.persistent_storage = persistent_storage
+        # Arrays allocated by the first reset and flattened copies, in persistent storage mode
+        self._storage, self._flat_storage = None, {}
         self.reset()
 
     def reset(self) -> None:
         assert isinstance(
             self.obs_shape, dict
         ), "DictRolloutBuffer must be used with Dict obs space only"
-        self.observations = {}
-        for key, obs_input_shape in self.obs_shape.items():
-            self.observations[key] = np.zeros(
-                (self.buffer_size, self.n_envs) + obs_input_shape, dtype=np.float32
+        if self._storage is not None:
+            self._reuse_storage()
+        else:
+            self.observations = {}
+            for key, obs_input_shape in self.obs_shape.items():
+                self.observations[key] = np.zeros(
+                    (self.buffer_size, self.n_envs) + obs_input_shape,
+                    dtype=self._storage_dtype("observations", np.float32, key),
+                )
+            self.actions = np.zeros(
+                (self.buffer_size, self.n_envs, self.action_dim),
+                dtype=self._storage_dtype("actions", np.float32),
             )
-        self.actions = np.zeros(
-            (self.buffer_size, self.n_envs, self.action_dim), dtype=np.float32
-        )
-        self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
-        self.returns = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
-        self.episode_starts = np.zeros(
-            (self.buffer_size, self.n_envs), dtype=np.float32
-        )
-        self.values = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
-        self.log_probs = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
-        self.advantages = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+            self._reset_scalar_fields()
+            self._keep_storage()
         self.generator_ready = False
+        self._rollout_samples = None
         super(RolloutBuffer, self).reset()
 
     def add(
@@ -860,44 +1664,1355 @@ class DictRolloutBuffer(RolloutBuffer):
         if self.pos == self.buffer_size:
             self.full = True
 
-    def get(
-        self, batch_size: Optional[int] = None
-    ) -> Generator[DictRolloutBufferSamples, None, None]:
-        assert self.full, ""
-        indices = np.random.permutation(self.buffer_size * self.n_envs)
-        # Prepare the data
-        if not self.generator_ready:
-
-            for key, obs in self.observations.items():
-                self.observations[key] = self.swap_and_flatten(obs)
+    def _extend_observations(self, obs: Dict[str, np.ndarray], batch_size: int) -> None:
+        for key in self.observations.keys():
+            self._write_batch(
+                self.observations[key],
+                np.reshape(obs[key], (batch_size, self.n_envs) + self.obs_shape[key]),
+            )
 
-            _tensor_names = ["actions", "values", "log_probs", "advantages", "returns"]
+    def _flatten_fields(self) -> None:
+        for key, obs in self.observations.items():
+            self.observations[key] = self._flatten(obs, ("observations", key))
 
-            for tensor in _tensor_names:
-                self.__dict__[tensor] = self.swap_and_flatten(self.__dict__[tensor])
-            self.generator_ready = True
+        _tensor_names = ["actions", "values", "log_probs", "advantages", "returns"]
 
-        # Return everything, don't create minibatches
-        if batch_size is None:
-            batch_size = self.buffer_size * self.n_envs
-
-        start_idx = 0
-        while start_idx < self.buffer_size * self.n_envs:
-            yield self._get_samples(indices[start_idx : start_idx + batch_size])
-            start_idx += batch_size
-
-    def _get_samples(
-        self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None
-    ) -> DictRolloutBufferSamples:
+        for tensor in _tensor_names:
+            self.__dict__[tensor] = self._flatten(self.__dict__[tensor], tensor)
 
+    def _get_rollout_samples(self) -> DictRolloutBufferSamples:
         return DictRolloutBufferSamples(
             observations={
-                key: self.to_torch(obs[batch_inds])
+                key: self._to_torch_float(obs)
                 for (key, obs) in self.observations.items()
             },
-            actions=self.to_torch(self.actions[batch_inds]),
-            old_values=self.to_torch(self.values[batch_inds].flatten()),
-            old_log_prob=self.to_torch(self.log_probs[batch_inds].flatten()),
-            advantages=self.to_torch(self.advantages[batch_inds].flatten()),
-            returns=self.to_torch(self.returns[batch_inds].flatten()),
+            actions=self._to_torch_float(self.actions),
+            old_values=self._to_torch_float(self.values.flatten()),
+            old_log_prob=self._to_torch_float(self.log_probs.flatten()),
+            advantages=self._to_torch_float(self.advantages.flatten()),
+            returns=self._to_torch_float(self.returns.flatten()),
+        )
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Prioritized Experience Replay (proportional variant) used in off-policy algorithms
+    like DQN/SAC/TD3.
+
+    Paper: https://arxiv.org/abs/1511.05952
+
+    Transitions are sampled with probability ``p_i^alpha / sum_k p_k^alpha``
+    where ``p_i`` is the absolute TD error of the transition (plus a small constant).
+    The priorities are stored in a sum-tree (and a min-tree for the normalization
+    of the importance sampling weights), so sampling a batch
+    and updating its priorities costs ``O(batch_size * log(buffer_size))``,
+    with all operations vectorized over the batch.
+    Each transition collected by each env is a separate leaf of the trees.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments
+    :param optimize_memory_usage: Not supported by prioritized replay
+    :param handle_timeout_termination: Handle timeout termination (due to timelimit)
+        separately and treat the task as infinite horizon task.
+        https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param storage_path: If not ``None``, store the buffer in memory-mapped files
+        inside that directory (see ``ReplayBuffer``)
+    :param alpha: How much prioritization is used (0: uniform sampling, 1: full prioritization)
+    :param beta: Amount of importance sampling correction (0: no correction, 1: full correction)
+    :param epsilon: Small constant added to the TD errors to avoid zero priorities
+    :param dtypes: Storage dtype of the fields (see ``ReplayBuffer``)
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        device: Union[th.device, str] = "cpu",
+        n_envs: int = 1,
+        optimize_memory_usage: bool = False,
+        handle_timeout_termination: bool = True,
+        storage_path: Optional[str] = None,
+        alpha: float = 0.6,
+        beta: float = 0.4,
+        epsilon: float = 1e-6,
+        dtypes: Optional[Dict[str, Any]] = None,
+    ):
+        assert (
+            optimize_memory_usage is False
+        ), "Prioritized replay buffers do not support optimize_memory_usage"
+        super(PrioritizedReplayBuffer, self).__init__(
+            buffer_size,
+            observation_space,
+            action_space,
+            device,
+            n_envs=n_envs,
+            optimize_memory_usage=optimize_memory_usage,
+            handle_timeout_termination=handle_timeout_termination,
+            storage_path=storage_path,
+            dtypes=dtypes,
+        )
+        assert alpha >= 0, "`alpha` must be non-negative"
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+
+        # One leaf per transition: leaf index = pos * n_envs + env_idx
+        self.sum_tree = SumSegmentTree(self.buffer_size * self.n_envs)
+        self.min_tree = MinSegmentTree(self.buffer_size * self.n_envs)
+        # Transitions restored from memory-mapped storage start with the same priority
+        if self.size() > 0:
+            leaves = np.arange(self.size() * self.n_envs)
+            self.sum_tree[leaves] = self.max_priority**self.alpha
+            self.min_tree[leaves] = self.max_priority**self.alpha
+
+    def add(self, *args, **kwargs) -> None:
+        pos = self.pos
+        super(PrioritizedReplayBuffer, self).add(*args, **kwargs)
+        # New transitions get the maximum priority so they are sampled at least once
+        leaves = pos * self.n_envs + np.arange(self.n_envs)
+        self.sum_tree[leaves] = self.max_priority**self.alpha
+        self.min_tree[leaves] = self.max_priority**self.alpha
+
+    def extend(
+        self,
+        obs: Union[np.ndarray, Dict[str, np.ndarray]],
+        next_obs: Union[np.ndarray, Dict[str, np.ndarray]],
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: Optional[List[List[Dict[str, Any]]]] = None,
+    ) -> None:
+        pos = self.pos
+        super(PrioritizedReplayBuffer, self).extend(
+            obs, next_obs, action, reward, done, infos
+        )
+        # Only the last `buffer_size` steps were kept
+        n_written = min(len(reward), self.buffer_size)
+        positions = (
+            pos + len(reward) - n_written + np.arange(n_written)
+        ) % self.buffer_size
+        leaves = (positions[:, None] * self.n_envs + np.arange(self.n_envs)).reshape(-1)
+        self.sum_tree[leaves] = self.max_priority**self.alpha
+        self.min_tree[leaves] = self.max_priority**self.alpha
+
+    def sample(
+        self, batch_size: int, env: Optional[VecNormalize] = None
+    ) -> Union[PrioritizedReplayBufferSamples, DictPrioritizedReplayBufferSamples]:
+        """
+        Sample elements from the replay buffer proportionally to their priorities.
+        The batch is stratified: the total priority mass is split into ``batch_size``
+        segments of equal mass and one transition is drawn from each segment.
+
+        :param batch_size: Number of element to sample
+        :param env: associated gym VecEnv
+            to normalize the observations/rewards when sampling
+        :return: the samples, together with the importance sampling weights
+            and the indices to pass to ``update_priorities()``
+        """
+        n_leaves = self.size() * self.n_envs
+        total = self.sum_tree.sum()
+        segment = total / batch_size
+        prefixsums = (np.arange(batch_size) + np.random.rand(batch_size)) * segment
+        indices = self.sum_tree.find_prefixsum_idx(prefixsums)
+        indices = np.minimum(indices, n_leaves - 1)
+
+        # Importance sampling weights, normalized by the maximum weight
+        probs = self.sum_tree[indices] / total
+        min_prob = self.min_tree.min() / total
+        weights = (probs / min_prob) ** (-self.beta)
+
+        samples = self._get_samples(
+            indices // self.n_envs, env=env, env_indices=indices % self.n_envs
+        )
+        if isinstance(samples, DictReplayBufferSamples):
+            samples_class = DictPrioritizedReplayBufferSamples
+        else:
+            samples_class = PrioritizedReplayBufferSamples
+        return samples_class(
+            *samples,
+            weights=self.to_torch(weights.astype(np.float32).reshape(-1, 1)),
+            indices=indices,
+        )
+
+    def update_priorities(
+        self, indices: np.ndarray, td_errors: Union[np.ndarray, th.Tensor]
+    ) -> None:
+        """
+        Update the priorities of sampled transitions.
+
+        :param indices: Indices of the transitions, as returned by ``sample()``
+        :param td_errors: TD errors of those transitions
+        """
+        if isinstance(td_errors, th.Tensor):
+            td_errors = td_errors.detach().cpu().numpy()
+        priorities = np.abs(td_errors).reshape(-1) + self.epsilon
+        self.sum_tree[indices] = priorities**self.alpha
+        self.min_tree[indices] = priorities**self.alpha
+        self.max_priority = max(self.max_priority, priorities.max())
+
+
+class DictPrioritizedReplayBuffer(PrioritizedReplayBuffer, DictReplayBuffer):
+    """
+    Prioritized Experience Replay for dictionary observations,
+    see ``PrioritizedReplayBuffer`` and ``DictReplayBuffer``.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments
+    :param optimize_memory_usage: Not supported by prioritized replay
+    :param handle_timeout_termination: Handle timeout termination (due to timelimit)
+        separately and treat the task as infinite horizon task.
+        https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param storage_path: If not ``None``, store the buffer in memory-mapped files
+        inside that directory (see ``ReplayBuffer``)
+    :param alpha: How much prioritization is used (0: uniform sampling, 1: full prioritization)
+    :param beta: Amount of importance sampling correction (0: no correction, 1: full correction)
+    :param epsilon: Small constant added to the TD errors to avoid zero priorities
+    :param dtypes: Storage dtype of the fields (see ``ReplayBuffer``)
+    """
+
+
+class NStepReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer that returns n-step transitions, for n-step TD targets
+    ``sum_{k<m} gamma^k r_{t+k} + gamma^m Q(s_{t+m})`` with ``m <= n_steps``.
+    The transitions are stored as in the ``ReplayBuffer``, the n-step returns,
+    the discount of the bootstrapped value (``gamma^m``) and the n-step next observation
+    are computed at sampling time, vectorized over the batch.
+    The look-ahead stops at the end of the episode (done or timeout)
+    and at the newest transition of the env.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments
+    :param optimize_memory_usage: Store only once each observation
+        (see ``ReplayBuffer``)
+    :param handle_timeout_termination: Handle timeout termination (due to timelimit)
+        separately and treat the task as infinite horizon task.
+        https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param storage_path: If not ``None``, store the buffer in memory-mapped files
+        inside that directory (see ``ReplayBuffer``)
+    :param prefetch_batches: Number of batches assembled in advance
+        by a background thread (see ``ReplayBuffer``)
+    :param n_steps: Maximum number of steps of the returns
+    :param gamma: Discount factor, set to the one of the algorithm when not given
+    :param dtypes: Storage dtype of the fields (see ``ReplayBuffer``)
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        device: Union[th.device, str] = "cpu",
+        n_envs: int = 1,
+        optimize_memory_usage: bool = False,
+        handle_timeout_termination: bool = True,
+        storage_path: Optional[str] = None,
+        prefetch_batches: int = 0,
+        n_steps: int = 3,
+        gamma: float = 0.99,
+        dtypes: Optional[Dict[str, Any]] = None,
+    ):
+        super(NStepReplayBuffer, self).__init__(
+            buffer_size,
+            observation_space,
+            action_space,
+            device,
+            n_envs=n_envs,
+            optimize_memory_usage=optimize_memory_usage,
+            handle_timeout_termination=handle_timeout_termination,
+            storage_path=storage_path,
+            prefetch_batches=prefetch_batches,
+            dtypes=dtypes,
+        )
+        assert n_steps >= 1, "`n_steps` must be at least 1"
+        self.n_steps = n_steps
+        self.gamma = gamma
+
+    def _gather_observations(
+        self,
+        observations: Union[np.ndarray, Dict[str, np.ndarray]],
+        batch_inds: np.ndarray,
+        env_indices: np.ndarray,
+        env: Optional[VecNormalize] = None,
+    ) -> Union[np.ndarray, Dict[str, np.ndarray]]:
+        if isinstance(observations, dict):
+            obs = {
+                key: obs[batch_inds, env_indices] for key, obs in observations.items()
+            }
+        else:
+            obs = observations[batch_inds, env_indices]
+        return self._normalize_obs(self._restore_obs_dtype(obs), env)
+
+    def _get_samples(
+        self,
+        batch_inds: np.ndarray,
+        env: Optional[VecNormalize] = None,
+        env_indices: Optional[np.ndarray] = None,
+    ) -> Union[NStepReplayBufferSamples, DictNStepReplayBufferSamples]:
+        # Sample randomly the env idx
+        if env_indices is None:
+            env_indices = np.random.randint(
+                0, high=self.n_envs, size=(len(batch_inds),)
+            )
+
+        # Position of the next `n_steps` transitions of the same env, shape (batch_size, n_steps)
+        offsets = np.arange(self.n_steps)
+        step_inds = (batch_inds[:, None] + offsets) % self.buffer_size
+        step_env_indices = env_indices[:, None]
+        # Number of transitions from the sampled one to the newest one
+        n_available = (self.pos - batch_inds - 1) % self.buffer_size + 1
+        episode_ends = np.maximum(
+            self.dones[step_inds, step_env_indices].astype(np.float32),
+            self.timeouts[step_inds, step_env_indices].astype(np.float32),
+        )
+        # A step is used if it was collected and no episode ended before it
+        ended_before = (np.cumsum(episode_ends, axis=1) - episode_ends) > 0
+        mask = (offsets < n_available[:, None]) & ~ended_before
+        n_used = mask.sum(axis=1)
+
+        rewards = self._normalize_reward(self.rewards[step_inds, step_env_indices], env)
+        returns = (rewards * mask * self.gamma**offsets).sum(axis=1)
+        last_inds = step_inds[np.arange(len(batch_inds)), n_used - 1]
+
+        if self.optimize_memory_usage:
+            next_obs = self._gather_observations(
+                self.observations, (last_inds + 1) % self.buffer_size, env_indices, env
+            )
+        else:
+            next_obs = self._gather_observations(
+                self.next_observations, last_inds, env_indices, env
+            )
+
+        data = (
+            self._gather_observations(self.observations, batch_inds, env_indices, env),
+            self.actions[batch_inds, env_indices, :].astype(
+                self.action_space.dtype, copy=False
+            ),
+            next_obs,
+            self._sampled_dones(last_inds, env_indices),
+            returns.astype(np.float32).reshape(-1, 1),
+            (self.gamma**n_used).astype(np.float32).reshape(-1, 1),
+        )
+        if isinstance(self.observations, dict):
+            return DictNStepReplayBufferSamples(
+                {key: self.to_torch(obs) for key, obs in data[0].items()},
+                self.to_torch(data[1]),
+                {key: self.to_torch(obs) for key, obs in data[2].items()},
+                *tuple(map(self.to_torch, data[3:])),
+            )
+        return NStepReplayBufferSamples(*tuple(map(self.to_torch, data)))
+
+
+class DictNStepReplayBuffer(NStepReplayBuffer, DictReplayBuffer):
+    """
+    N-step replay buffer for dictionary observations,
+    see ``NStepReplayBuffer`` and ``DictReplayBuffer``.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments
+    :param optimize_memory_usage: Not supported by the ``DictReplayBuffer``
+    :param handle_timeout_termination: Handle timeout termination (due to timelimit)
+        separately and treat the task as infinite horizon task.
+        https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param storage_path: If not ``None``, store the buffer in memory-mapped files
+        inside that directory (see ``ReplayBuffer``)
+    :param prefetch_batches: Number of batches assembled in advance
+        by a background thread (see ``ReplayBuffer``)
+    :param n_steps: Maximum number of steps of the returns
+    :param gamma: Discount factor, set to the one of the algorithm when not given
+    :param dtypes: Storage dtype of the fields (see ``ReplayBuffer``)
+    """
+
+
+class CompressedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer that stores each observation as a compressed block of bytes,
+    useful for image observations (e.g. Atari frames) that compress well.
+    The other fields are stored as in the ``ReplayBuffer``.
+    Sampled observations are decompressed in batch, optionally on a thread pool
+    (the codecs release the GIL while decompressing).
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space, must be a ``Box``
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments
+    :param optimize_memory_usage: Store only once each observation
+        (see ``ReplayBuffer``)
+    :param handle_timeout_termination: Handle timeout termination (due to timelimit)
+        separately and treat the task as infinite horizon task.
+        https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param compression: Codec used to compress the observations, one of
+        ``"lz4"`` (requires the ``lz4`` package), ``"zlib"`` or ``"lzma"``.
+        By default, ``"lz4"`` is used when available, otherwise ``"zlib"``.
+    :param compression_level: Compression level passed to the codec,
+        ``None`` uses the default level of the codec
+    :param n_decompression_threads: Number of threads used to decompress
+        the sampled observations, ``0`` decompresses in the calling thread
+    :param prefetch_batches: Number of batches assembled (and decompressed) in advance
+        by a background thread (see ``ReplayBuffer``)
+    :param dtypes: Storage dtype of the fields (see ``ReplayBuffer``),
+        the observations are converted to the dtype of ``observations`` before compression
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        device: Union[th.device, str] = "cpu",
+        n_envs: int = 1,
+        optimize_memory_usage: bool = False,
+        handle_timeout_termination: bool = True,
+        compression: Optional[str] = None,
+        compression_level: Optional[int] = None,
+        n_decompression_threads: int = 0,
+        prefetch_batches: int = 0,
+        dtypes: Optional[Dict[str, Any]] = None,
+    ):
+        assert isinstance(
+            observation_space, spaces.Box
+        ), "CompressedReplayBuffer must be used with Box obs space only"
+        if compression is None:
+            compression = "zlib" if lz4_frame is None else "lz4"
+        assert compression in {
+            "lz4",
+            "zlib",
+            "lzma",
+        }, f"Unknown compression codec {compression}"
+        if compression == "lz4":
+            assert (
+                lz4_frame is not None
+            ), "You must install `lz4` to use lz4 compression"
+        self.compression = compression
+        self.compression_level = compression_level
+        self.n_decompression_threads = n_decompression_threads
+        self._executor = None
+
+        super(CompressedReplayBuffer, self).__init__(
+            buffer_size,
+            observation_space,
+            action_space,
+            device,
+            n_envs=n_envs,
+            optimize_memory_usage=optimize_memory_usage,
+            handle_timeout_termination=handle_timeout_termination,
+            prefetch_batches=prefetch_batches,
+            dtypes=dtypes,
+        )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = super(CompressedReplayBuffer, self).__getstate__()
+        # Thread pools cannot be pickled, it is re-created lazily
+        state["_executor"] = None
+        return state
+
+    def _allocate(self, name: str, shape: Tuple[int, ...], dtype: Any) -> np.ndarray:
+        if name in {"observations", "next_observations"}:
+            # One compressed block per observation
+            return np.full(shape[:2], b"", dtype=object)
+        return super(CompressedReplayBuffer, self)._allocate(name, shape, dtype)
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "lz4":
+            if self.compression_level is None:
+                return lz4_frame.compress(data)
+            return lz4_frame.compress(data, compression_level=self.compression_level)
+        if self.compression == "lzma":
+            return lzma.compress(data, preset=self.compression_level)
+        if self.compression_level is None:
+            return zlib.compress(data)
+        return zlib.compress(data, self.compression_level)
+
+    def _decompress_function(self) -> Callable[[bytes], bytes]:
+        return {
+            "lz4": getattr(lz4_frame, "decompress", None),
+            "zlib": zlib.decompress,
+            "lzma": lzma.decompress,
+        }[self.compression]
+
+    def compress_observations(self, obs: np.ndarray) -> np.ndarray:
+        """
+        Compress each observation independently.
+
+        :param obs: Observations of shape ``(..., *obs_shape)``
+        :return: Object array of shape ``(...)`` containing the compressed blocks
+        """
+        obs = np.asarray(
+            obs,
+            dtype=self._storage_dtype("observations", self.observation_space.dtype),
+        )
+        batch_shape = obs.shape[: obs.ndim - len(self.obs_shape)]
+        flat_obs = obs.reshape((-1,) + self.obs_shape)
+        blocks = np.empty(len(flat_obs), dtype=object)
+        blocks[:] = [self._compress(obs_.tobytes()) for obs_ in flat_obs]
+        return blocks.reshape(batch_shape)
+
+    def decompress_observations(self, blocks: np.ndarray) -> np.ndarray:
+        """
+        Decompress a batch of observations.
+
+        :param blocks: Object array of shape ``(batch_size,)`` of compressed blocks
+        :return: Observations of shape ``(batch_size, *obs_shape)``
+        """
+        decompress = self._decompress_function()
+        if self.n_decompression_threads > 0:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.n_decompression_threads)
+            raw = list(self._executor.map(decompress, blocks))
+        else:
+            raw = [decompress(block) for block in blocks]
+        dtype = self._storage_dtype("observations", self.observation_space.dtype)
+        return np.frombuffer(b"".join(raw), dtype=dtype).reshape(
+            (len(blocks),) + self.obs_shape
+        )
+
+    def add(
+        self,
+        obs: np.ndarray,
+        next_obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: List[Dict[str, Any]],
+    ) -> None:
+        obs = np.reshape(obs, (self.n_envs,) + self.obs_shape)
+        next_obs = np.reshape(next_obs, (self.n_envs,) + self.obs_shape)
+        super(CompressedReplayBuffer, self).add(
+            self.compress_observations(obs),
+            self.compress_observations(next_obs),
+            action,
+            reward,
+            done,
+            infos,
+        )
+
+    def extend(
+        self,
+        obs: np.ndarray,
+        next_obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: Optional[List[List[Dict[str, Any]]]] = None,
+    ) -> None:
+        shape = (len(reward), self.n_envs) + self.obs_shape
+        super(CompressedReplayBuffer, self).extend(
+            self.compress_observations(np.reshape(obs, shape)),
+            self.compress_observations(np.reshape(next_obs, shape)),
+            action,
+            reward,
+            done,
+            infos,
+        )
+
+    def _get_samples(
+        self,
+        batch_inds: np.ndarray,
+        env: Optional[VecNormalize] = None,
+        env_indices: Optional[np.ndarray] = None,
+    ) -> ReplayBufferSamples:
+        # Sample randomly the env idx
+        if env_indices is None:
+            env_indices = np.random.randint(
+                0, high=self.n_envs, size=(len(batch_inds),)
+            )
+
+        if self.optimize_memory_usage:
+            next_blocks = self.observations[
+                (batch_inds + 1) % self.buffer_size, env_indices
+            ]
+        else:
+            next_blocks = self.next_observations[batch_inds, env_indices]
+        # Decompress observations and next observations together
+        all_obs = self.decompress_observations(
+            np.concatenate((self.observations[batch_inds, env_indices], next_blocks))
+        )
+        all_obs = self._restore_obs_dtype(all_obs)
+        obs, next_obs = all_obs[: len(batch_inds)], all_obs[len(batch_inds) :]
+
+        data = (
+            self._normalize_obs(obs, env),
+            self.actions[batch_inds, env_indices, :].astype(
+                self.action_space.dtype, copy=False
+            ),
+            self._normalize_obs(next_obs, env),
+            self._sampled_dones(batch_inds, env_indices),
+            self._normalize_reward(
+                self.rewards[batch_inds, env_indices].reshape(-1, 1), env
+            ),
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
+
+
+class FrameStackReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer for observations stacked with ``VecFrameStack``.
+    Instead of storing every stacked observation (where each frame appears ``n_stack`` times,
+    and once more in the next observation), it stores only the newest frame of each observation
+    and the index of the step in the episode.
+    The stacked observations are rebuilt at sampling time,
+    with zero-padding at the start of the episodes (as done by ``StackedObservations``).
+    The newest frame of terminal observations is stored separately.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Stacked observation space (after ``VecFrameStack``), must be a ``Box``
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments
+    :param optimize_memory_usage: Ignored, observations and next observations
+        always share the same storage
+    :param handle_timeout_termination: Handle timeout termination (due to timelimit)
+        separately and treat the task as infinite horizon task.
+        https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param n_stack: Number of stacked frames (same as ``VecFrameStack``)
+    :param channels_order: If "first", frames are stacked on first image dimension.
+        If "last", on the last dimension.
+        If None, detect it automatically (same as ``VecFrameStack``)
+    :param dtypes: Storage dtype of the fields (see ``ReplayBuffer``)
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        device: Union[th.device, str] = "cpu",
+        n_envs: int = 1,
+        optimize_memory_usage: bool = False,
+        handle_timeout_termination: bool = True,
+        n_stack: int = 4,
+        channels_order: Optional[str] = None,
+        dtypes: Optional[Dict[str, Any]] = None,
+    ):
+        assert isinstance(
+            observation_space, spaces.Box
+        ), "FrameStackReplayBuffer must be used with Box obs space only"
+        self.n_stack = n_stack
+        (
+            self.channels_first,
+            self.stack_dimension,
+            _,
+            _,
+        ) = StackedObservations.compute_stacking(
+            n_envs, n_stack, observation_space, channels_order
+        )
+        stack_axis = 0 if self.channels_first else -1
+        stacked_size = observation_space.shape[stack_axis]
+        assert (
+            stacked_size % n_stack == 0
+        ), f"The stacked dimension ({stacked_size}) must be a multiple of n_stack ({n_stack})"
+        self.frame_size = stacked_size // n_stack
+        frame_shape = list(observation_space.shape)
+        frame_shape[stack_axis] = self.frame_size
+        self.frame_shape = tuple(frame_shape)
+
+        super(FrameStackReplayBuffer, self).__init__(
+            buffer_size,
+            observation_space,
+            action_space,
+            device,
+            n_envs=n_envs,
+            # `observations` contains the newest frame of the next observation too
+            optimize_memory_usage=True,
+            handle_timeout_termination=handle_timeout_termination,
+            dtypes=dtypes,
+        )
+        assert (
+            self.buffer_size > n_stack
+        ), "The buffer must be larger than the number of stacked frames"
+        # Index of each step in its episode (0 for the first observation)
+        self.episode_steps = self._allocate(
+            "episode_steps", (self.buffer_size, self.n_envs), dtype=np.int64
+        )
+        self._current_episode_steps = np.zeros(self.n_envs, dtype=np.int64)
+        # Newest frame of terminal observations, indexed by `pos * n_envs + env_idx`
+        self.terminal_frames = {}
+
+    def _allocate(self, name: str, shape: Tuple[int, ...], dtype: Any) -> np.ndarray:
+        if name == "observations":
+            # Store only one frame per step
+            shape = shape[:2] + self.frame_shape
+        return super(FrameStackReplayBuffer, self)._allocate(name, shape, dtype)
+
+    def _checkpoint_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = super(FrameStackReplayBuffer, self)._checkpoint_arrays()
+        arrays["episode_steps"] = self.episode_steps
+        return arrays
+
+    def _newest_frame(self, obs: np.ndarray) -> np.ndarray:
+        """
+        :param obs: Stacked observations of shape ``(n_envs, *obs_shape)``
+        :return: The newest frame of each observation
+        """
+        if self.channels_first:
+            return obs[:, -self.frame_size :]
+        return obs[..., -self.frame_size :]
+
+    def add(
+        self,
+        obs: np.ndarray,
+        next_obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: List[Dict[str, Any]],
+    ) -> None:
+        done = np.array(done).reshape(self.n_envs)
+        next_frames = self._newest_frame(np.asarray(next_obs))
+        for env_idx in range(self.n_envs):
+            key = self.pos * self.n_envs + env_idx
+            # Remove the terminal frame of the overwritten transition
+            self.terminal_frames.pop(key, None)
+            if done[env_idx]:
+                self.terminal_frames[key] = next_frames[env_idx].copy()
+        self.episode_steps[self.pos] = self._current_episode_steps
+        self._current_episode_steps += 1
+        self._current_episode_steps[done.astype(bool)] = 0
+
+        super(FrameStackReplayBuffer, self).add(
+            self._newest_frame(np.asarray(obs)),
+            next_frames,
+            action,
+            reward,
+            done,
+            infos,
+        )
+
+    def extend(
+        self,
+        obs: np.ndarray,
+        next_obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: Optional[List[List[Dict[str, Any]]]] = None,
+    ) -> None:
+        """
+        Add a batch of consecutive steps to the buffer at once (see ``ReplayBuffer.extend()``).
+        The index of each step in its episode is computed from a cumulative count
+        restarted after each done.
+
+        :param obs: Stacked observations, of shape ``(batch_size, n_envs, *obs_shape)``
+        :param next_obs: Stacked next observations
+        :param action: Actions
+        :param reward: Rewards
+        :param done: Termination signals
+        :param infos: For each step, the list of infos of each env.
+            If ``None``, no timeout is recorded.
+        """
+        batch_size = len(reward)
+        done = np.reshape(done, (batch_size, self.n_envs)).astype(bool)
+        frames = self._newest_frame(np.reshape(obs, (-1,) + self.obs_shape))
+        next_frames = self._newest_frame(np.reshape(next_obs, (-1,) + self.obs_shape))
+        frames = frames.reshape((batch_size, self.n_envs) + self.frame_shape)
+        next_frames = next_frames.reshape((batch_size, self.n_envs) + self.frame_shape)
+
+        # Index of the first step of the last episode started before each step
+        # (0 when the episode started before the batch)
+        step_inds = np.arange(batch_size + 1)[:, None]
+        episode_starts = np.maximum.accumulate(
+            np.concatenate(
+                [
+                    np.zeros((1, self.n_envs), dtype=np.int64),
+                    np.where(done, step_inds[1:], 0),
+                ]
+            ),
+            axis=0,
+        )
+        episode_steps = np.where(
+            episode_starts > 0,
+            step_inds - episode_starts,
+            self._current_episode_steps + step_inds,
+        )
+        self._write_batch(self.episode_steps, episode_steps[:-1])
+        self._current_episode_steps = episode_steps[-1]
+
+        # Remove the terminal frames of the overwritten transitions
+        overwritten = np.zeros(self.buffer_size, dtype=bool)
+        overwritten[
+            (self.pos + np.arange(min(batch_size, self.buffer_size))) % self.buffer_size
+        ] = True
+        self.terminal_frames = {
+            key: frame
+            for key, frame in self.terminal_frames.items()
+            if not overwritten[key // self.n_envs]
+        }
+        # Only the last `buffer_size` steps are kept
+        first_kept = max(batch_size - self.buffer_size, 0)
+        for step_idx, env_idx in zip(*np.nonzero(done[first_kept:])):
+            step_idx += first_kept
+            key = ((self.pos + step_idx) % self.buffer_size) * self.n_envs + env_idx
+            self.terminal_frames[key] = next_frames[step_idx, env_idx].copy()
+
+        super(FrameStackReplayBuffer, self).extend(
+            frames, next_frames, action, reward, done, infos
+        )
+
+    def sample(
+        self, batch_size: int, env: Optional[VecNormalize] = None
+    ) -> ReplayBufferSamples:
+        """
+        Sample elements from the replay buffer.
+        When the buffer is full, the oldest ``n_stack`` steps are not sampled:
+        their frames were (partially) overwritten.
+
+        :param batch_size: Number of element to sample
+        :param env: associated gym VecEnv
+            to normalize the observations/rewards when sampling
+        :return:
+        """
+        if self.full:
+            batch_inds = (
+                np.random.randint(self.n_stack, self.buffer_size, size=batch_size)
+                + self.pos
+            ) % self.buffer_size
+        else:
+            batch_inds = np.random.randint(0, self.pos, size=batch_size)
+        return self._get_samples(batch_inds, env=env)
+
+    def _stack_frames(
+        self, batch_inds: np.ndarray, env_indices: np.ndarray, steps: np.ndarray
+    ) -> np.ndarray:
+        """
+        Rebuild stacked observations from the stored frames.
+
+        :param batch_inds: Index of the newest frame of each observation
+        :param env_indices: Env index of each observation
+        :param steps: Index of the newest frame in its episode,
+            older frames that belong to the previous episode are replaced by zeros
+        :return: Stacked frames of shape ``(batch_size, n_stack, *frame_shape)``
+        """
+        # From the oldest to the newest frame
+        offsets = np.arange(self.n_stack - 1, -1, -1)
+        frame_inds = (batch_inds[:, None] - offsets[None, :]) % self.buffer_size
+        frames = self.observations[frame_inds, env_indices[:, None]]
+        valid = offsets[None, :] <= steps[:, None]
+        frames *= valid.reshape(valid.shape + (1,) * len(self.frame_shape)).astype(
+            frames.dtype
+        )
+        return frames
+
+    def _frames_to_obs(self, frames: np.ndarray) -> np.ndarray:
+        """
+        :param frames: Stacked frames of shape ``(batch_size, n_stack, *frame_shape)``
+        :return: Observations of shape ``(batch_size, *obs_shape)``
+        """
+        if not self.channels_first:
+            # Move the stack axis next to the channel axis
+            frames = np.moveaxis(frames, 1, -2)
+        return frames.reshape((len(frames),) + self.obs_shape)
+
+    def _get_samples(
+        self,
+        batch_inds: np.ndarray,
+        env: Optional[VecNormalize] = None,
+        env_indices: Optional[np.ndarray] = None,
+    ) -> ReplayBufferSamples:
+        # Sample randomly the env idx
+        if env_indices is None:
+            env_indices = np.random.randint(
+                0, high=self.n_envs, size=(len(batch_inds),)
+            )
+
+        steps = self.episode_steps[batch_inds, env_indices]
+        obs = self._stack_frames(batch_inds, env_indices, steps)
+        next_obs = self._stack_frames(
+            (batch_inds + 1) % self.buffer_size, env_indices, steps + 1
+        )
+        # The next frame of a terminal transition may have been overwritten
+        # by the first frame of the next episode
+        for idx in np.flatnonzero(self.dones[batch_inds, env_indices]):
+            key = batch_inds[idx] * self.n_envs + env_indices[idx]
+            if key in self.terminal_frames:
+                next_obs[idx, -1] = self.terminal_frames[key]
+
+        data = (
+            self._normalize_obs(self._restore_obs_dtype(self._frames_to_obs(obs)), env),
+            self.actions[batch_inds, env_indices, :].astype(
+                self.action_space.dtype, copy=False
+            ),
+            self._normalize_obs(
+                self._restore_obs_dtype(self._frames_to_obs(next_obs)), env
+            ),
+            self._sampled_dones(batch_inds, env_indices),
+            self._normalize_reward(
+                self.rewards[batch_inds, env_indices].reshape(-1, 1), env
+            ),
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
+
+
+class TensorReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer that stores the transitions as preallocated PyTorch tensors on ``device``.
+    Transitions are copied to the device once, when they are added,
+    sampling then gathers the batch with ``index_select``
+    instead of indexing NumPy arrays and converting each field to a tensor.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param device: PyTorch device where the buffer is stored
+    :param n_envs: Number of parallel environments
+    :param optimize_memory_usage: Store only once each observation
+        (see ``ReplayBuffer``)
+    :param handle_timeout_termination: Handle timeout termination (due to timelimit)
+        separately and treat the task as infinite horizon task.
+        https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param dtypes: Storage dtype of the fields (see ``ReplayBuffer``)
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        device: Union[th.device, str] = "cpu",
+        n_envs: int = 1,
+        optimize_memory_usage: bool = False,
+        handle_timeout_termination: bool = True,
+        dtypes: Optional[Dict[str, Any]] = None,
+    ):
+        assert not isinstance(
+            observation_space, spaces.Dict
+        ), "TensorReplayBuffer does not support Dict obs space"
+        super(TensorReplayBuffer, self).__init__(
+            buffer_size,
+            observation_space,
+            action_space,
+            get_device(device),
+            n_envs=n_envs,
+            optimize_memory_usage=optimize_memory_usage,
+            handle_timeout_termination=handle_timeout_termination,
+            dtypes=dtypes,
+        )
+
+    @staticmethod
+    def _torch_dtype(dtype: Any) -> th.dtype:
+        """
+        :param dtype: NumPy dtype
+        :return: The torch equivalent of the NumPy dtype
+        """
+        return th.from_numpy(np.zeros(0, dtype=dtype)).dtype
+
+    def _allocate(self, name: str, shape: Tuple[int, ...], dtype: Any) -> th.Tensor:
+        return th.zeros(shape, dtype=self._torch_dtype(dtype), device=self.device)
+
+    def _write_batch(self, array: th.Tensor, data: np.ndarray) -> None:
+        super(TensorReplayBuffer, self)._write_batch(array, th.as_tensor(data))
+
+    def _checkpoint_arrays(self) -> Dict[str, np.ndarray]:
+        # NumPy views of the tensors (copies when they are not on the CPU)
+        arrays = super(TensorReplayBuffer, self)._checkpoint_arrays()
+        return {name: tensor.cpu().numpy() for name, tensor in arrays.items()}
+
+    def _load_checkpoint_array(self, name: str, array: np.ndarray) -> None:
+        super(TensorReplayBuffer, self)._load_checkpoint_array(
+            name, th.tensor(array, device=self.device)
+        )
+
+    def add(
+        self,
+        obs: np.ndarray,
+        next_obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: List[Dict[str, Any]],
+    ) -> None:
+        # A single step is a batch of size one
+        self.extend(
+            np.expand_dims(obs, 0),
+            np.expand_dims(next_obs, 0),
+            np.expand_dims(action, 0),
+            np.expand_dims(reward, 0),
+            np.expand_dims(done, 0),
+            [infos],
+        )
+
+    def extend(
+        self,
+        obs: np.ndarray,
+        next_obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: Optional[List[List[Dict[str, Any]]]] = None,
+    ) -> None:
+        # The last next observation may be written outside of `_write_batch()`
+        # (when optimizing memory usage), so it must already be a tensor
+        super(TensorReplayBuffer, self).extend(
+            obs, th.as_tensor(np.asarray(next_obs)), action, reward, done, infos
+        )
+
+    def _normalize_tensor(
+        self, tensor: th.Tensor, normalize: Callable, env: Optional[VecNormalize]
+    ) -> th.Tensor:
+        """
+        ``VecNormalize`` works on NumPy arrays:
+        when an env is passed, the batch goes through the host once.
+        """
+        if env is None:
+            return tensor
+        return th.as_tensor(normalize(tensor.cpu().numpy(), env), device=self.device)
+
+    def _get_samples(
+        self,
+        batch_inds: np.ndarray,
+        env: Optional[VecNormalize] = None,
+        env_indices: Optional[np.ndarray] = None,
+    ) -> ReplayBufferSamples:
+        # Sample randomly the env idx
+        if env_indices is None:
+            env_indices = np.random.randint(
+                0, high=self.n_envs, size=(len(batch_inds),)
+            )
+
+        # Index in the storage flattened along the (buffer_size, n_envs) axes
+        flat_inds = th.as_tensor(batch_inds * self.n_envs + env_indices).to(self.device)
+        if self.optimize_memory_usage:
+            next_obs_storage = self.observations
+            next_inds = (flat_inds + self.n_envs) % (self.buffer_size * self.n_envs)
+        else:
+            next_obs_storage = self.next_observations
+            next_inds = flat_inds
+
+        def gather(array: th.Tensor, indices: th.Tensor) -> th.Tensor:
+            return array.flatten(0, 1).index_select(0, indices)
+
+        # Cast back from the storage dtypes
+        obs_dtype = self._torch_dtype(self.observation_space.dtype)
+        return ReplayBufferSamples(
+            observations=self._normalize_tensor(
+                gather(self.observations, flat_inds).to(obs_dtype),
+                self._normalize_obs,
+                env,
+            ),
+            actions=gather(self.actions, flat_inds).to(
+                self._torch_dtype(self.action_space.dtype)
+            ),
+            next_observations=self._normalize_tensor(
+                gather(next_obs_storage, next_inds).to(obs_dtype),
+                self._normalize_obs,
+                env,
+            ),
+            # Only use dones that are not due to timeouts
+            # deactivated by default (timeouts is initialized as an array of False)
+            dones=(
+                gather(self.dones, flat_inds).float()
+                * (1 - gather(self.timeouts, flat_inds).float())
+            ).reshape(-1, 1),
+            rewards=self._normalize_tensor(
+                gather(self.rewards, flat_inds).reshape(-1, 1).float(),
+                self._normalize_reward,
+                env,
+            ),
         )
+
+
+class _SharedArray(NamedTuple):
+    """
+    Pickled in place of an array stored in shared memory.
+
+    :param field: Name of the field (see ``SharedMemoryReplayBuffer._allocate()``)
+    :param shape: Shape of the array
+    :param dtype: Data type of the array
+    :param data: The array, ``None`` when the array is sent to a child process
+        that attaches to the same shared memory block
+    """
+
+    field: str
+    shape: Tuple[int, ...]
+    dtype: np.dtype
+    data: Optional[np.ndarray]
+
+
+class SharedMemoryReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer whose storage lives in shared memory blocks (``multiprocessing.shared_memory``),
+    so that several actor processes can add transitions while one or more learner processes
+    sample from it, without sending the transitions through pipes.
+
+    The buffer is shared by passing it to the child processes
+    (e.g. as argument of ``multiprocessing.Process``), only the name of the blocks is sent.
+    The write cursor (``pos`` and ``full``) and the number of written transitions
+    (used by incremental checkpoints) are stored in shared memory too.
+    A process-shared lock is held while a step (or a batch of steps with ``extend()``)
+    is written and the cursor advanced, samplers only take it to read a snapshot of the cursor,
+    so they never sample transitions that are not completely written.
+    When the buffer is full, a transition may be overwritten while it is being sampled.
+
+    The process that created the buffer owns the blocks, they are unlinked when ``close()``
+    is called in that process or when the buffer is garbage collected.
+    The arrays of the buffer (for instance ``observations``) must not be used
+    once it is closed or garbage collected, the sampled data is a copy.
+    Pickling the buffer outside of process creation (e.g. with ``save_replay_buffer()``)
+    saves a copy of the data, new blocks are created when it is loaded
+    (the arrays of incremental checkpoints are copied in new blocks too).
+    Checkpoints should be saved while no actor is writing.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments (of each write)
+    :param optimize_memory_usage: Store only once each observation
+        (see ``ReplayBuffer``)
+    :param handle_timeout_termination: Handle timeout termination (due to timelimit)
+        separately and treat the task as infinite horizon task.
+        https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param dtypes: Storage dtype of the fields (see ``ReplayBuffer``)
+    :param start_method: Start method of the processes the buffer is shared with
+        (see ``multiprocessing.get_context()``), the lock can only be shared
+        with processes of the same context. Defaults to the default start method.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        device: Union[th.device, str] = "cpu",
+        n_envs: int = 1,
+        optimize_memory_usage: bool = False,
+        handle_timeout_termination: bool = True,
+        dtypes: Optional[Dict[str, Any]] = None,
+        start_method: Optional[str] = None,
+    ):
+        assert (
+            shared_memory is not None
+        ), "SharedMemoryReplayBuffer requires Python >= 3.8 (multiprocessing.shared_memory)"
+        self.start_method = start_method
+        self._lock = multiprocessing.get_context(start_method).Lock()
+        self._owner_pid = os.getpid()
+        self._shared_memories = {}
+        self._shared_arrays = {}
+        # Shared `pos`, `full` and `_rows_written`, must exist before `BaseBuffer` sets them
+        self._cursor = self._allocate("cursor", (3,), np.int64)
+        super(SharedMemoryReplayBuffer, self).__init__(
+            buffer_size,
+            observation_space,
+            action_space,
+            device,
+            n_envs=n_envs,
+            optimize_memory_usage=optimize_memory_usage,
+            handle_timeout_termination=handle_timeout_termination,
+            dtypes=dtypes,
+        )
+        self._register_unlink()
+
+    @property
+    def pos(self) -> int:
+        return int(self._cursor[0])
+
+    @pos.setter
+    def pos(self, pos: int) -> None:
+        self._cursor[0] = pos
+
+    @property
+    def full(self) -> bool:
+        return bool(self._cursor[1])
+
+    @full.setter
+    def full(self, full: bool) -> None:
+        self._cursor[1] = full
+
+    @property
+    def _rows_written(self) -> int:
+        return int(self._cursor[2])
+
+    @_rows_written.setter
+    def _rows_written(self, rows_written: int) -> None:
+        # Only updated while holding the lock (in `add()` and `extend()`)
+        self._cursor[2] = rows_written
+
+    def _allocate(self, name: str, shape: Tuple[int, ...], dtype: Any) -> np.ndarray:
+        """
+        Allocate the storage for one field of the buffer in a new shared memory block.
+
+        :param name: Name of the field
+        :param shape: Shape of the field
+        :param dtype: Data type of the field
+        :return: The (zero-initialized) array
+        """
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        # New blocks are filled with zeros
+        memory = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        return self._attach(name, memory, shape, dtype)
+
+    def _attach(
+        self,
+        name: str,
+        memory: "shared_memory.SharedMemory",
+        shape: Tuple[int, ...],
+        dtype: Any,
+    ) -> np.ndarray:
+        """
+        :param name: Name of the field
+        :param memory: Shared memory block of the field
+        :param shape: Shape of the field
+        :param dtype: Data type of the field
+        :return: Array backed by the shared memory block
+        """
+        array = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        self._shared_memories[name] = memory
+        self._shared_arrays[name] = array
+        return array
+
+    def _register_unlink(self) -> None:
+        # Only the process that created the blocks unlinks them,
+        # the blocks are closed (unmapped) when the buffer is garbage collected.
+        # The dict is shared, to unlink the blocks allocated afterwards too
+        self._unlink = weakref.finalize(
+            self,
+            SharedMemoryReplayBuffer._unlink_shared_memories,
+            self._shared_memories,
+            self._owner_pid,
+        )
+
+    @staticmethod
+    def _unlink_shared_memories(
+        shared_memories: Dict[str, "shared_memory.SharedMemory"], owner_pid: int
+    ) -> None:
+        if os.getpid() == owner_pid:
+            for memory in shared_memories.values():
+                memory.unlink()
+
+    def close(self) -> None:
+        """
+        Release the shared memory, the blocks are also unlinked
+        if this is the process that created the buffer.
+        The buffer cannot be used anymore afterwards.
+        """
+        shared_arrays, self._shared_arrays = self._shared_arrays, {}
+        shared_ids = {id(array) for array in shared_arrays.values()}
+        # Drop the references to the arrays before unmapping the blocks
+        for name, value in list(self.__dict__.items()):
+            values = value.values() if isinstance(value, dict) else [value]
+            if any(id(value_) in shared_ids for value_ in values):
+                self.__dict__[name] = None
+        del shared_arrays
+        self._unlink()
+        for memory in self._shared_memories.values():
+            memory.close()
+        self._shared_memories.clear()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = super(SharedMemoryReplayBuffer, self).__getstate__()
+        # Sent to a child process, or saved
+        spawning = multiprocessing.context.get_spawning_popen() is not None
+        fields = {id(array): name for name, array in self._shared_arrays.items()}
+
+        def replace(value: Any) -> Any:
+            if not (isinstance(value, np.ndarray) and id(value) in fields):
+                return value
+            data = None if spawning else value
+            return _SharedArray(fields[id(value)], value.shape, value.dtype, data)
+
+        for name, value in state.items():
+            if isinstance(value, dict):
+                state[name] = {key: replace(value_) for key, value_ in value.items()}
+            else:
+                state[name] = replace(value)
+
+        if spawning:
+            state["_shared_memories"] = {
+                name: memory.name for name, memory in self._shared_memories.items()
+            }
+        else:
+            # The loaded buffer creates its own blocks and lock
+            del state["_shared_memories"], state["_lock"], state["_owner_pid"]
+        del state["_shared_arrays"], state["_unlink"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        block_names = state.pop("_shared_memories", None)
+        if block_names is None:
+            state["_lock"] = multiprocessing.get_context(state["start_method"]).Lock()
+            state["_owner_pid"] = os.getpid()
+        self.__dict__.update(state)
+        self._shared_memories = {}
+        self._shared_arrays = {}
+
+        def restore(value: Any) -> Any:
+            if not isinstance(value, _SharedArray):
+                return value
+            if block_names is None:
+                array = self._allocate(value.field, value.shape, value.dtype)
+                array[...] = value.data
+                return array
+            memory = shared_memory.SharedMemory(name=block_names[value.field])
+            return self._attach(value.field, memory, value.shape, value.dtype)
+
+        for name, value in state.items():
+            if isinstance(value, dict):
+                value = {key: restore(value_) for key, value_ in value.items()}
+            else:
+                value = restore(value)
+            self.__dict__[name] = value
+        self._register_unlink()
+
+    def _load_checkpoint_array(self, name: str, array: np.ndarray) -> None:
+        # Copy the loaded array in a new block
+        shared_array = self._allocate(name, array.shape, array.dtype)
+        shared_array[...] = array
+        super(SharedMemoryReplayBuffer, self)._load_checkpoint_array(name, shared_array)
+
+    def add(self, *args, **kwargs) -> None:
+        with self._lock:
+            super(SharedMemoryReplayBuffer, self).add(*args, **kwargs)
+
+    def extend(self, *args, **kwargs) -> None:
+        with self._lock:
+            super(SharedMemoryReplayBuffer, self).extend(*args, **kwargs)
+
+    def _sample_batch(
+        self, batch_size: int, env: Optional[VecNormalize] = None
+    ) -> ReplayBufferSamples:
+        # Other processes may write while sampling, use a snapshot of the cursor
+        with self._lock:
+            pos, full = self.pos, self.full
+        if full:
+            # With `optimize_memory_usage`, the transition at `pos` is invalid
+            start = int(self.optimize_memory_usage)
+            batch_inds = (
+                np.random.randint(start, self.buffer_size, size=batch_size) + pos
+            ) % self.buffer_size
+        else:
+            batch_inds = np.random.randint(0, pos, size=batch_size)
+        return self._get_samples(batch_inds, env=env)
+
+
+class DictSharedMemoryReplayBuffer(SharedMemoryReplayBuffer, DictReplayBuffer):
+    """
+    Shared memory replay buffer for dictionary observations,
+    see ``SharedMemoryReplayBuffer`` and ``DictReplayBuffer``.
+
+    :param buffer_size: Max number of element in the buffer
+    :param observation_space: Observation space
+    :param action_space: Action space
+    :param device:
+    :param n_envs: Number of parallel environments (of each write)
+    :param optimize_memory_usage: Not supported by the ``DictReplayBuffer``
+    :param handle_timeout_termination: Handle timeout termination (due to timelimit)
+        separately and treat the task as infinite horizon task.
+        https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param dtypes: Storage dtype of the fields (see ``DictReplayBuffer``)
+    :param start_method: Start method of the processes the buffer is shared with
+        (see ``SharedMemoryReplayBuffer``)
+    """
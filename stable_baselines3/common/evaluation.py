@@ -4,8 +4,8 @@ from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 import gym
 import numpy as np
 from stable_baselines3.common import base_class
-from stable_baselines3.common.vec_env import (DummyVecEnv, VecEnv, VecMonitor,
-                                              is_vecenv_wrapped)
+from stable_baselines3.common.vec_env import (DummyVecEnv, VecEnv, VecEnvInfos,
+                                              VecMonitor, is_vecenv_wrapped)
 
 
 def evaluate_policy(
@@ -99,37 +99,56 @@ def evaluate_policy(
         observations, rewards, dones, infos = env.step(actions)
         current_rewards += rewards
         current_lengths += 1
-        for i in range(n_envs):
-            if episode_counts[i] < episode_count_targets[i]:
-
-                # unpack values so that the callback can access the local variables
-                reward = rewards[i]
-                done = dones[i]
-                info = infos[i]
-                episode_starts[i] = done
-
-                if callback is not None:
-                    callback(locals(), globals())
-
-                if dones[i]:
-                    if is_monitor_wrapped:
-                        # Atari wrapper can send a "done" signal when
-                        # the agent loses a life, but it does not correspond
-                        # to the true end of episode
-                        if "episode" in info.keys():
-                            # Do not trust "done" with episode endings.
-                            # Monitor wrapper includes "episode" key in info if environment
-                            # has been wrapped with it. Use those rewards instead.
-                            episode_rewards.append(info["episode"]["r"])
-                            episode_lengths.append(info["episode"]["l"])
-                            # Only increment at the real end of an episode
+        if callback is None and isinstance(infos, VecEnvInfos):
+            # Columnar infos: update all the envs at once
+            active = episode_counts < episode_count_targets
+            episode_starts[active] = dones[active]
+            ended = dones & active
+            if is_monitor_wrapped:
+                # Only count the real end of episodes (see below)
+                indices = infos.episode_indices
+                counted = ended[indices]
+                episode_rewards.extend(infos.episode_rewards[counted])
+                episode_lengths.extend(infos.episode_lengths[counted])
+                episode_counts[indices[counted]] += 1
+            else:
+                episode_rewards.extend(current_rewards[ended])
+                episode_lengths.extend(current_lengths[ended])
+                episode_counts[ended] += 1
+            current_rewards[ended] = 0
+            current_lengths[ended] = 0
+        else:
+            for i in range(n_envs):
+                if episode_counts[i] < episode_count_targets[i]:
+
+                    # unpack values so that the callback can access the local variables
+                    reward = rewards[i]
+                    done = dones[i]
+                    info = infos[i]
+                    episode_starts[i] = done
+
+                    if callback is not None:
+                        callback(locals(), globals())
+
+                    if dones[i]:
+                        if is_monitor_wrapped:
+                            # Atari wrapper can send a "done" signal when
+                            # the agent loses a life, but it does not correspond
+                            # to the true end of episode
+                            if "episode" in info.keys():
+                                # Do not trust "done" with episode endings.
+                                # Monitor wrapper includes "episode" key in info if environment
+                                # has been wrapped with it. Use those rewards instead.
+                                episode_rewards.append(info["episode"]["r"])
+                                episode_lengths.append(info["episode"]["l"])
+                                # Only increment at the real end of an episode
+                                episode_counts[i] += 1
+                        else:
+                            episode_rewards.append(current_rewards[i])
+                            episode_lengths.append(current_lengths[i])
                             episode_counts[i] += 1
-                    else:
-                        episode_rewards.append(current_rewards[i])
-                        episode_lengths.append(current_lengths[i])
-                        episode_counts[i] += 1
-                    current_rewards[i] = 0
-                    current_lengths[i] = 0
+                        current_rewards[i] = 0
+                        current_lengths[i] = 0
 
         if render:
             env.render()
@@ -3,23 +3,37 @@ import pathlib
 import time
 import warnings
 from copy import deepcopy
-from typing import Any, Dict, List, Optional, Tuple, Type, Union
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type, Union
 
 import gym
 import numpy as np
 import torch as th
 from stable_baselines3.common.base_class import BaseAlgorithm
-from stable_baselines3.common.buffers import DictReplayBuffer, ReplayBuffer
+from stable_baselines3.common.buffers import (DictNStepReplayBuffer,
+                                              DictPrioritizedReplayBuffer,
+                                              DictReplayBuffer,
+                                              DictSharedMemoryReplayBuffer,
+                                              NStepReplayBuffer,
+                                              PrioritizedReplayBuffer,
+                                              ReplayBuffer,
+                                              SharedMemoryReplayBuffer)
 from stable_baselines3.common.callbacks import BaseCallback
 from stable_baselines3.common.noise import ActionNoise, VectorizedActionNoise
 from stable_baselines3.common.policies import BasePolicy
-from stable_baselines3.common.save_util import load_from_pkl, save_to_pkl
-from stable_baselines3.common.type_aliases import (GymEnv, MaybeCallback,
+from stable_baselines3.common.save_util import (is_chunked_replay_buffer,
+                                                load_chunked_replay_buffer,
+                                                load_from_pkl,
+                                                save_chunked_replay_buffer,
+                                                save_to_pkl)
+from stable_baselines3.common.type_aliases import (DictReplayBufferSamples,
+                                                   GymEnv, MaybeCallback,
+                                                   NStepReplayBufferSamples,
+                                                   ReplayBufferSamples,
                                                    RolloutReturn, Schedule,
                                                    TrainFreq,
                                                    TrainFrequencyUnit)
 from stable_baselines3.common.utils import safe_mean, should_collect_more_steps
-from stable_baselines3.common.vec_env import VecEnv
+from stable_baselines3.common.vec_env import VecEnv, VecEnvInfos
 from stable_baselines3.her.her_replay_buffer import HerReplayBuffer
 
 
@@ -194,6 +208,21 @@ class OffPolicyAlgorithm(BaseAlgorithm):
             else:
                 self.replay_buffer_class = ReplayBuffer
 
+        elif self.replay_buffer_class == PrioritizedReplayBuffer and isinstance(
+            self.observation_space, gym.spaces.Dict
+        ):
+            self.replay_buffer_class = DictPrioritizedReplayBuffer
+
+        elif self.replay_buffer_class == NStepReplayBuffer and isinstance(
+            self.observation_space, gym.spaces.Dict
+        ):
+            self.replay_buffer_class = DictNStepReplayBuffer
+
+        elif self.replay_buffer_class == SharedMemoryReplayBuffer and isinstance(
+            self.observation_space, gym.spaces.Dict
+        ):
+            self.replay_buffer_class = DictSharedMemoryReplayBuffer
+
         elif self.replay_buffer_class == HerReplayBuffer:
             assert (
                 self.env is not None
@@ -219,6 +248,10 @@ class OffPolicyAlgorithm(BaseAlgorithm):
                 **self.replay_buffer_kwargs,
             )
 
+        # The n-step returns use the discount factor of the algorithm
+        if issubclass(self.replay_buffer_class, NStepReplayBuffer):
+            self.replay_buffer_kwargs.setdefault("gamma", self.gamma)
+
         if self.replay_buffer is None:
             self.replay_buffer = self.replay_buffer_class(
                 self.buffer_size,
@@ -242,32 +275,67 @@ class OffPolicyAlgorithm(BaseAlgorithm):
         self._convert_train_freq()
 
     def save_replay_buffer(
-        self, path: Union[str, pathlib.Path, io.BufferedIOBase]
+        self,
+        path: Union[str, pathlib.Path, io.BufferedIOBase],
+        incremental: bool = False,
+        chunk_size: int = 10000,
     ) -> None:
         """
-        Save the replay buffer as a pickle file.
+        Save the replay buffer as a pickle file,
+        or as a directory of chunks when ``incremental=True``.
 
         :param path: Path to the file where the replay buffer should be saved.
             if path is a str or pathlib.Path, the path is automatically created if necessary.
+        :param incremental: Save the replay buffer in the directory ``path``,
+            split in chunks of ``.npy`` files: saving again to the same directory
+            only writes the chunks modified since the last save
+            (see ``save_chunked_replay_buffer()``)
+        :param chunk_size: Number of buffer positions per chunk, when ``incremental=True``.
+            Use ``chunk_size >= buffer_size`` to load the buffer with ``mmap_mode``,
+            at the cost of rewriting the whole buffer on each save.
         """
         assert self.replay_buffer is not None, "The replay buffer is not defined"
-        save_to_pkl(path, self.replay_buffer, self.verbose)
+        if incremental:
+            assert not isinstance(
+                path, io.BufferedIOBase
+            ), "Incremental saving requires a directory path"
+            save_chunked_replay_buffer(
+                path, self.replay_buffer, chunk_size=chunk_size, verbose=self.verbose
+            )
+        else:
+            save_to_pkl(path, self.replay_buffer, self.verbose)
 
     def load_replay_buffer(
         self,
         path: Union[str, pathlib.Path, io.BufferedIOBase],
         truncate_last_traj: bool = True,
+        mmap_mode: Optional[str] = None,
     ) -> None:
         """
-        Load a replay buffer from a pickle file.
+        Load a replay buffer from a pickle file,
+        or from a directory written with ``save_replay_buffer(path, incremental=True)``.
 
-        :param path: Path to the pickled replay buffer.
+        :param path: Path to the pickled replay buffer (or to the directory).
         :param truncate_last_traj: When using ``HerReplayBuffer`` with online sampling:
             If set to ``True``, we assume that the last trajectory in the replay buffer was finished
             (and truncate it).
             If set to ``False``, we assume that we continue the same trajectory (same episode).
+        :param mmap_mode: Memory-map the arrays of a replay buffer saved
+            with ``incremental=True`` and ``chunk_size >= buffer_size`` instead of reading them,
+            use ``"c"`` (copy-on-write) to continue training without modifying the saved files
+            (see ``load_chunked_replay_buffer()``).
+            A buffer saved in several chunks per array cannot be mapped (``ValueError``):
+            with a single chunk, the incremental saves rewrite the whole buffer.
         """
-        self.replay_buffer = load_from_pkl(path, self.verbose)
+        if is_chunked_replay_buffer(path):
+            self.replay_buffer = load_chunked_replay_buffer(
+                path, self.verbose, mmap_mode=mmap_mode
+            )
+        else:
+            assert (
+                mmap_mode is None
+            ), "Only replay buffers saved with `incremental=True` can be memory-mapped"
+            self.replay_buffer = load_from_pkl(path, self.verbose)
         assert isinstance(
             self.replay_buffer, ReplayBuffer
         ), "The replay buffer must inherit from ReplayBuffer class"
@@ -433,6 +501,43 @@ class OffPolicyAlgorithm(BaseAlgorithm):
         """
         raise NotImplementedError()
 
+    def _discounts(
+        self,
+        replay_data: Union[
+            ReplayBufferSamples, DictReplayBufferSamples, NStepReplayBufferSamples
+        ],
+    ) -> Union[float, th.Tensor]:
+        """
+        :param replay_data: Sampled transitions
+        :return: Discount of the bootstrapped value of each transition:
+            ``gamma ** n`` for the transitions of n steps of an ``NStepReplayBuffer``,
+            ``gamma`` otherwise
+        """
+        if isinstance(replay_data, NStepReplayBufferSamples):
+            return replay_data.discounts
+        return self.gamma
+
+    def _sample_batches(
+        self, gradient_steps: int, batch_size: int
+    ) -> Iterable[Union[ReplayBufferSamples, DictReplayBufferSamples]]:
+        """
+        Sample the batches used by the gradient steps of ``train()``.
+        They are drawn at once with ``sample_many()``, except with prioritized replay
+        where each batch uses the priorities updated by the previous gradient steps.
+
+        :param gradient_steps: Number of gradient steps
+        :param batch_size: Minibatch size
+        :return: One batch per gradient step
+        """
+        if isinstance(self.replay_buffer, PrioritizedReplayBuffer):
+            return (
+                self.replay_buffer.sample(batch_size, env=self._vec_normalize_env)
+                for _ in range(gradient_steps)
+            )
+        return self.replay_buffer.sample_many(
+            gradient_steps, batch_size, env=self._vec_normalize_env
+        )
+
     def _sample_action(
         self,
         learning_starts: int,
@@ -578,23 +683,39 @@ class OffPolicyAlgorithm(BaseAlgorithm):
         next_obs = deepcopy(new_obs_)
         # As the VecEnv resets automatically, new_obs is already the
         # first observation of the next episode
-        for i, done in enumerate(dones):
-            if done and infos[i].get("terminal_observation") is not None:
+        if isinstance(infos, VecEnvInfos):
+            # Replace the next obs of all the envs that are done at once
+            indices = infos.terminal_indices
+            if len(indices) > 0:
+                terminal_obs = infos.terminal_observations
+                # VecNormalize normalizes the terminal observation
+                if self._vec_normalize_env is not None:
+                    terminal_obs = self._vec_normalize_env.unnormalize_obs(terminal_obs)
                 if isinstance(next_obs, dict):
-                    next_obs_ = infos[i]["terminal_observation"]
-                    # VecNormalize normalizes the terminal observation
-                    if self._vec_normalize_env is not None:
-                        next_obs_ = self._vec_normalize_env.unnormalize_obs(next_obs_)
-                    # Replace next obs for the correct envs
                     for key in next_obs.keys():
-                        next_obs[key][i] = next_obs_[key]
+                        next_obs[key][indices] = terminal_obs[key]
                 else:
-                    next_obs[i] = infos[i]["terminal_observation"]
-                    # VecNormalize normalizes the terminal observation
-                    if self._vec_normalize_env is not None:
-                        next_obs[i] = self._vec_normalize_env.unnormalize_obs(
-                            next_obs[i, :]
-                        )
+                    next_obs[indices] = terminal_obs
+        else:
+            for i, done in enumerate(dones):
+                if done and infos[i].get("terminal_observation") is not None:
+                    if isinstance(next_obs, dict):
+                        next_obs_ = infos[i]["terminal_observation"]
+                        # VecNormalize normalizes the terminal observation
+                        if self._vec_normalize_env is not None:
+                            next_obs_ = self._vec_normalize_env.unnormalize_obs(
+                                next_obs_
+                            )
+                        # Replace next obs for the correct envs
+                        for key in next_obs.keys():
+                            next_obs[key][i] = next_obs_[key]
+                    else:
+                        next_obs[i] = infos[i]["terminal_observation"]
+                        # VecNormalize normalizes the terminal observation
+                        if self._vec_normalize_env is not None:
+                            next_obs[i] = self._vec_normalize_env.unnormalize_obs(
+                                next_obs[i, :]
+                            )
 
         replay_buffer.add(
             self._last_original_obs,
@@ -11,7 +11,7 @@ from stable_baselines3.common.policies import ActorCriticPolicy, BasePolicy
 from stable_baselines3.common.type_aliases import (GymEnv, MaybeCallback,
                                                    Schedule)
 from stable_baselines3.common.utils import obs_as_tensor, safe_mean
-from stable_baselines3.common.vec_env import VecEnv
+from stable_baselines3.common.vec_env import VecEnv, VecEnvInfos
 
 
 class OnPolicyAlgorithm(BaseAlgorithm):
@@ -45,6 +45,8 @@ class OnPolicyAlgorithm(BaseAlgorithm):
     :param seed: Seed for the pseudo random generators
     :param device: Device (cpu, cuda, ...) on which the code should be run.
         Setting it to auto, the code will be run on the GPU if possible.
+    :param rollout_buffer_kwargs: Keyword arguments to pass to the rollout buffer on creation
+        (for instance ``dict(dtypes=dict(observations=np.uint8))``).
     :param _init_setup_model: Whether or not to build the network at the creation of the instance
     :param supported_action_spaces: The action spaces supported by the algorithm.
     """
@@ -70,6 +72,7 @@ class OnPolicyAlgorithm(BaseAlgorithm):
         verbose: int = 0,
         seed: Optional[int] = None,
         device: Union[th.device, str] = "auto",
+        rollout_buffer_kwargs: Optional[Dict[str, Any]] = None,
         _init_setup_model: bool = True,
         supported_action_spaces: Optional[Tuple[gym.spaces.Space, ...]] = None,
     ):
@@ -98,6 +101,9 @@ class OnPolicyAlgorithm(BaseAlgorithm):
         self.vf_coef = vf_coef
         self.max_grad_norm = max_grad_norm
         self.rollout_buffer = None
+        if rollout_buffer_kwargs is None:
+            rollout_buffer_kwargs = {}
+        self.rollout_buffer_kwargs = rollout_buffer_kwargs
 
         if _init_setup_model:
             self._setup_model()
@@ -120,13 +126,14 @@ class OnPolicyAlgorithm(BaseAlgorithm):
             gamma=self.gamma,
             gae_lambda=self.gae_lambda,
             n_envs=self.n_envs,
+            **self.rollout_buffer_kwargs,
         )
         self.policy = self.policy_class(  # pytype:disable=not-instantiable
             self.observation_space,
             self.action_space,
             self.lr_schedule,
             use_sde=self.use_sde,
-            **self.policy_kwargs  # pytype:disable=not-instantiable
+            **self.policy_kwargs,  # pytype:disable=not-instantiable
         )
         self.policy = self.policy.to(self.device)
 
@@ -203,18 +210,25 @@ class OnPolicyAlgorithm(BaseAlgorithm):
 
             # Handle timeout by bootstraping with value function
             # see GitHub issue #633
-            for idx, done in enumerate(dones):
-                if (
-                    done
-                    and infos[idx].get("terminal_observation") is not None
-                    and infos[idx].get("TimeLimit.truncated", False)
-                ):
-                    terminal_obs = self.policy.obs_to_tensor(
-                        infos[idx]["terminal_observation"]
-                    )[0]
-                    with th.no_grad():
-                        terminal_value = self.policy.predict_values(terminal_obs)[0]
-                    rewards[idx] += self.gamma * terminal_value
+            if not isinstance(infos, VecEnvInfos):
+                # Only look at the info of the envs whose episode ended
+                infos = VecEnvInfos(infos, dones)
+            timeouts = infos.timeouts[infos.terminal_indices]
+            if np.any(timeouts):
+                # Evaluate the terminal observations of all the truncated envs at once
+                terminal_obs = infos.terminal_observations
+                if isinstance(terminal_obs, dict):
+                    terminal_obs = {
+                        key: obs[timeouts] for key, obs in terminal_obs.items()
+                    }
+                else:
+                    terminal_obs = terminal_obs[timeouts]
+                terminal_obs = self.policy.obs_to_tensor(terminal_obs)[0]
+                with th.no_grad():
+                    terminal_values = self.policy.predict_values(terminal_obs)
+                rewards[infos.terminal_indices[timeouts]] += (
+                    self.gamma * terminal_values.cpu().numpy().flatten()
+                )
 
             rollout_buffer.add(
                 self._last_obs,
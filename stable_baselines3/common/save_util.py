@@ -9,11 +9,13 @@ import json
 import os
 import pathlib
 import pickle
+import uuid
 import warnings
 import zipfile
 from typing import Any, Dict, Optional, Tuple, Union
 
 import cloudpickle
+import numpy as np
 import stable_baselines3 as sb3
 import torch as th
 from stable_baselines3.common.type_aliases import TensorDict
@@ -378,6 +380,215 @@ def load_from_pkl(
         return pickle.load(file_handler)
 
 
+def is_chunked_replay_buffer(path: Union[str, pathlib.Path, io.BufferedIOBase]) -> bool:
+    """
+    :param path: Path passed to ``load_replay_buffer()``
+    :return: Whether it is a directory written by ``save_chunked_replay_buffer()``
+    """
+    if isinstance(path, io.BufferedIOBase):
+        return False
+    return os.path.isfile(os.path.join(path, "manifest.json"))
+
+
+def save_chunked_replay_buffer(
+    path: Union[str, pathlib.Path],
+    replay_buffer: Any,
+    chunk_size: int = 10000,
+    verbose: int = 0,
+) -> None:
+    """
+    Save a replay buffer in a directory: the arrays indexed by buffer position
+    (see ``ReplayBuffer._checkpoint_arrays()``) are split along the buffer axis
+    into ``.npy`` chunks of ``chunk_size`` rows, the other attributes are pickled,
+    and ``manifest.json`` describes the checkpoint (files, ``pos``, ``full``, ...).
+
+    When the directory already contains a checkpoint of the same buffer,
+    only the chunks written since then are saved again.
+    New files never overwrite the previous ones and the manifest is replaced last,
+    so an interrupted save leaves the previous checkpoint usable.
+
+    :param path: Directory where the replay buffer is saved
+    :param replay_buffer: The replay buffer
+    :param chunk_size: Number of rows (buffer positions) per chunk.
+        Smaller chunks make the incremental saves faster, but only a checkpoint saved
+        with ``chunk_size >= buffer_size`` (a single chunk per array, rewritten entirely by each save)
+        can be memory-mapped by ``load_chunked_replay_buffer()``.
+    :param verbose: Verbosity level, 0 means only warnings, 2 means debug information.
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, "manifest.json")
+    previous = None
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, "r") as file_handler:
+            previous = json.load(file_handler)
+    version = 0 if previous is None else previous["version"] + 1
+
+    # Identify the buffer, to know if the previous checkpoint can be updated
+    if getattr(replay_buffer, "_checkpoint_id", None) is None:
+        replay_buffer._checkpoint_id = uuid.uuid4().hex
+    buffer_size = replay_buffer.buffer_size
+    rows_written = getattr(replay_buffer, "_rows_written", 0)
+
+    # Rows to save again, `None` means all of them
+    dirty_rows = None
+    if (
+        previous is not None
+        and previous["checkpoint_id"] == replay_buffer._checkpoint_id
+        and previous["chunk_size"] == chunk_size
+        and previous["buffer_size"] == buffer_size
+    ):
+        n_rows = rows_written - previous["rows_written"]
+        # Include the row before (the last transition is marked as done when learning resumes)
+        # and the row after (it stores the next observation when optimizing memory usage)
+        if 0 <= n_rows < buffer_size - 2:
+            dirty_rows = (previous["pos"] - 1 + np.arange(n_rows + 2)) % buffer_size
+
+    arrays = replay_buffer._checkpoint_arrays()
+    fields = {}
+    for name, array in arrays.items():
+        n_chunks = (len(array) + chunk_size - 1) // chunk_size
+        previous_field = None if previous is None else previous["fields"].get(name)
+        if (
+            dirty_rows is None
+            or previous_field is None
+            or previous_field["shape"] != list(array.shape)
+            or previous_field["dtype"] != str(array.dtype)
+        ):
+            chunks = [None] * n_chunks
+            dirty_chunks = range(n_chunks)
+        else:
+            chunks = list(previous_field["chunks"])
+            dirty_chunks = np.unique(dirty_rows // chunk_size)
+
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+        for idx in dirty_chunks:
+            chunks[idx] = f"{idx:06d}-{version}.npy"
+            np.save(
+                os.path.join(path, name, chunks[idx]),
+                array[idx * chunk_size : (idx + 1) * chunk_size],
+            )
+        fields[name] = dict(
+            shape=list(array.shape), dtype=str(array.dtype), chunks=chunks
+        )
+        if verbose >= 2:
+            print(f"Saved {len(dirty_chunks)}/{n_chunks} chunks of {name}")
+
+    # Pickle the state of the buffer (the other attributes), without the arrays saved in chunks.
+    # The buffer itself is not copied: copying it could copy the arrays too
+    state = dict(replay_buffer.__getstate__())
+    for name in arrays:
+        attribute, _, key = name.partition(".")
+        if key:
+            state[attribute] = dict(state[attribute])
+            state[attribute][key] = None
+        else:
+            state[attribute] = None
+    attributes_file = f"attributes-{version}.pkl"
+    with open(os.path.join(path, attributes_file), "wb") as file_handler:
+        pickle.dump(
+            (type(replay_buffer), state),
+            file_handler,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+    manifest = dict(
+        version=version,
+        checkpoint_id=replay_buffer._checkpoint_id,
+        chunk_size=chunk_size,
+        buffer_size=buffer_size,
+        n_envs=replay_buffer.n_envs,
+        pos=replay_buffer.pos,
+        full=replay_buffer.full,
+        rows_written=rows_written,
+        attributes=attributes_file,
+        fields=fields,
+    )
+    with open(manifest_path + ".tmp", "w") as file_handler:
+        json.dump(manifest, file_handler, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    # Remove the files of the previous checkpoints
+    if previous is not None:
+        stale_files = [previous["attributes"]]
+        for name, field in previous["fields"].items():
+            used_chunks = set(fields[name]["chunks"]) if name in fields else set()
+            stale_files += [
+                os.path.join(name, chunk)
+                for chunk in field["chunks"]
+                if chunk not in used_chunks
+            ]
+        for stale_file in stale_files:
+            if stale_file != attributes_file and os.path.exists(
+                os.path.join(path, stale_file)
+            ):
+                os.remove(os.path.join(path, stale_file))
+
+
+def load_chunked_replay_buffer(
+    path: Union[str, pathlib.Path], verbose: int = 0, mmap_mode: Optional[str] = None
+) -> Any:
+    """
+    Load a replay buffer saved with ``save_chunked_replay_buffer()``.
+
+    :param path: Directory where the replay buffer was saved
+    :param verbose: Verbosity level, 0 means only warnings, 2 means debug information.
+    :param mmap_mode: If not ``None``, the arrays are memory-mapped with ``np.load(mmap_mode=...)``
+        instead of being read: the data is only read from disk when it is accessed.
+        ``"c"`` (copy-on-write) lets the buffer be modified without changing the files,
+        ``"r"`` maps them read-only (the buffer cannot be modified)
+        and ``"r+"`` writes the modifications to the files of the checkpoint.
+        Each array must be stored in a single chunk (saved with ``chunk_size >= buffer_size``),
+        otherwise a ``ValueError`` is raised. Arrays of Python objects are still read,
+        and buffers that do not store NumPy arrays (e.g. in shared memory or as tensors)
+        copy the arrays in their own storage.
+    :return: The replay buffer
+    """
+    with open(os.path.join(path, "manifest.json"), "r") as file_handler:
+        manifest = json.load(file_handler)
+    if mmap_mode is not None:
+        split_fields = [
+            name
+            for name, field in manifest["fields"].items()
+            if len(field["chunks"]) > 1 and field["dtype"] != "object"
+        ]
+        if len(split_fields) > 0:
+            raise ValueError(
+                f"The replay buffer in {path} cannot be memory-mapped: {', '.join(split_fields)} "
+                f"are split in chunks of {manifest['chunk_size']} rows. "
+                f"Save it with `chunk_size >= buffer_size` ({manifest['buffer_size']}) to map it, "
+                "or load it without `mmap_mode`."
+            )
+    with open(os.path.join(path, manifest["attributes"]), "rb") as file_handler:
+        buffer_class, state = pickle.load(file_handler)
+    # Same as unpickling the buffer
+    replay_buffer = buffer_class.__new__(buffer_class)
+    if hasattr(replay_buffer, "__setstate__"):
+        replay_buffer.__setstate__(state)
+    else:
+        replay_buffer.__dict__.update(state)
+
+    chunk_size = manifest["chunk_size"]
+    for name, field in manifest["fields"].items():
+        chunks = [os.path.join(path, name, chunk) for chunk in field["chunks"]]
+        # Object arrays are pickled and cannot be memory-mapped
+        if mmap_mode is not None and field["dtype"] != "object":
+            array = np.load(chunks[0], mmap_mode=mmap_mode)
+        else:
+            array = np.empty(field["shape"], dtype=field["dtype"])
+            for idx, chunk in enumerate(chunks):
+                array[idx * chunk_size : (idx + 1) * chunk_size] = np.load(
+                    chunk, allow_pickle=True
+                )
+        replay_buffer._load_checkpoint_array(name, array)
+        if verbose >= 2:
+            print(f"Loaded {len(field['chunks'])} chunks of {name}")
+
+    # The arrays are not in the memory-mapped files of `storage_path` anymore
+    if getattr(replay_buffer, "storage_path", None) is not None:
+        replay_buffer.storage_path = None
+    return replay_buffer
+
+
 def load_from_zip_file(
     load_path: Union[str, pathlib.Path, io.BufferedIOBase],
     load_data: bool = True,
@@ -0,0 +1,126 @@
+from typing import Callable, Union
+
+import numpy as np
+
+
+class SegmentTree(object):
+    """
+    Array-based segment tree, all operations are vectorized over a batch of indices.
+
+    The tree is stored in a flat array of size ``2 * capacity``
+    where ``capacity`` is the smallest power of two greater than ``size``:
+    node ``i`` has children ``2 * i`` and ``2 * i + 1``, the root is node ``1``
+    and the leaves are stored in ``[capacity, 2 * capacity)``.
+    Updating or querying a batch of ``n`` leaves costs ``O(log(size))`` NumPy calls
+    (instead of ``n * log(size)`` Python operations).
+
+    :param size: Number of leaves
+    :param operation: Vectorized binary operation used to combine two nodes
+        (for instance ``np.add`` or ``np.minimum``)
+    :param neutral_element: Neutral element of the operation
+        (``0`` for the sum, ``inf`` for the min)
+    """
+
+    def __init__(
+        self,
+        size: int,
+        operation: Callable[[np.ndarray, np.ndarray], np.ndarray],
+        neutral_element: float,
+    ):
+        assert size > 0, "The segment tree must have at least one leaf"
+        self.size = size
+        self.capacity = 1
+        while self.capacity < size:
+            self.capacity *= 2
+        self.depth = int(np.log2(self.capacity))
+        self.operation = operation
+        self.neutral_element = neutral_element
+        self.tree = np.full(2 * self.capacity, neutral_element, dtype=np.float64)
+
+    def __getitem__(self, indices: Union[int, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        :param indices: Leaf indices
+        :return: Values stored at those leaves
+        """
+        return self.tree[np.asarray(indices) + self.capacity]
+
+    def __setitem__(
+        self, indices: Union[int, np.ndarray], values: Union[float, np.ndarray]
+    ) -> None:
+        """
+        Update a batch of leaves and propagate the change to the root.
+        When the same index appears several times, the last value is kept.
+
+        :param indices: Leaf indices
+        :param values: New values for those leaves
+        """
+        nodes = np.asarray(indices, dtype=np.int64).reshape(-1) + self.capacity
+        self.tree[nodes] = np.asarray(values, dtype=np.float64).reshape(-1)
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.operation(
+                self.tree[2 * nodes], self.tree[2 * nodes + 1]
+            )
+
+    def reduce(self) -> float:
+        """
+        :return: Result of the operation over all the leaves
+        """
+        return self.tree[1]
+
+
+class SumSegmentTree(SegmentTree):
+    """
+    Segment tree where each node stores the sum of its children,
+    used for proportional sampling.
+
+    :param size: Number of leaves
+    """
+
+    def __init__(self, size: int):
+        super(SumSegmentTree, self).__init__(size, np.add, 0.0)
+
+    def sum(self) -> float:
+        """
+        :return: Sum of all the leaves
+        """
+        return self.reduce()
+
+    def find_prefixsum_idx(self, prefixsums: np.ndarray) -> np.ndarray:
+        """
+        Find, for each value ``v`` in ``prefixsums``, the highest index ``i`` such that
+        ``sum(leaves[:i]) <= v``. The whole batch walks down the tree at once,
+        one level per iteration.
+
+        :param prefixsums: Upper bounds on the cumulative sums,
+            should be in ``[0, self.sum()]``
+        :return: Leaf indices
+        """
+        prefixsums = np.array(prefixsums, dtype=np.float64).reshape(-1)
+        nodes = np.ones(len(prefixsums), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sums = self.tree[left]
+            go_right = prefixsums > left_sums
+            prefixsums -= left_sums * go_right
+            nodes = left + go_right
+        # Guard against floating point errors that would pick an empty leaf
+        return np.minimum(nodes - self.capacity, self.size - 1)
+
+
+class MinSegmentTree(SegmentTree):
+    """
+    Segment tree where each node stores the minimum of its children,
+    used to compute the maximum importance sampling weight.
+
+    :param size: Number of leaves
+    """
+
+    def __init__(self, size: int):
+        super(MinSegmentTree, self).__init__(size, np.minimum, float("inf"))
+
+    def min(self) -> float:
+        """
+        :return: Minimum over all the leaves
+        """
+        return self.reduce()
@@ -56,6 +56,44 @@ class DictReplayBufferSamples(ReplayBufferSamples):
     rewards: th.Tensor
 
 
+class PrioritizedReplayBufferSamples(NamedTuple):
+    observations: th.Tensor
+    actions: th.Tensor
+    next_observations: th.Tensor
+    dones: th.Tensor
+    rewards: th.Tensor
+    weights: th.Tensor
+    indices: np.ndarray
+
+
+class DictPrioritizedReplayBufferSamples(PrioritizedReplayBufferSamples):
+    observations: TensorDict
+    actions: th.Tensor
+    next_observations: TensorDict
+    dones: th.Tensor
+    rewards: th.Tensor
+    weights: th.Tensor
+    indices: np.ndarray
+
+
+class NStepReplayBufferSamples(NamedTuple):
+    observations: th.Tensor
+    actions: th.Tensor
+    next_observations: th.Tensor
+    dones: th.Tensor
+    rewards: th.Tensor
+    discounts: th.Tensor
+
+
+class DictNStepReplayBufferSamples(NStepReplayBufferSamples):
+    observations: TensorDict
+    actions: th.Tensor
+    next_observations: TensorDict
+    dones: th.Tensor
+    rewards: th.Tensor
+    discounts: th.Tensor
+
+
 class RolloutReturn(NamedTuple):
     episode_timesteps: int
     n_episodes: int
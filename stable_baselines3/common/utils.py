@@ -63,6 +63,36 @@ def explained_variance(y_pred: np.ndarray, y_true: np.ndarray) -> np.ndarray:
     return np.nan if var_y == 0 else 1 - np.var(y_true - y_pred) / var_y
 
 
+def discounted_reverse_scan(
+    values: np.ndarray, discounts: np.ndarray, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Discounted cumulative sum along the first (time) axis, from the end:
+    ``out[t] = values[t] + discounts[t] * out[t + 1]`` with ``out[T] = 0``.
+
+    All the other axes (e.g. the envs) are processed at once,
+    so only one multiply-add per step is left in the Python loop.
+    With one-step TD errors as ``values`` and ``gamma * gae_lambda`` zeroed
+    at episode ends as ``discounts``, this is the GAE(lambda) advantage.
+    The recursion is done in the dtype of ``values`` and only cast when stored in ``out``.
+
+    :param values: Values to accumulate, of shape (T, ...)
+    :param discounts: Discount applied to the next accumulated value, same shape as ``values``
+    :param out: Where to store the result, a new array is allocated if not given
+    :return: The discounted cumulative sums
+    """
+    assert (
+        values.shape == discounts.shape
+    ), "values and discounts must have the same shape"
+    if out is None:
+        out = np.empty_like(values)
+    carry = 0
+    for step in reversed(range(len(values))):
+        carry = values[step] + discounts[step] * carry
+        out[step] = carry
+    return out
+
+
 def update_learning_rate(optimizer: th.optim.Optimizer, learning_rate: float) -> None:
     """
     Update the learning rate for a given optimizer.
@@ -11,6 +11,8 @@ from stable_baselines3.common.vec_env.stacked_observations import (
     StackedDictObservations, StackedObservations)
 from stable_baselines3.common.vec_env.subproc_vec_env import SubprocVecEnv
 from stable_baselines3.common.vec_env.vec_check_nan import VecCheckNan
+from stable_baselines3.common.vec_env.vec_env_infos import (VecEnvInfos,
+                                                            get_timeouts)
 from stable_baselines3.common.vec_env.vec_extract_dict_obs import \
     VecExtractDictObs
 from stable_baselines3.common.vec_env.vec_frame_stack import VecFrameStack
@@ -10,6 +10,7 @@ from stable_baselines3.common.vec_env.base_vec_env import (VecEnv,
                                                            VecEnvStepReturn)
 from stable_baselines3.common.vec_env.util import (copy_obs_dict, dict_to_obs,
                                                    obs_space_info)
+from stable_baselines3.common.vec_env.vec_env_infos import VecEnvInfos
 
 
 class DummyVecEnv(VecEnv):
@@ -22,10 +23,15 @@ class DummyVecEnv(VecEnv):
 
     :param env_fns: a list of functions
         that return environments to vectorize
+    :param columnar_infos: Whether to return the infos as ``VecEnvInfos``
+        (columnar view of the infos, for many envs)
     """
 
-    def __init__(self, env_fns: List[Callable[[], gym.Env]]):
+    def __init__(
+        self, env_fns: List[Callable[[], gym.Env]], columnar_infos: bool = False
+    ):
         self.envs = [fn() for fn in env_fns]
+        self.columnar_infos = columnar_infos
         env = self.envs[0]
         VecEnv.__init__(self, len(env_fns), env.observation_space, env.action_space)
         obs_space = env.observation_space
@@ -59,11 +65,14 @@ class DummyVecEnv(VecEnv):
                 self.buf_infos[env_idx]["terminal_observation"] = obs
                 obs = self.envs[env_idx].reset()
             self._save_obs(env_idx, obs)
+        infos = deepcopy(self.buf_infos)
+        if self.columnar_infos:
+            infos = VecEnvInfos(infos, np.copy(self.buf_dones))
         return (
             self._obs_from_buf(),
             np.copy(self.buf_rews),
             np.copy(self.buf_dones),
-            deepcopy(self.buf_infos),
+            infos,
         )
 
     def seed(self, seed: Optional[int] = None) -> List[Union[None, int]]:
@@ -130,9 +130,10 @@ class StackedObservations(object):
                 if "terminal_observation" in infos[i]:
                     old_terminal = infos[i]["terminal_observation"]
                     if self.channels_first:
+                        # The terminal observation has no env dimension
                         new_terminal = np.concatenate(
                             (self.stackedobs[i, :-stack_ax_size, ...], old_terminal),
-                            axis=self.stack_dimension,
+                            axis=0,
                         )
                     else:
                         new_terminal = np.concatenate(
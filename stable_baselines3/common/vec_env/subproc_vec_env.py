@@ -1,6 +1,7 @@
 import multiprocessing as mp
 from collections import OrderedDict
-from typing import Any, Callable, List, Optional, Sequence, Tuple, Type, Union
+from typing import (Any, Callable, Dict, List, Optional, Sequence, Tuple, Type,
+                    Union)
 
 import gym
 import numpy as np
@@ -9,6 +10,120 @@ from stable_baselines3.common.vec_env.base_vec_env import (CloudpickleWrapper,
                                                            VecEnvIndices,
                                                            VecEnvObs,
                                                            VecEnvStepReturn)
+from stable_baselines3.common.vec_env.util import dict_to_obs, obs_space_info
+from stable_baselines3.common.vec_env.vec_env_infos import VecEnvInfos
+
+try:
+    # Observations transported through shared memory (Python >= 3.8)
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    shared_memory = None
+
+
+def _attach_shared_arrays(
+    layout: Dict[Any, Tuple[str, Tuple[int, ...], np.dtype]]
+) -> Tuple[Dict[Any, "shared_memory.SharedMemory"], Dict[Any, np.ndarray]]:
+    """
+    :param layout: Name of the shared memory block, shape and dtype of each field
+    :return: The shared memory blocks and the arrays backed by them
+    """
+    memories, arrays = {}, {}
+    for key, (name, shape, dtype) in layout.items():
+        memories[key] = shared_memory.SharedMemory(name=name)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=memories[key].buf)
+    return memories, arrays
+
+
+class _WorkerState:
+    """
+    Batch of envs hosted by a worker process, with one handler per command.
+    The commands apply to all the envs (or to the given local indices)
+    and each handler returns the answer sent back to the main process.
+
+    :param envs: The envs of the worker
+    """
+
+    def __init__(self, envs: List[gym.Env]):
+        self.envs = envs
+        # Shared memory transport: index of the first env and arrays of all the envs
+        self.first_env_idx = None
+        self.shared_memories, self.shared_arrays = {}, {}
+
+    def _write_observation(self, env_idx: int, observation: Any) -> None:
+        for field, array in self.shared_arrays.items():
+            if field not in ("reward", "done"):
+                key = field[1]
+                array[env_idx] = observation if key is None else observation[key]
+
+    def step(self, actions: np.ndarray) -> List[Any]:
+        results = []
+        for env_idx, (env, action) in enumerate(zip(self.envs, actions)):
+            observation, reward, done, info = env.step(action)
+            if done:
+                # save final observation where user can get it, then reset
+                info["terminal_observation"] = observation
+                observation = env.reset()
+            if self.first_env_idx is None:
+                results.append((observation, reward, done, info))
+            else:
+                env_idx += self.first_env_idx
+                self._write_observation(env_idx, observation)
+                self.shared_arrays["reward"][env_idx] = reward
+                self.shared_arrays["done"][env_idx] = done
+                results.append(info)
+        return results
+
+    def seed(self, seed: int) -> List[Union[None, int]]:
+        return [env.seed(seed + idx) for idx, env in enumerate(self.envs)]
+
+    def reset(self, _: Any) -> Optional[List[VecEnvObs]]:
+        observations = [env.reset() for env in self.envs]
+        if self.first_env_idx is None:
+            return observations
+        for env_idx, observation in enumerate(observations):
+            self._write_observation(self.first_env_idx + env_idx, observation)
+        return None
+
+    def attach_shared_memory(
+        self, data: Tuple[int, Dict[Any, Tuple[str, Tuple[int, ...], np.dtype]]]
+    ) -> None:
+        self.first_env_idx, layout = data
+        self.shared_memories, self.shared_arrays = _attach_shared_arrays(layout)
+
+    def render(self, mode: str) -> List[Any]:
+        return [env.render(mode) for env in self.envs]
+
+    def get_spaces(self, _: Any) -> Tuple[gym.spaces.Space, gym.spaces.Space]:
+        return self.envs[0].observation_space, self.envs[0].action_space
+
+    def env_method(self, data: Tuple[List[int], Tuple[str, tuple, dict]]) -> List[Any]:
+        indices, (method_name, method_args, method_kwargs) = data
+        return [
+            getattr(self.envs[idx], method_name)(*method_args, **method_kwargs)
+            for idx in indices
+        ]
+
+    def get_attr(self, data: Tuple[List[int], str]) -> List[Any]:
+        indices, attr_name = data
+        return [getattr(self.envs[idx], attr_name) for idx in indices]
+
+    def set_attr(self, data: Tuple[List[int], Tuple[str, Any]]) -> List[None]:
+        indices, (attr_name, value) = data
+        return [setattr(self.envs[idx], attr_name, value) for idx in indices]
+
+    def is_wrapped(self, data: Tuple[List[int], Type[gym.Wrapper]]) -> List[bool]:
+        # Import here to avoid a circular import
+        from stable_baselines3.common.env_util import is_wrapped
+
+        indices, wrapper_class = data
+        return [is_wrapped(self.envs[idx], wrapper_class) for idx in indices]
+
+    def close(self) -> None:
+        for env in self.envs:
+            env.close()
+        self.shared_arrays.clear()
+        for memory in self.shared_memories.values():
+            memory.close()
 
 
 def _worker(
@@ -16,45 +131,33 @@ def _worker(
     parent_remote: mp.connection.Connection,
     env_fn_wrapper: CloudpickleWrapper,
 ) -> None:
-    # Import here to avoid a circular import
-    from stable_baselines3.common.env_util import is_wrapped
-
     parent_remote.close()
-    env = env_fn_wrapper.var()
+    state = _WorkerState([env_fn() for env_fn in env_fn_wrapper.var])
+    handlers = {
+        cmd: getattr(state, cmd)
+        for cmd in (
+            "step",
+            "seed",
+            "reset",
+            "attach_shared_memory",
+            "render",
+            "get_spaces",
+            "env_method",
+            "get_attr",
+            "set_attr",
+            "is_wrapped",
+        )
+    }
     while True:
         try:
             cmd, data = remote.recv()
-            if cmd == "step":
-                observation, reward, done, info = env.step(data)
-                if done:
-                    # save final observation where user can get it, then reset
-                    info["terminal_observation"] = observation
-                    observation = env.reset()
-                remote.send((observation, reward, done, info))
-            elif cmd == "seed":
-                remote.send(env.seed(data))
-            elif cmd == "reset":
-                observation = env.reset()
-                remote.send(observation)
-            elif cmd == "render":
-                remote.send(env.render(data))
-            elif cmd == "close":
-                env.close()
+            if cmd == "close":
+                state.close()
                 remote.close()
                 break
-            elif cmd == "get_spaces":
-                remote.send((env.observation_space, env.action_space))
-            elif cmd == "env_method":
-                method = getattr(env, data[0])
-                remote.send(method(*data[1], **data[2]))
-            elif cmd == "get_attr":
-                remote.send(getattr(env, data))
-            elif cmd == "set_attr":
-                remote.send(setattr(env, data[0], data[1]))
-            elif cmd == "is_wrapped":
-                remote.send(is_wrapped(env, data))
-            else:
+            if cmd not in handlers:
                 raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+            remote.send(handlers[cmd](data))
         except EOFError:
             break
 
@@ -65,7 +168,8 @@ class SubprocVecEnv(VecEnv):
     process, allowing significant speed up when the environment is computationally complex.
 
     For performance reasons, if your environment is not IO bound, the number of environments should not exceed the
-    number of logical cores on your CPU.
+    number of logical cores on your CPU. For cheap environments, several of them can be stepped
+    in each process (``envs_per_worker``), with one message per process instead of one per environment.
 
     .. warning::
 
@@ -81,15 +185,45 @@ class SubprocVecEnv(VecEnv):
     :param start_method: method used to start the subprocesses.
            Must be one of the methods returned by multiprocessing.get_all_start_methods().
            Defaults to 'forkserver' on available platforms, and 'spawn' otherwise.
+    :param columnar_infos: Whether to return the infos as ``VecEnvInfos``
+        (columnar view of the infos, for many envs)
+    :param use_shared_memory: Whether the workers write the observations, rewards and dones
+        in shared memory arrays (``multiprocessing.shared_memory``, Python >= 3.8)
+        instead of sending them through the pipes. Only the infos are still pickled.
+        This avoids the serialization and stacking of large (e.g. image) observations,
+        which are then copied once out of the shared arrays.
+    :param envs_per_worker: Number of environments stepped one after the other by each process
+        (the last one may have less). The env indices of ``env_method()``, ``get_attr()``, ``set_attr()``
+        and ``env_is_wrapped()`` still refer to the environments.
     """
 
     def __init__(
-        self, env_fns: List[Callable[[], gym.Env]], start_method: Optional[str] = None
+        self,
+        env_fns: List[Callable[[], gym.Env]],
+        start_method: Optional[str] = None,
+        columnar_infos: bool = False,
+        use_shared_memory: bool = False,
+        envs_per_worker: int = 1,
     ):
+        assert (
+            not use_shared_memory or shared_memory is not None
+        ), "The shared memory transport requires Python >= 3.8 (multiprocessing.shared_memory)"
+        self.columnar_infos = columnar_infos
+        self.use_shared_memory = use_shared_memory
+        self.envs_per_worker = envs_per_worker
         self.waiting = False
         self.closed = False
         n_envs = len(env_fns)
 
+        assert envs_per_worker >= 1, "There must be at least one env per worker"
+        # Index of the first env of each worker, and worker and local index of each env
+        self._first_env_indices = list(range(0, n_envs, envs_per_worker))
+        self._env_to_worker = [
+            (env_idx // envs_per_worker, env_idx % envs_per_worker)
+            for env_idx in range(n_envs)
+        ]
+        n_workers = len(self._first_env_indices)
+
         if start_method is None:
             # Fork is not a thread safe method (see issue #217)
             # but is more user friendly (does not require to wrap the code in
@@ -97,13 +231,18 @@ class SubprocVecEnv(VecEnv):
             forkserver_available = "forkserver" in mp.get_all_start_methods()
             start_method = "forkserver" if forkserver_available else "spawn"
         ctx = mp.get_context(start_method)
+        if use_shared_memory:
+            # Forked workers must share the resource tracker of this process,
+            # otherwise their own tracker unlinks the shared memory blocks when they exit
+            resource_tracker.ensure_running()
 
-        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_workers)])
         self.processes = []
-        for work_remote, remote, env_fn in zip(
-            self.work_remotes, self.remotes, env_fns
+        for work_remote, remote, first_env_idx in zip(
+            self.work_remotes, self.remotes, self._first_env_indices
         ):
-            args = (work_remote, remote, CloudpickleWrapper(env_fn))
+            worker_env_fns = env_fns[first_env_idx : first_env_idx + envs_per_worker]
+            args = (work_remote, remote, CloudpickleWrapper(worker_env_fns))
             # daemon=True: if the main process crashes, we should not cause things to hang
             process = ctx.Process(
                 target=_worker, args=args, daemon=True
@@ -116,32 +255,101 @@ class SubprocVecEnv(VecEnv):
         observation_space, action_space = self.remotes[0].recv()
         VecEnv.__init__(self, len(env_fns), observation_space, action_space)
 
+        self._shared_memories, self._shared_arrays = {}, {}
+        if use_shared_memory:
+            self._create_shared_arrays()
+
+    def _create_shared_arrays(self) -> None:
+        """
+        Allocate the shared arrays of the observations (one per key, see ``obs_space_info()``),
+        rewards and dones of all the envs, and attach the workers to them.
+        """
+        keys, shapes, dtypes = obs_space_info(self.observation_space)
+        # ("observation", key) for each observation key, not to clash with reward and done
+        shapes = {("observation", key): shapes[key] for key in keys}
+        dtypes = {("observation", key): dtypes[key] for key in keys}
+        shapes["reward"], dtypes["reward"] = (), np.float64
+        shapes["done"], dtypes["done"] = (), bool
+        layout = {}
+        for field, shape in shapes.items():
+            shape = (self.num_envs,) + shape
+            nbytes = int(np.prod(shape)) * np.dtype(dtypes[field]).itemsize
+            memory = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+            self._shared_memories[field] = memory
+            self._shared_arrays[field] = np.ndarray(
+                shape, dtype=dtypes[field], buffer=memory.buf
+            )
+            layout[field] = (memory.name, shape, dtypes[field])
+        # The workers write the slots of their envs
+        for first_env_idx, remote in zip(self._first_env_indices, self.remotes):
+            remote.send(("attach_shared_memory", (first_env_idx, layout)))
+        for remote in self.remotes:
+            remote.recv()
+
+    def _get_shared_obs(self) -> VecEnvObs:
+        """
+        :return: Copy of the observations of all the envs, written by the workers
+        """
+        # Copied, as the workers overwrite them on the next step
+        obs = OrderedDict(
+            [
+                (field[1], array.copy())
+                for field, array in self._shared_arrays.items()
+                if field not in ("reward", "done")
+            ]
+        )
+        return dict_to_obs(self.observation_space, obs)
+
+    def _release_shared_memory(self) -> None:
+        # Drop the arrays before unmapping the blocks
+        self._shared_arrays.clear()
+        for memory in self._shared_memories.values():
+            memory.close()
+            memory.unlink()
+        self._shared_memories.clear()
+
     def step_async(self, actions: np.ndarray) -> None:
-        for remote, action in zip(self.remotes, actions):
-            remote.send(("step", action))
+        for remote, first_env_idx in zip(self.remotes, self._first_env_indices):
+            remote.send(
+                ("step", actions[first_env_idx : first_env_idx + self.envs_per_worker])
+            )
         self.waiting = True
 
+    def _recv_all(self) -> List[Any]:
+        """
+        :return: The results of all the envs, sent in one list by each worker
+        """
+        return [result for remote in self.remotes for result in remote.recv()]
+
     def step_wait(self) -> VecEnvStepReturn:
-        results = [remote.recv() for remote in self.remotes]
+        results = self._recv_all()
         self.waiting = False
-        obs, rews, dones, infos = zip(*results)
-        return (
-            _flatten_obs(obs, self.observation_space),
-            np.stack(rews),
-            np.stack(dones),
-            infos,
-        )
+        if self.use_shared_memory:
+            infos = results
+            obs = self._get_shared_obs()
+            rews = self._shared_arrays["reward"].copy()
+            dones = self._shared_arrays["done"].copy()
+        else:
+            obs, rews, dones, infos = zip(*results)
+            obs = _flatten_obs(obs, self.observation_space)
+            rews, dones = np.stack(rews), np.stack(dones)
+        if self.columnar_infos:
+            infos = VecEnvInfos(infos, dones)
+        return obs, rews, dones, infos
 
     def seed(self, seed: Optional[int] = None) -> List[Union[None, int]]:
-        for idx, remote in enumerate(self.remotes):
-            remote.send(("seed", seed + idx))
-        return [remote.recv() for remote in self.remotes]
+        for first_env_idx, remote in zip(self._first_env_indices, self.remotes):
+            remote.send(("seed", seed + first_env_idx))
+        return self._recv_all()
 
     def reset(self) -> VecEnvObs:
         for remote in self.remotes:
             remote.send(("reset", None))
-        obs = [remote.recv() for remote in self.remotes]
-        return _flatten_obs(obs, self.observation_space)
+        if self.use_shared_memory:
+            for remote in self.remotes:
+                remote.recv()
+            return self._get_shared_obs()
+        return _flatten_obs(self._recv_all(), self.observation_space)
 
     def close(self) -> None:
         if self.closed:
@@ -153,6 +361,7 @@ class SubprocVecEnv(VecEnv):
             remote.send(("close", None))
         for process in self.processes:
             process.join()
+        self._release_shared_memory()
         self.closed = True
 
     def get_images(self) -> Sequence[np.ndarray]:
@@ -160,25 +369,18 @@ class SubprocVecEnv(VecEnv):
             # gather images from subprocesses
             # `mode` will be taken into account later
             pipe.send(("render", "rgb_array"))
-        imgs = [pipe.recv() for pipe in self.remotes]
+        imgs = self._recv_all()
         return imgs
 
     def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
         """Return attribute from vectorized environment (see base class)."""
-        target_remotes = self._get_target_remotes(indices)
-        for remote in target_remotes:
-            remote.send(("get_attr", attr_name))
-        return [remote.recv() for remote in target_remotes]
+        return self._send_to_targets("get_attr", attr_name, indices)
 
     def set_attr(
         self, attr_name: str, value: Any, indices: VecEnvIndices = None
     ) -> None:
         """Set attribute inside vectorized environments (see base class)."""
-        target_remotes = self._get_target_remotes(indices)
-        for remote in target_remotes:
-            remote.send(("set_attr", (attr_name, value)))
-        for remote in target_remotes:
-            remote.recv()
+        self._send_to_targets("set_attr", (attr_name, value), indices)
 
     def env_method(
         self,
@@ -188,30 +390,52 @@ class SubprocVecEnv(VecEnv):
         **method_kwargs,
     ) -> List[Any]:
         """Call instance methods of vectorized environments."""
-        target_remotes = self._get_target_remotes(indices)
-        for remote in target_remotes:
-            remote.send(("env_method", (method_name, method_args, method_kwargs)))
-        return [remote.recv() for remote in target_remotes]
+        return self._send_to_targets(
+            "env_method", (method_name, method_args, method_kwargs), indices
+        )
 
     def env_is_wrapped(
         self, wrapper_class: Type[gym.Wrapper], indices: VecEnvIndices = None
     ) -> List[bool]:
         """Check if worker environments are wrapped with a given wrapper"""
-        target_remotes = self._get_target_remotes(indices)
-        for remote in target_remotes:
-            remote.send(("is_wrapped", wrapper_class))
-        return [remote.recv() for remote in target_remotes]
+        return self._send_to_targets("is_wrapped", wrapper_class, indices)
 
-    def _get_target_remotes(self, indices: VecEnvIndices) -> List[Any]:
+    def _get_target_remotes(
+        self, indices: VecEnvIndices
+    ) -> List[Tuple[Any, List[int]]]:
         """
         Get the connection object needed to communicate with the wanted
         envs that are in subprocesses.
 
         :param indices: refers to indices of envs.
-        :return: Connection object to communicate between processes.
+        :return: Connection object to communicate between processes,
+            and local indices of the wanted envs in that process.
+            Consecutive envs of the same process are grouped, in the order of ``indices``.
+        """
+        targets = []
+        for env_idx in self._get_indices(indices):
+            worker_idx, local_idx = self._env_to_worker[env_idx]
+            if len(targets) > 0 and targets[-1][0] is self.remotes[worker_idx]:
+                targets[-1][1].append(local_idx)
+            else:
+                targets.append((self.remotes[worker_idx], [local_idx]))
+        return targets
+
+    def _send_to_targets(
+        self, cmd: str, data: Any, indices: VecEnvIndices
+    ) -> List[Any]:
+        """
+        Send a command to the wanted envs, with one message per group of envs of the same process.
+
+        :param cmd: Command of the worker
+        :param data: Argument of the command
+        :param indices: refers to indices of envs.
+        :return: Result of the command for each env, in the order of ``indices``
         """
-        indices = self._get_indices(indices)
-        return [self.remotes[i] for i in indices]
+        targets = self._get_target_remotes(indices)
+        for remote, local_indices in targets:
+            remote.send((cmd, (local_indices, data)))
+        return [result for remote, _ in targets for result in remote.recv()]
 
 
 def _flatten_obs(
@@ -0,0 +1,141 @@
+from typing import Any, Dict, Iterable, Optional, Sequence, Union
+
+import numpy as np
+
+
+class VecEnvInfos(list):
+    """
+    Infos returned by ``VecEnv.step()`` in columnar mode.
+
+    It is the usual list with one info dict per env (compatibility view),
+    that also exposes the entries read by the training loop on every step
+    (``TimeLimit.truncated``, ``terminal_observation``, ``episode`` and ``is_success``)
+    as NumPy arrays over the envs. Those entries are only set at the end of an episode,
+    so each column is computed once, on first access, from the envs whose episode ended
+    instead of walking the dicts of all the envs in each consumer.
+    The dicts must therefore not be modified after a column was read.
+
+    :param infos: Info dict of each env
+    :param dones: Termination signal of each env
+    """
+
+    def __init__(self, infos: Iterable[Dict[str, Any]], dones: np.ndarray):
+        super(VecEnvInfos, self).__init__(infos)
+        self.dones = np.asarray(dones, dtype=bool)
+        self.done_indices = np.flatnonzero(self.dones)
+        self._columns = {}
+
+    def _column(self, key: str, default: Any, dtype: Any) -> np.ndarray:
+        """
+        :param key: Key of the info dicts
+        :param default: Value of the envs whose episode did not end or without that key
+        :param dtype: Data type of the column
+        :return: The value of ``key`` for each env
+        """
+        if key not in self._columns:
+            column = np.full(len(self), default, dtype=dtype)
+            for idx in self.done_indices:
+                value = self[idx].get(key)
+                if value is not None:
+                    column[idx] = value
+            self._columns[key] = column
+        return self._columns[key]
+
+    @property
+    def timeouts(self) -> np.ndarray:
+        """
+        :return: Whether each env was truncated by a time limit (``TimeLimit.truncated``)
+        """
+        return self._column("TimeLimit.truncated", False, bool)
+
+    @property
+    def is_success(self) -> np.ndarray:
+        """
+        :return: Success of the episode of each env (``is_success``),
+            ``NaN`` when the episode did not end or the info is not provided
+        """
+        return self._column("is_success", np.nan, np.float64)
+
+    @property
+    def episode_indices(self) -> np.ndarray:
+        """
+        :return: Index of the envs with episode statistics (``episode``, set by ``Monitor``)
+        """
+        if "episode_indices" not in self._columns:
+            self._columns["episode_indices"] = np.array(
+                [idx for idx in self.done_indices if "episode" in self[idx]],
+                dtype=np.int64,
+            )
+        return self._columns["episode_indices"]
+
+    @property
+    def episode_rewards(self) -> np.ndarray:
+        """
+        :return: Return of the episodes, aligned with ``episode_indices``
+        """
+        return self._episode_column("r", np.float64)
+
+    @property
+    def episode_lengths(self) -> np.ndarray:
+        """
+        :return: Length of the episodes, aligned with ``episode_indices``
+        """
+        return self._episode_column("l", np.int64)
+
+    def _episode_column(self, key: str, dtype: Any) -> np.ndarray:
+        if f"episode.{key}" not in self._columns:
+            self._columns[f"episode.{key}"] = np.array(
+                [self[idx]["episode"][key] for idx in self.episode_indices],
+                dtype=dtype,
+            )
+        return self._columns[f"episode.{key}"]
+
+    @property
+    def terminal_indices(self) -> np.ndarray:
+        """
+        :return: Index of the envs with a terminal observation
+        """
+        if "terminal_indices" not in self._columns:
+            self._columns["terminal_indices"] = np.array(
+                [
+                    idx
+                    for idx in self.done_indices
+                    if self[idx].get("terminal_observation") is not None
+                ],
+                dtype=np.int64,
+            )
+        return self._columns["terminal_indices"]
+
+    @property
+    def terminal_observations(
+        self,
+    ) -> Optional[Union[np.ndarray, Dict[str, np.ndarray]]]:
+        """
+        :return: Terminal observations (``terminal_observation``) stacked along a first axis
+            aligned with ``terminal_indices``, ``None`` when no env has one
+        """
+        if "terminal_observation" not in self._columns:
+            observations = [
+                self[idx]["terminal_observation"] for idx in self.terminal_indices
+            ]
+            if len(observations) == 0:
+                stacked = None
+            elif isinstance(observations[0], dict):
+                stacked = {
+                    key: np.stack([obs[key] for obs in observations])
+                    for key in observations[0].keys()
+                }
+            else:
+                stacked = np.stack(observations)
+            self._columns["terminal_observation"] = stacked
+        return self._columns["terminal_observation"]
+
+
+def get_timeouts(infos: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """
+    :param infos: Info dict of each env, in columnar mode (``VecEnvInfos``) or not
+    :return: Whether each env was truncated by a time limit (``TimeLimit.truncated``)
+    """
+    if isinstance(infos, VecEnvInfos):
+        return infos.timeouts
+    return np.array([info.get("TimeLimit.truncated", False) for info in infos])
@@ -6,6 +6,7 @@ import numpy as np
 from stable_baselines3.common.vec_env.base_vec_env import (VecEnv, VecEnvObs,
                                                            VecEnvStepReturn,
                                                            VecEnvWrapper)
+from stable_baselines3.common.vec_env.vec_env_infos import VecEnvInfos
 
 
 class VecMonitor(VecEnvWrapper):
@@ -97,6 +98,9 @@ class VecMonitor(VecEnvWrapper):
                 if self.results_writer:
                     self.results_writer.write_row(episode_info)
                 new_infos[i] = info
+        if isinstance(infos, VecEnvInfos):
+            # Keep the columnar view
+            new_infos = VecEnvInfos(new_infos, dones)
         return obs, rewards, dones, new_infos
 
     def close(self) -> None:
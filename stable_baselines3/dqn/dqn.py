@@ -4,7 +4,8 @@ from typing import Any, Dict, List, Optional, Tuple, Type, Union
 import gym
 import numpy as np
 import torch as th
-from stable_baselines3.common.buffers import ReplayBuffer
+from stable_baselines3.common.buffers import (PrioritizedReplayBuffer,
+                                              ReplayBuffer)
 from stable_baselines3.common.off_policy_algorithm import OffPolicyAlgorithm
 from stable_baselines3.common.preprocessing import maybe_transpose
 from stable_baselines3.common.type_aliases import (GymEnv, MaybeCallback,
@@ -183,11 +184,8 @@ class DQN(OffPolicyAlgorithm):
         self._update_learning_rate(self.policy.optimizer)
 
         losses = []
-        for _ in range(gradient_steps):
-            # Sample replay buffer
-            replay_data = self.replay_buffer.sample(
-                batch_size, env=self._vec_normalize_env
-            )
+        # Sample the batches of all the gradient steps at once
+        for replay_data in self._sample_batches(gradient_steps, batch_size):
 
             with th.no_grad():
                 # Compute the next Q-values using the target network
@@ -196,10 +194,12 @@ class DQN(OffPolicyAlgorithm):
                 next_q_values, _ = next_q_values.max(dim=1)
                 # Avoid potential broadcast issue
                 next_q_values = next_q_values.reshape(-1, 1)
-                # 1-step TD target
+                # Discount of the bootstrapped values (gamma ** n for n-step transitions)
+                discounts = self._discounts(replay_data)
+                # TD target
                 target_q_values = (
                     replay_data.rewards
-                    + (1 - replay_data.dones) * self.gamma * next_q_values
+                    + (1 - replay_data.dones) * discounts * next_q_values
                 )
 
             # Get current Q-values estimates
@@ -210,8 +210,19 @@ class DQN(OffPolicyAlgorithm):
                 current_q_values, dim=1, index=replay_data.actions.long()
             )
 
-            # Compute Huber loss (less sensitive to outliers)
-            loss = F.smooth_l1_loss(current_q_values, target_q_values)
+            if isinstance(self.replay_buffer, PrioritizedReplayBuffer):
+                # Weight the Huber loss by the importance sampling weights
+                # and use the TD errors as new priorities
+                elementwise_loss = F.smooth_l1_loss(
+                    current_q_values, target_q_values, reduction="none"
+                )
+                loss = (replay_data.weights * elementwise_loss).mean()
+                self.replay_buffer.update_priorities(
+                    replay_data.indices, current_q_values - target_q_values
+                )
+            else:
+                # Compute Huber loss (less sensitive to outliers)
+                loss = F.smooth_l1_loss(current_q_values, target_q_values)
             losses.append(loss.item())
 
             # Optimize the policy
@@ -1,13 +1,13 @@
 import warnings
 from collections import deque
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import torch as th
 from stable_baselines3.common.buffers import DictReplayBuffer
 from stable_baselines3.common.preprocessing import get_obs_shape
 from stable_baselines3.common.type_aliases import DictReplayBufferSamples
-from stable_baselines3.common.vec_env import VecEnv, VecNormalize
+from stable_baselines3.common.vec_env import VecEnv, VecNormalize, get_timeouts
 from stable_baselines3.her.goal_selection_strategy import (
     KEY_TO_GOAL_STRATEGY, GoalSelectionStrategy)
 
@@ -55,6 +55,12 @@ class HerReplayBuffer(DictReplayBuffer):
     In the online sampling case, these new transitions will not be saved in the replay buffer
     and will only be created at sampling time.
 
+    Each env of the ``VecEnv`` has its own episode in progress, which is stored
+    (and can be sampled) once it is over. The next observation of a transition
+    is not stored separately: it is the observation of the following transition
+    of the episode, or an extra entry for the last one. With offline sampling, the given ``replay_buffer``
+    must have a single env: the real transitions of the envs are stored one after the other.
+
     :param env: The training environment
     :param buffer_size: The size of the buffer measured in transitions.
     :param max_episode_length: The maximum length of an episode. If not specified,
@@ -67,6 +73,18 @@ class HerReplayBuffer(DictReplayBuffer):
     :param handle_timeout_termination: Handle timeout termination (due to timelimit)
         separately and treat the task as infinite horizon task.
         https://github.com/DLR-RM/stable-baselines3/issues/284
+    :param info_keys: Entries of the info dicts used by ``compute_reward()``.
+        Only those are stored, in preallocated arrays, and ``compute_reward()`` then receives
+        a dict with the batch of values of each entry instead of an array of info dicts.
+        Use an empty list when ``compute_reward()`` ignores the infos (e.g. ``BitFlippingEnv``).
+        By default, the info dicts are stored as is.
+    :param compute_reward: Vectorized reward function, with the signature of ``compute_reward()``,
+        evaluated in the process of the buffer on the sampled goals.
+        Use ``"env"`` to fetch ``compute_reward()`` once from the (first) env,
+        which must then be picklable when using a ``SubprocVecEnv``
+        and its reward must only depend on the arguments.
+        By default, ``compute_reward()`` is called through ``env_method()``,
+        which requires a round-trip to the env process for each sample with a ``SubprocVecEnv``.
     """
 
     def __init__(
@@ -80,6 +98,8 @@ class HerReplayBuffer(DictReplayBuffer):
         goal_selection_strategy: Union[GoalSelectionStrategy, str] = "future",
         online_sampling: bool = True,
         handle_timeout_termination: bool = True,
+        info_keys: Optional[List[str]] = None,
+        compute_reward: Optional[Union[Callable, str]] = None,
     ):
 
         super(HerReplayBuffer, self).__init__(
@@ -113,8 +133,22 @@ class HerReplayBuffer(DictReplayBuffer):
         self.env = env
         self.buffer_size = her_buffer_size
 
+        assert (
+            compute_reward is None
+            or callable(compute_reward)
+            or compute_reward == "env"
+        ), (
+            f"Invalid compute_reward {compute_reward}, "
+            "please use a callable, 'env' or None"
+        )
+        self.compute_reward = compute_reward
+        self._compute_reward_fn = self._get_compute_reward_fn()
+
         if online_sampling:
             replay_buffer = None
+        assert (
+            replay_buffer is None or replay_buffer.n_envs == 1
+        ), "The replay buffer used for offline sampling must have a single env"
         self.replay_buffer = replay_buffer
         self.online_sampling = online_sampling
 
@@ -125,9 +159,10 @@ class HerReplayBuffer(DictReplayBuffer):
         # buffer with episodes
         # number of episodes which can be stored until buffer size is reached
         self.max_episode_stored = self.buffer_size // self.max_episode_length
-        self.current_idx = 0
+        # Index of the next transition in the current episode of each env
+        self.current_idx = np.zeros(self.n_envs, dtype=np.int64)
         # Counter to prevent overflow
-        self.episode_steps = 0
+        self.episode_steps = np.zeros(self.n_envs, dtype=np.int64)
 
         # Get shape of observation and goal (usually the same)
         self.obs_shape = get_obs_shape(self.env.observation_space.spaces["observation"])
@@ -136,30 +171,46 @@ class HerReplayBuffer(DictReplayBuffer):
         )
 
         # input dimensions for buffer initialization
+        # (each stored episode comes from a single env)
         input_shape = {
-            "observation": (self.env.num_envs,) + self.obs_shape,
-            "achieved_goal": (self.env.num_envs,) + self.goal_shape,
-            "desired_goal": (self.env.num_envs,) + self.goal_shape,
+            "observation": (1,) + self.obs_shape,
+            "achieved_goal": (1,) + self.goal_shape,
+            "desired_goal": (1,) + self.goal_shape,
             "action": (self.action_dim,),
             "reward": (1,),
-            "next_obs": (self.env.num_envs,) + self.obs_shape,
-            "next_achieved_goal": (self.env.num_envs,) + self.goal_shape,
-            "next_desired_goal": (self.env.num_envs,) + self.goal_shape,
             "done": (1,),
         }
         self._observation_keys = ["observation", "achieved_goal", "desired_goal"]
+        # The next observation of a transition is the observation of the following one,
+        # the observations have one more entry per episode for the last next observation
+        n_entries = {
+            key: self.max_episode_length + int(key in self._observation_keys)
+            for key in input_shape.keys()
+        }
         self._buffer = {
             key: np.zeros(
-                (self.max_episode_stored, self.max_episode_length, *dim),
-                dtype=np.float32,
+                (self.max_episode_stored, n_entries[key], *dim), dtype=np.float32
             )
             for key, dim in input_shape.items()
         }
+        # Episode in progress of each env, copied to the storage above once over
+        self._current_episodes = {
+            key: np.zeros((self.n_envs, n_entries[key], *dim), dtype=np.float32)
+            for key, dim in input_shape.items()
+        }
         # Store info dicts are it can be used to compute the reward (e.g. continuity cost)
-        self.info_buffer = [
-            deque(maxlen=self.max_episode_length)
-            for _ in range(self.max_episode_stored)
-        ]
+        self.info_keys = info_keys
+        if info_keys is None:
+            self.info_buffer = [
+                deque(maxlen=self.max_episode_length)
+                for _ in range(self.max_episode_stored)
+            ]
+        else:
+            self.info_buffer = None
+        self._current_infos = [[] for _ in range(self.n_envs)]
+        # Declared info entries, allocated with the shape and dtype of their first value
+        # (same layout as ``_buffer`` and ``_current_episodes``)
+        self._info_arrays, self._current_info_arrays = {}, {}
         # episode length storage, needed for episodes which has less steps than the maximum length
         self.episode_lengths = np.zeros(self.max_episode_stored, dtype=np.int64)
 
@@ -173,6 +224,8 @@ class HerReplayBuffer(DictReplayBuffer):
         state = self.__dict__.copy()
         # these attributes are not pickleable
         del state["env"]
+        # fetched again from the env in ``set_env()``
+        del state["_compute_reward_fn"]
         return state
 
     def __setstate__(self, state: Dict[str, Any]) -> None:
@@ -186,6 +239,7 @@ class HerReplayBuffer(DictReplayBuffer):
         self.__dict__.update(state)
         assert "env" not in state
         self.env = None
+        self._compute_reward_fn = None
 
     def set_env(self, env: VecEnv) -> None:
         """
@@ -197,6 +251,17 @@ class HerReplayBuffer(DictReplayBuffer):
             raise ValueError("Trying to set env of already initialized environment.")
 
         self.env = env
+        self._compute_reward_fn = self._get_compute_reward_fn()
+
+    def _get_compute_reward_fn(self) -> Optional[Callable]:
+        """
+        :return: The reward function evaluated locally,
+            ``None`` when ``compute_reward()`` is called through ``env_method()``
+        """
+        if self.compute_reward == "env":
+            # the reward function is the same for all the envs
+            return self.env.get_attr("compute_reward", indices=[0])[0]
+        return self.compute_reward
 
     def _get_samples(
         self, batch_inds: np.ndarray, env: Optional[VecNormalize] = None
@@ -312,15 +377,8 @@ class HerReplayBuffer(DictReplayBuffer):
             assert (
                 batch_size is not None
             ), "No batch_size specified for online sampling of HER transitions"
-            # Do not sample the episode with index `self.pos` as the episode is invalid
-            if self.full:
-                episode_indices = (
-                    np.random.randint(1, self.n_episodes_stored, batch_size) + self.pos
-                ) % self.n_episodes_stored
-            else:
-                episode_indices = np.random.randint(
-                    0, self.n_episodes_stored, batch_size
-                )
+            # Only finished episodes are stored, they can all be sampled
+            episode_indices = np.random.randint(0, self.n_episodes_stored, batch_size)
             # A subset of the transitions will be relabeled using HER algorithm
             her_indices = np.arange(batch_size)[: int(self.her_ratio * batch_size)]
         else:
@@ -369,38 +427,65 @@ class HerReplayBuffer(DictReplayBuffer):
             key: self._buffer[key][episode_indices, transitions_indices].copy()
             for key in self._buffer.keys()
         }
+        # and their next observation, stored as the following entry
+        next_transitions_indices = transitions_indices + 1
+        transitions["next_obs"] = self._buffer["observation"][
+            episode_indices, next_transitions_indices
+        ]
+        transitions["next_achieved_goal"] = self._buffer["achieved_goal"][
+            episode_indices, next_transitions_indices
+        ]
 
         # sample new desired goals and relabel the transitions
         new_goals = self.sample_goals(episode_indices, her_indices, transitions_indices)
         transitions["desired_goal"][her_indices] = new_goals
 
-        # Convert info buffer to numpy array
-        transitions["info"] = np.array(
-            [
-                self.info_buffer[episode_idx][transition_idx]
-                for episode_idx, transition_idx in zip(
-                    episode_indices, transitions_indices
-                )
-            ]
-        )
-
         # Edge case: episode of one timesteps with the future strategy
         # no virtual transition can be created
         if len(her_indices) > 0:
-            # Vectorized computation of the new reward
-            transitions["reward"][her_indices, 0] = self.env.env_method(
-                "compute_reward",
-                # the new state depends on the previous state and action
-                # s_{t+1} = f(s_t, a_t)
-                # so the next_achieved_goal depends also on the previous state and action
-                # because we are in a GoalEnv:
-                # r_t = reward(s_t, a_t) = reward(next_achieved_goal, desired_goal)
-                # therefore we have to use "next_achieved_goal" and not "achieved_goal"
+            her_episode_indices = episode_indices[her_indices]
+            her_transitions_indices = transitions_indices[her_indices]
+            if self.info_keys is None:
+                # Convert info buffer to numpy array
+                infos = np.array(
+                    [
+                        self.info_buffer[episode_idx][transition_idx]
+                        for episode_idx, transition_idx in zip(
+                            her_episode_indices, her_transitions_indices
+                        )
+                    ]
+                )[:, 0]
+            else:
+                infos = {
+                    key: self._info_arrays[key][
+                        her_episode_indices, her_transitions_indices, 0
+                    ]
+                    for key in self.info_keys
+                }
+            # the new state depends on the previous state and action
+            # s_{t+1} = f(s_t, a_t)
+            # so the next_achieved_goal depends also on the previous state and action
+            # because we are in a GoalEnv:
+            # r_t = reward(s_t, a_t) = reward(next_achieved_goal, desired_goal)
+            # therefore we have to use "next_achieved_goal" and not "achieved_goal"
+            # (and here we use the new desired goal)
+            reward_args = (
                 transitions["next_achieved_goal"][her_indices, 0],
-                # here we use the new desired goal
                 transitions["desired_goal"][her_indices, 0],
-                transitions["info"][her_indices, 0],
+                infos,
             )
+            # Vectorized computation of the new reward
+            if self._compute_reward_fn is not None:
+                transitions["reward"][her_indices, 0] = self._compute_reward_fn(
+                    *reward_args
+                )
+            else:
+                transitions["reward"][her_indices, 0] = self.env.env_method(
+                    "compute_reward",
+                    *reward_args,
+                    # the reward function is the same for all the envs
+                    indices=[0],
+                )[0]
 
         # concatenate observation with (desired) goal
         observations = self._normalize_obs(transitions, maybe_vec_env)
@@ -452,68 +537,115 @@ class HerReplayBuffer(DictReplayBuffer):
         infos: List[Dict[str, Any]],
     ) -> None:
 
-        if self.current_idx == 0 and self.full:
-            # Clear info buffer
-            self.info_buffer[self.pos] = deque(maxlen=self.max_episode_length)
-
         # Remove termination signals due to timeout
         if self.handle_timeout_termination:
-            done_ = done * (
-                1 - np.array([info.get("TimeLimit.truncated", False) for info in infos])
-            )
+            done_ = done * (1 - get_timeouts(infos))
         else:
             done_ = done
 
-        self._buffer["observation"][self.pos][self.current_idx] = obs["observation"]
-        self._buffer["achieved_goal"][self.pos][self.current_idx] = obs["achieved_goal"]
-        self._buffer["desired_goal"][self.pos][self.current_idx] = obs["desired_goal"]
-        self._buffer["action"][self.pos][self.current_idx] = action
-        self._buffer["done"][self.pos][self.current_idx] = done_
-        self._buffer["reward"][self.pos][self.current_idx] = reward
-        self._buffer["next_obs"][self.pos][self.current_idx] = next_obs["observation"]
-        self._buffer["next_achieved_goal"][self.pos][self.current_idx] = next_obs[
-            "achieved_goal"
-        ]
-        self._buffer["next_desired_goal"][self.pos][self.current_idx] = next_obs[
-            "desired_goal"
-        ]
+        # Write the transition of each env in its current episode
+        transition = {
+            "observation": obs["observation"],
+            "achieved_goal": obs["achieved_goal"],
+            "desired_goal": obs["desired_goal"],
+            "action": action,
+            "done": done_,
+            "reward": reward,
+        }
+        env_indices = np.arange(self.n_envs)
+        for key, value in transition.items():
+            episodes = self._current_episodes[key]
+            episodes[env_indices, self.current_idx] = np.reshape(
+                value, (self.n_envs,) + episodes.shape[2:]
+            )
+        # The next observation goes to the following entry, where it is overwritten
+        # by the (same) observation of the next transition if the episode continues
+        for key in self._observation_keys:
+            episodes = self._current_episodes[key]
+            episodes[env_indices, self.current_idx + 1] = np.reshape(
+                next_obs[key], (self.n_envs,) + episodes.shape[2:]
+            )
 
         # When doing offline sampling
         # Add real transition to normal replay buffer
         if self.replay_buffer is not None:
-            self.replay_buffer.add(
-                obs,
-                next_obs,
-                action,
-                reward,
-                done,
-                infos,
+            # The replay buffer has a single env,
+            # the transitions of the envs are added as a batch of steps
+            self.replay_buffer.extend(
+                obs, next_obs, action, reward, done, infos=[[info] for info in infos]
             )
 
-        self.info_buffer[self.pos].append(infos)
+        if self.info_keys is None:
+            for env_idx, info in enumerate(infos):
+                self._current_infos[env_idx].append([info])
+        else:
+            self._add_info_entries(infos)
 
         # update current pointer
         self.current_idx += 1
 
         self.episode_steps += 1
 
-        if done or self.episode_steps >= self.max_episode_length:
-            self.store_episode()
+        episode_ends = np.logical_or(
+            done, self.episode_steps >= self.max_episode_length
+        )
+        for env_idx in np.flatnonzero(episode_ends):
+            self.store_episode(env_idx)
             if not self.online_sampling:
                 # sample virtual transitions and store them in replay buffer
                 self._sample_her_transitions()
-                # clear storage for current episode
-                self.reset()
+                # clear storage for the episode
+                self._clear_stored_episodes()
+
+            self.episode_steps[env_idx] = 0
 
-            self.episode_steps = 0
+    def _add_info_entries(self, infos: List[Dict[str, Any]]) -> None:
+        """
+        Store the declared entries of the info dicts of the current transition.
 
-    def store_episode(self) -> None:
+        :param infos: Info dict of each env
         """
-        Increment episode counter
-        and reset transition pointer.
+        for key in self.info_keys:
+            # One value per env, with the layout of a stored transition
+            values = np.array([[info[key]] for info in infos])
+            if key not in self._info_arrays:
+                for arrays, n_episodes in [
+                    (self._info_arrays, self.max_episode_stored),
+                    (self._current_info_arrays, self.n_envs),
+                ]:
+                    arrays[key] = np.zeros(
+                        (n_episodes, self.max_episode_length) + values.shape[1:],
+                        dtype=values.dtype,
+                    )
+            self._current_info_arrays[key][
+                np.arange(self.n_envs), self.current_idx
+            ] = values
+
+    def store_episode(self, env_idx: int = 0) -> None:
         """
+        Copy the current episode of an env to the episode storage,
+        increment episode counter and reset the transition pointer of that env.
+
+        :param env_idx: Index of the env whose episode is over
+        """
+        episode_length = self.current_idx[env_idx]
+        for storage, current_episodes in [
+            (self._buffer, self._current_episodes),
+            (self._info_arrays, self._current_info_arrays),
+        ]:
+            for key, episodes in current_episodes.items():
+                # With the last next observation for the observation keys
+                storage[key][self.pos, : episode_length + 1] = episodes[
+                    env_idx, : episode_length + 1
+                ]
+        if self.info_buffer is not None:
+            self.info_buffer[self.pos] = deque(
+                self._current_infos[env_idx], maxlen=self.max_episode_length
+            )
+        self._current_infos[env_idx] = []
+
         # add episode length to length storage
-        self.episode_lengths[self.pos] = self.current_idx
+        self.episode_lengths[self.pos] = episode_length
 
         # update current episode pointer
         # Note: in the OpenAI implementation
@@ -524,7 +656,7 @@ class HerReplayBuffer(DictReplayBuffer):
             self.full = True
             self.pos = 0
         # reset transition pointer
-        self.current_idx = 0
+        self.current_idx[env_idx] = 0
 
     def _sample_her_transitions(self) -> None:
         """
@@ -537,18 +669,18 @@ class HerReplayBuffer(DictReplayBuffer):
             n_sampled_goal=self.n_sampled_goal
         )
 
-        # Store virtual transitions in the replay buffer, if available
+        # Store virtual transitions in the replay buffer, if available,
+        # all at once: they are a batch of steps of the single env of the replay buffer
         if len(observations) > 0:
-            for i in range(len(observations["observation"])):
-                self.replay_buffer.add(
-                    {key: obs[i] for key, obs in observations.items()},
-                    {key: next_obs[i] for key, next_obs in next_observations.items()},
-                    actions[i],
-                    rewards[i],
-                    # We consider the transition as non-terminal
-                    done=[False],
-                    infos=[{}],
-                )
+            self.replay_buffer.extend(
+                observations,
+                next_observations,
+                actions,
+                rewards,
+                # We consider the transitions as non-terminal
+                done=np.zeros(len(rewards)),
+                infos=None,
+            )
 
     @property
     def n_episodes_stored(self) -> int:
@@ -564,10 +696,18 @@ class HerReplayBuffer(DictReplayBuffer):
 
     def reset(self) -> None:
         """
-        Reset the buffer.
+        Reset the buffer, including the episodes in progress.
+        """
+        self._clear_stored_episodes()
+        self.current_idx = np.zeros(self.n_envs, dtype=np.int64)
+        self.episode_steps = np.zeros(self.n_envs, dtype=np.int64)
+        self._current_infos = [[] for _ in range(self.n_envs)]
+
+    def _clear_stored_episodes(self) -> None:
+        """
+        Remove the finished episodes (the episodes in progress are kept).
         """
         self.pos = 0
-        self.current_idx = 0
         self.full = False
         self.episode_lengths = np.zeros(self.max_episode_stored, dtype=np.int64)
 
@@ -579,27 +719,21 @@ class HerReplayBuffer(DictReplayBuffer):
         If not called, we assume that we continue the same trajectory (same episode).
         """
         # If we are at the start of an episode, no need to truncate
-        current_idx = self.current_idx
+        env_indices = np.flatnonzero(self.current_idx > 0)
 
-        # truncate interrupted episode
-        if current_idx > 0:
+        # truncate interrupted episodes
+        if len(env_indices) > 0:
             warnings.warn(
                 "The last trajectory in the replay buffer will be truncated.\n"
                 "If you are in the same episode as when the replay buffer was saved,\n"
                 "you should use `truncate_last_trajectory=False` to avoid that issue."
             )
-            # get current episode and transition index
-            pos = self.pos
-            # set episode length for current episode
-            self.episode_lengths[pos] = current_idx
-            # set done = True for current episode
-            # current_idx was already incremented
-            self._buffer["done"][pos][current_idx - 1] = np.array(
-                [True], dtype=np.float32
-            )
-            # reset current transition index
-            self.current_idx = 0
-            # increment episode counter
-            self.pos = (self.pos + 1) % self.max_episode_stored
-            # update "full" indicator
-            self.full = self.full or self.pos == 0
+            for env_idx in env_indices:
+                # set done = True for the last transition of the current episode
+                # current_idx was already incremented
+                self._current_episodes["done"][
+                    env_idx, self.current_idx[env_idx] - 1
+                ] = 1.0
+                # store it and start a new one
+                self.store_episode(env_idx)
+                self.episode_steps[env_idx] = 0
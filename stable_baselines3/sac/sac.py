@@ -3,7 +3,8 @@ from typing import Any, Dict, List, Optional, Tuple, Type, Union
 import gym
 import numpy as np
 import torch as th
-from stable_baselines3.common.buffers import ReplayBuffer
+from stable_baselines3.common.buffers import (PrioritizedReplayBuffer,
+                                              ReplayBuffer)
 from stable_baselines3.common.noise import ActionNoise
 from stable_baselines3.common.off_policy_algorithm import OffPolicyAlgorithm
 from stable_baselines3.common.type_aliases import (GymEnv, MaybeCallback,
@@ -202,11 +203,10 @@ class SAC(OffPolicyAlgorithm):
         ent_coef_losses, ent_coefs = [], []
         actor_losses, critic_losses = [], []
 
-        for gradient_step in range(gradient_steps):
-            # Sample replay buffer
-            replay_data = self.replay_buffer.sample(
-                batch_size, env=self._vec_normalize_env
-            )
+        # Sample the batches of all the gradient steps at once
+        for gradient_step, replay_data in enumerate(
+            self._sample_batches(gradient_steps, batch_size)
+        ):
 
             # We need to sample because `log_std` may have changed between two gradient steps
             if self.use_sde:
@@ -251,10 +251,12 @@ class SAC(OffPolicyAlgorithm):
                 next_q_values, _ = th.min(next_q_values, dim=1, keepdim=True)
                 # add entropy term
                 next_q_values = next_q_values - ent_coef * next_log_prob.reshape(-1, 1)
+                # Discount of the bootstrapped values (gamma ** n for n-step transitions)
+                discounts = self._discounts(replay_data)
                 # td error + entropy term
                 target_q_values = (
                     replay_data.rewards
-                    + (1 - replay_data.dones) * self.gamma * next_q_values
+                    + (1 - replay_data.dones) * discounts * next_q_values
                 )
 
             # Get current Q-values estimates for each critic network
@@ -264,12 +266,29 @@ class SAC(OffPolicyAlgorithm):
             )
 
             # Compute critic loss
-            critic_loss = 0.5 * sum(
-                [
-                    F.mse_loss(current_q, target_q_values)
-                    for current_q in current_q_values
-                ]
-            )
+            if isinstance(self.replay_buffer, PrioritizedReplayBuffer):
+                # Weight the loss by the importance sampling weights
+                # and use the mean TD error over the critics as new priorities
+                critic_loss = 0.5 * sum(
+                    [
+                        (
+                            replay_data.weights
+                            * F.mse_loss(current_q, target_q_values, reduction="none")
+                        ).mean()
+                        for current_q in current_q_values
+                    ]
+                )
+                td_errors = th.cat(current_q_values, dim=1) - target_q_values
+                self.replay_buffer.update_priorities(
+                    replay_data.indices, td_errors.abs().mean(dim=1)
+                )
+            else:
+                critic_loss = 0.5 * sum(
+                    [
+                        F.mse_loss(current_q, target_q_values)
+                        for current_q in current_q_values
+                    ]
+                )
             critic_losses.append(critic_loss.item())
 
             # Optimize the critic
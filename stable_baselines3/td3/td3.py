@@ -3,7 +3,8 @@ from typing import Any, Dict, List, Optional, Tuple, Type, Union
 import gym
 import numpy as np
 import torch as th
-from stable_baselines3.common.buffers import ReplayBuffer
+from stable_baselines3.common.buffers import (PrioritizedReplayBuffer,
+                                              ReplayBuffer)
 from stable_baselines3.common.noise import ActionNoise
 from stable_baselines3.common.off_policy_algorithm import OffPolicyAlgorithm
 from stable_baselines3.common.type_aliases import (GymEnv, MaybeCallback,
@@ -141,13 +142,10 @@ class TD3(OffPolicyAlgorithm):
 
         actor_losses, critic_losses = [], []
 
-        for _ in range(gradient_steps):
+        # Sample the batches of all the gradient steps at once
+        for replay_data in self._sample_batches(gradient_steps, batch_size):
 
             self._n_updates += 1
-            # Sample replay buffer
-            replay_data = self.replay_buffer.sample(
-                batch_size, env=self._vec_normalize_env
-            )
 
             with th.no_grad():
                 # Select action according to policy and add clipped noise
@@ -165,9 +163,11 @@ class TD3(OffPolicyAlgorithm):
                     dim=1,
                 )
                 next_q_values, _ = th.min(next_q_values, dim=1, keepdim=True)
+                # Discount of the bootstrapped values (gamma ** n for n-step transitions)
+                discounts = self._discounts(replay_data)
                 target_q_values = (
                     replay_data.rewards
-                    + (1 - replay_data.dones) * self.gamma * next_q_values
+                    + (1 - replay_data.dones) * discounts * next_q_values
                 )
 
             # Get current Q-values estimates for each critic network
@@ -176,12 +176,29 @@ class TD3(OffPolicyAlgorithm):
             )
 
             # Compute critic loss
-            critic_loss = sum(
-                [
-                    F.mse_loss(current_q, target_q_values)
-                    for current_q in current_q_values
-                ]
-            )
+            if isinstance(self.replay_buffer, PrioritizedReplayBuffer):
+                # Weight the loss by the importance sampling weights
+                # and use the mean TD error over the critics as new priorities
+                critic_loss = sum(
+                    [
+                        (
+                            replay_data.weights
+                            * F.mse_loss(current_q, target_q_values, reduction="none")
+                        ).mean()
+                        for current_q in current_q_values
+                    ]
+                )
+                td_errors = th.cat(current_q_values, dim=1) - target_q_values
+                self.replay_buffer.update_priorities(
+                    replay_data.indices, td_errors.abs().mean(dim=1)
+                )
+            else:
+                critic_loss = sum(
+                    [
+                        F.mse_loss(current_q, target_q_values)
+                        for current_q in current_q_values
+                    ]
+                )
             critic_losses.append(critic_loss.item())
 
             # Optimize the critics
@@ -0,0 +1,1078 @@
+import multiprocessing
+import os
+import pickle
+import time
+from copy import deepcopy
+
+import gym
+import numpy as np
+import pytest
+import torch as th
+
+from stable_baselines3 import DQN, SAC, TD3
+from stable_baselines3.common.buffers import (
+    CompressedReplayBuffer,
+    DictNStepReplayBuffer,
+    DictPrioritizedReplayBuffer,
+    DictReplayBuffer,
+    DictRolloutBuffer,
+    DictSharedMemoryReplayBuffer,
+    FrameStackReplayBuffer,
+    NStepReplayBuffer,
+    PrioritizedReplayBuffer,
+    ReplayBuffer,
+    RolloutBuffer,
+    SharedMemoryReplayBuffer,
+    TensorReplayBuffer,
+)
+from stable_baselines3.common.envs import BitFlippingEnv, FakeImageEnv, IdentityEnv, IdentityEnvBox, SimpleMultiObsEnv
+from stable_baselines3.common.save_util import load_chunked_replay_buffer, save_chunked_replay_buffer
+from stable_baselines3.common.segment_tree import MinSegmentTree, SumSegmentTree
+from stable_baselines3.common.type_aliases import PrioritizedReplayBufferSamples
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecFrameStack
+from stable_baselines3.her import HerReplayBuffer
+
+
+@pytest.mark.parametrize("size", [1, 5, 16, 1000])
+def test_segment_tree(size):
+    values = np.random.rand(size) + 0.1
+    sum_tree, min_tree = SumSegmentTree(size), MinSegmentTree(size)
+    sum_tree[np.arange(size)] = values
+    min_tree[np.arange(size)] = values
+
+    assert np.isclose(sum_tree.sum(), values.sum())
+    assert np.isclose(min_tree.min(), values.min())
+    assert np.allclose(sum_tree[np.arange(size)], values)
+
+    # Compare the vectorized tree walk with a linear search
+    prefixsums = np.random.rand(100) * values.sum()
+    expected = np.searchsorted(np.cumsum(values), prefixsums)
+    assert np.all(sum_tree.find_prefixsum_idx(prefixsums) == np.minimum(expected, size - 1))
+
+    # Batch update with duplicated indices
+    sum_tree[np.array([0, 0])] = np.array([1.0, 2.0])
+    values[0] = 2.0
+    assert np.isclose(sum_tree.sum(), values.sum())
+
+
+@pytest.mark.parametrize("n_envs", [1, 3])
+def test_prioritized_replay_buffer(n_envs):
+    observation_space = gym.spaces.Box(low=-1, high=1, shape=(2,), dtype=np.float32)
+    action_space = gym.spaces.Box(low=-1, high=1, shape=(1,), dtype=np.float32)
+    buffer = PrioritizedReplayBuffer(100, observation_space, action_space, n_envs=n_envs, alpha=1.0, beta=1.0)
+
+    for i in range(10):
+        obs = np.full((n_envs, 2), i, dtype=np.float32)
+        buffer.add(obs, obs + 1, np.zeros((n_envs, 1)), np.full(n_envs, i), np.zeros(n_envs), [{}] * n_envs)
+
+    # All transitions start with the same priority
+    samples = buffer.sample(64)
+    assert isinstance(samples, PrioritizedReplayBufferSamples)
+    assert th.allclose(samples.weights, th.ones_like(samples.weights))
+    assert np.all(samples.indices < buffer.size() * n_envs)
+    # Observations and rewards must match the sampled indices
+    assert np.allclose(samples.observations[:, 0].numpy(), samples.rewards[:, 0].numpy())
+
+    # Only one transition with non negligible priority
+    buffer.update_priorities(np.arange(buffer.size() * n_envs), np.zeros(buffer.size() * n_envs))
+    buffer.update_priorities(np.array([n_envs * 4]), np.array([10.0]))
+    samples = buffer.sample(64)
+    assert np.all(samples.indices == n_envs * 4)
+    assert np.all(samples.rewards.numpy() == 4)
+    # Over-sampled transitions have small importance weights
+    assert th.all(samples.weights < 1e-3)
+
+
+def test_dict_prioritized_replay_buffer():
+    env = SimpleMultiObsEnv()
+    buffer = DictPrioritizedReplayBuffer(100, env.observation_space, env.action_space)
+    obs = env.reset()
+    for _ in range(10):
+        action = env.action_space.sample()
+        next_obs, reward, done, info = env.step(action)
+        buffer.add(obs, next_obs, np.array([action]), np.array([reward]), np.array([done]), [info])
+        obs = next_obs
+    samples = buffer.sample(5)
+    assert isinstance(samples.observations, dict)
+    assert samples.weights.shape == (5, 1)
+    buffer.update_priorities(samples.indices, np.ones(5))
+
+
+@pytest.mark.parametrize("model_class", [DQN, SAC, TD3])
+def test_prioritized_replay_training(model_class):
+    env = IdentityEnv(10) if model_class == DQN else IdentityEnvBox()
+    model = model_class(
+        "MlpPolicy",
+        env,
+        policy_kwargs=dict(net_arch=[32]),
+        learning_starts=200,
+        buffer_size=500,
+        replay_buffer_class=PrioritizedReplayBuffer,
+        replay_buffer_kwargs=dict(alpha=0.6, beta=0.4),
+        seed=0,
+    )
+    # Fill the replay buffer, then do the gradient steps
+    model.learn(total_timesteps=100)
+    model.train(gradient_steps=5, batch_size=32)
+    # Priorities were updated from the TD errors
+    priorities = model.replay_buffer.sum_tree[np.arange(model.replay_buffer.size())]
+    assert not np.allclose(priorities, priorities[0])
+
+
+@pytest.mark.parametrize("replay_buffer_class", [ReplayBuffer, DictReplayBuffer])
+def test_memmap_storage(tmp_path, replay_buffer_class):
+    if replay_buffer_class == DictReplayBuffer:
+        env = SimpleMultiObsEnv()
+    else:
+        env = IdentityEnvBox()
+    storage_path = str(tmp_path / "replay_buffer")
+    buffer = replay_buffer_class(20, env.observation_space, env.action_space, storage_path=storage_path)
+    assert isinstance(buffer.actions, np.memmap)
+
+    obs = env.reset()
+    for _ in range(25):
+        action = env.action_space.sample()
+        next_obs, reward, done, info = env.step(action)
+        buffer.add(obs, next_obs, np.array([action]), np.array([reward]), np.array([done]), [info])
+        obs = env.reset() if done else next_obs
+    buffer.sample(8)
+    buffer.flush()
+
+    # Reopen the buffer from disk
+    reopened = replay_buffer_class(20, env.observation_space, env.action_space, storage_path=storage_path)
+    assert reopened.pos == buffer.pos and reopened.full
+    assert np.allclose(reopened.rewards, buffer.rewards)
+    assert np.allclose(reopened.actions, buffer.actions)
+
+    # Different layout: start from scratch
+    other = replay_buffer_class(10, env.observation_space, env.action_space, storage_path=storage_path)
+    assert other.pos == 0 and not other.full
+
+
+@pytest.mark.parametrize("replay_buffer_class", [ReplayBuffer, DictReplayBuffer, PrioritizedReplayBuffer])
+@pytest.mark.parametrize("optimize_memory_usage", [False, True])
+@pytest.mark.parametrize("batch_size", [3, 7, 25])
+def test_replay_buffer_extend(replay_buffer_class, optimize_memory_usage, batch_size):
+    if optimize_memory_usage and replay_buffer_class != ReplayBuffer:
+        pytest.skip("Only ReplayBuffer supports optimize_memory_usage")
+    n_envs, n_steps = 2, 30
+    if replay_buffer_class == DictReplayBuffer:
+        env = SimpleMultiObsEnv()
+    else:
+        env = IdentityEnvBox()
+    kwargs = dict(n_envs=n_envs, optimize_memory_usage=optimize_memory_usage)
+    buffer = replay_buffer_class(20, env.observation_space, env.action_space, **kwargs)
+    batch_buffer = replay_buffer_class(20, env.observation_space, env.action_space, **kwargs)
+
+    def sample_obs():
+        obs = [env.observation_space.sample() for _ in range(n_envs)]
+        if isinstance(obs[0], dict):
+            return {key: np.stack([obs_[key] for obs_ in obs]) for key in obs[0].keys()}
+        return np.stack(obs)
+
+    steps = []
+    for i in range(n_steps):
+        infos = [{"TimeLimit.truncated": bool((i + env_idx) % 4 == 0)} for env_idx in range(n_envs)]
+        action = np.array([env.action_space.sample() for _ in range(n_envs)])
+        step = (sample_obs(), sample_obs(), action, np.random.rand(n_envs), np.random.rand(n_envs) > 0.5, infos)
+        steps.append(step)
+        buffer.add(*deepcopy(step))
+
+    for start in range(0, n_steps, batch_size):
+        batch = steps[start : start + batch_size]
+        stacked = []
+        for field in zip(*batch):
+            if isinstance(field[0], dict):
+                stacked.append({key: np.stack([value[key] for value in field]) for key in field[0].keys()})
+            elif isinstance(field[0], list):
+                stacked.append(list(field))
+            else:
+                stacked.append(np.stack(field))
+        batch_buffer.extend(*stacked)
+
+    assert batch_buffer.pos == buffer.pos and batch_buffer.full == buffer.full
+    for name in ["observations", "next_observations", "actions", "rewards", "dones", "timeouts"]:
+        expected, actual = getattr(buffer, name), getattr(batch_buffer, name)
+        if isinstance(expected, dict):
+            for key in expected.keys():
+                assert np.allclose(expected[key], actual[key])
+        elif expected is not None:
+            assert np.allclose(expected, actual)
+
+
+def test_rollout_buffer_extend():
+    env = IdentityEnvBox()
+    n_envs, n_steps = 3, 12
+    buffer = RolloutBuffer(n_steps, env.observation_space, env.action_space, n_envs=n_envs)
+    batch_buffer = RolloutBuffer(n_steps, env.observation_space, env.action_space, n_envs=n_envs)
+    obs = np.random.rand(n_steps, n_envs, 1).astype(np.float32)
+    actions = np.random.rand(n_steps, n_envs, 1).astype(np.float32)
+    rewards = np.random.rand(n_steps, n_envs)
+    episode_starts = np.random.rand(n_steps, n_envs) > 0.5
+    values, log_probs = th.rand(n_steps, n_envs, 1), th.rand(n_steps, n_envs)
+    for i in range(n_steps):
+        buffer.add(obs[i], actions[i], rewards[i], episode_starts[i], values[i], log_probs[i])
+    batch_buffer.extend(obs[:5], actions[:5], rewards[:5], episode_starts[:5], values[:5], log_probs[:5])
+    batch_buffer.extend(obs[5:], actions[5:], rewards[5:], episode_starts[5:], values[5:], log_probs[5:])
+
+    assert batch_buffer.full and batch_buffer.pos == buffer.pos
+    for name in ["observations", "actions", "rewards", "episode_starts", "values", "log_probs"]:
+        assert np.allclose(getattr(buffer, name), getattr(batch_buffer, name))
+
+
+@pytest.mark.parametrize("compression", ["zlib", "lzma"])
+@pytest.mark.parametrize("optimize_memory_usage", [False, True])
+@pytest.mark.parametrize("n_decompression_threads", [0, 2])
+def test_compressed_replay_buffer(compression, optimize_memory_usage, n_decompression_threads):
+    env = FakeImageEnv(screen_height=16, screen_width=16)
+    kwargs = dict(n_envs=2, optimize_memory_usage=optimize_memory_usage)
+    buffer = ReplayBuffer(50, env.observation_space, env.action_space, **kwargs)
+    compressed_buffer = CompressedReplayBuffer(
+        50,
+        env.observation_space,
+        env.action_space,
+        compression=compression,
+        n_decompression_threads=n_decompression_threads,
+        **kwargs,
+    )
+    obs = np.stack([env.reset(), env.reset()])
+    for _ in range(40):
+        next_obs = np.stack([env.observation_space.sample() for _ in range(2)])
+        step = (obs, next_obs, np.array([[0], [1]]), np.random.rand(2), np.zeros(2), [{}, {}])
+        buffer.add(*step)
+        compressed_buffer.add(*step)
+        obs = next_obs
+
+    batch_inds = np.random.randint(0, buffer.size() - 1, size=16)
+    env_indices = np.random.randint(0, 2, size=16)
+    expected = buffer._get_samples(batch_inds, env_indices=env_indices)
+    samples = compressed_buffer._get_samples(batch_inds, env_indices=env_indices)
+    for expected_, actual in zip(expected, samples):
+        assert th.allclose(expected_.float(), actual.float())
+    compressed_buffer.sample(8)
+
+    # Thread pools must not prevent saving the buffer
+    compressed_buffer = deepcopy(compressed_buffer)
+    compressed_buffer.sample(8)
+
+
+@pytest.mark.parametrize("channel_first", [False, True])
+def test_frame_stack_replay_buffer(channel_first):
+    n_stack, n_envs, buffer_size = 4, 2, 40
+
+    def make_env(ep_length):
+        def _init():
+            env = FakeImageEnv(screen_height=8, screen_width=8, n_channels=3, channel_first=channel_first)
+            env.ep_length = ep_length
+            return env
+
+        return _init
+
+    channels_order = "first" if channel_first else "last"
+    venv = VecFrameStack(DummyVecEnv([make_env(7), make_env(10)]), n_stack=n_stack, channels_order=channels_order)
+    buffer = ReplayBuffer(buffer_size * n_envs, venv.observation_space, venv.action_space, n_envs=n_envs)
+    frame_buffer = FrameStackReplayBuffer(
+        buffer_size * n_envs,
+        venv.observation_space,
+        venv.action_space,
+        n_envs=n_envs,
+        n_stack=n_stack,
+        channels_order=channels_order,
+    )
+    # Only one frame is stored per step
+    assert frame_buffer.observations.nbytes * 2 * n_stack == buffer.observations.nbytes * 2
+
+    obs = venv.reset()
+    for step in range(55):
+        actions = np.array([venv.action_space.sample() for _ in range(n_envs)])
+        new_obs, rewards, dones, infos = venv.step(actions)
+        next_obs = new_obs.copy()
+        for env_idx, done in enumerate(dones):
+            if done:
+                next_obs[env_idx] = infos[env_idx]["terminal_observation"]
+        buffer.add(obs, next_obs, actions, rewards, dones, infos)
+        frame_buffer.add(obs, next_obs, actions, rewards, dones, infos)
+        obs = new_obs
+
+        # Compare all the valid transitions
+        if frame_buffer.full:
+            batch_inds = (np.arange(n_stack, buffer_size) + frame_buffer.pos) % buffer_size
+        else:
+            batch_inds = np.arange(frame_buffer.pos)
+        for env_idx in range(n_envs):
+            env_indices = np.full_like(batch_inds, env_idx)
+            expected = buffer._get_samples(batch_inds, env_indices=env_indices)
+            samples = frame_buffer._get_samples(batch_inds, env_indices=env_indices)
+            for expected_, actual in zip(expected, samples):
+                assert th.allclose(expected_, actual)
+
+    frame_buffer.sample(16)
+
+
+@pytest.mark.parametrize("channel_first", [False, True])
+def test_frame_stack_replay_buffer_extend(channel_first):
+    n_stack, n_envs, buffer_size = 3, 2, 40
+    channels_order = "first" if channel_first else "last"
+    venv = VecFrameStack(
+        DummyVecEnv([lambda: FakeImageEnv(screen_height=8, screen_width=8, channel_first=channel_first)] * n_envs),
+        n_stack=n_stack,
+        channels_order=channels_order,
+    )
+    for env_idx, ep_length in enumerate([7, 10]):
+        venv.venv.envs[env_idx].ep_length = ep_length
+    kwargs = dict(n_envs=n_envs, n_stack=n_stack, channels_order=channels_order)
+    buffer = FrameStackReplayBuffer(buffer_size, venv.observation_space, venv.action_space, **kwargs)
+    extended_buffer = FrameStackReplayBuffer(buffer_size, venv.observation_space, venv.action_space, **kwargs)
+
+    transitions = []
+    obs = venv.reset()
+    for _ in range(130):
+        actions = np.array([venv.action_space.sample() for _ in range(n_envs)])
+        new_obs, rewards, dones, infos = venv.step(actions)
+        next_obs = new_obs.copy()
+        for env_idx, done in enumerate(dones):
+            if done:
+                next_obs[env_idx] = infos[env_idx]["terminal_observation"]
+        transitions.append((obs, next_obs, actions, rewards, dones, infos))
+        buffer.add(obs, next_obs, actions, rewards, dones, infos)
+        obs = new_obs
+
+    # Small batches, a batch that wraps around and one larger than the buffer
+    start = 0
+    for batch_size in [7, 30, 93]:
+        batch = list(zip(*transitions[start : start + batch_size]))
+        extended_buffer.extend(*map(np.array, batch[:-1]), list(batch[-1]))
+        start += batch_size
+
+    assert extended_buffer.pos == buffer.pos and extended_buffer.full == buffer.full
+    for name in ["observations", "actions", "rewards", "dones", "timeouts", "episode_steps"]:
+        assert np.array_equal(getattr(extended_buffer, name), getattr(buffer, name)), name
+    assert np.array_equal(extended_buffer._current_episode_steps, buffer._current_episode_steps)
+    assert extended_buffer.terminal_frames.keys() == buffer.terminal_frames.keys()
+    for key, frame in buffer.terminal_frames.items():
+        assert np.array_equal(extended_buffer.terminal_frames[key], frame)
+
+
+@pytest.mark.parametrize("env_class", [IdentityEnv, IdentityEnvBox])
+@pytest.mark.parametrize("optimize_memory_usage", [False, True])
+def test_tensor_replay_buffer(env_class, optimize_memory_usage):
+    env = env_class(10) if env_class == IdentityEnv else env_class()
+    n_envs, buffer_size = 2, 20
+    kwargs = dict(n_envs=n_envs, optimize_memory_usage=optimize_memory_usage)
+    buffer = ReplayBuffer(buffer_size * n_envs, env.observation_space, env.action_space, **kwargs)
+    tensor_buffer = TensorReplayBuffer(buffer_size * n_envs, env.observation_space, env.action_space, **kwargs)
+    assert isinstance(tensor_buffer.observations, th.Tensor)
+
+    obs = np.array([env.observation_space.sample() for _ in range(n_envs)])
+    for step in range(30):
+        next_obs = np.array([env.observation_space.sample() for _ in range(n_envs)])
+        actions = np.array([env.action_space.sample() for _ in range(n_envs)])
+        dones = np.array([step % 7 == 0, step % 5 == 0])
+        infos = [{"TimeLimit.truncated": step % 3 == 0}, {}]
+        rewards = np.random.rand(n_envs)
+        buffer.add(obs, next_obs, actions, rewards, dones, infos)
+        tensor_buffer.add(obs, next_obs, actions, rewards, dones, infos)
+        obs = next_obs
+    # Add a batch of steps at once
+    tensor_buffer.extend(obs[None], next_obs[None], actions[None], np.ones((1, n_envs)), np.zeros((1, n_envs)))
+    buffer.extend(obs[None], next_obs[None], actions[None], np.ones((1, n_envs)), np.zeros((1, n_envs)))
+    assert tensor_buffer.pos == buffer.pos and tensor_buffer.full
+
+    batch_inds = (np.arange(1, buffer_size) + buffer.pos) % buffer_size
+    env_indices = np.random.randint(0, n_envs, size=len(batch_inds))
+    expected = buffer._get_samples(batch_inds, env_indices=env_indices)
+    samples = tensor_buffer._get_samples(batch_inds, env_indices=env_indices)
+    for expected_, actual in zip(expected, samples):
+        assert expected_.dtype == actual.dtype
+        assert th.allclose(expected_, actual)
+
+    model = SAC("MlpPolicy", IdentityEnvBox(), learning_starts=100, replay_buffer_class=TensorReplayBuffer, seed=0)
+    model.learn(total_timesteps=50)
+    model.train(gradient_steps=2, batch_size=16)
+
+
+@pytest.mark.parametrize("replay_buffer_class", [ReplayBuffer, CompressedReplayBuffer])
+def test_prefetch_replay_buffer(replay_buffer_class):
+    env = IdentityEnvBox()
+    buffer = replay_buffer_class(10, env.observation_space, env.action_space, prefetch_batches=3)
+    # Errors are raised in the main thread
+    with pytest.raises(ValueError):
+        buffer.sample(4)
+
+    obs = np.zeros((1, 1), dtype=np.float32)
+    step = (obs, obs, np.zeros((1, 1)), np.zeros(1), np.zeros(1), [{}])
+    for _ in range(10):
+        buffer.add(*step)
+    assert th.allclose(buffer.sample(4).rewards, th.zeros(1))
+    # Wait for the batches to be prefetched
+    for _ in range(100):
+        if len(buffer._prefetcher._batches) == 3:
+            break
+        time.sleep(0.01)
+    assert len(buffer._prefetcher._batches) == 3
+
+    # The prefetched batches are dropped when new transitions are added
+    buffer.extend(*(np.ones((10,) + np.shape(data)) for data in step[:-1]))
+    assert len(buffer._prefetcher._batches) == 0
+    for _ in range(5):
+        assert th.allclose(buffer.sample(4).rewards, th.ones(1))
+    # A new batch size is a new request
+    assert buffer.sample(6).rewards.shape == (6, 1)
+
+    buffer = deepcopy(buffer)
+    assert buffer._prefetcher is None
+    assert buffer.sample(4).rewards.shape == (4, 1)
+
+    model = SAC(
+        "MlpPolicy",
+        env,
+        learning_starts=100,
+        replay_buffer_class=replay_buffer_class,
+        replay_buffer_kwargs=dict(prefetch_batches=2),
+        seed=0,
+    )
+    model.learn(total_timesteps=50)
+    model.train(gradient_steps=4, batch_size=16)
+
+
+@pytest.mark.parametrize("replay_buffer_class", [ReplayBuffer, DictReplayBuffer, TensorReplayBuffer])
+def test_sample_many(replay_buffer_class):
+    env = SimpleMultiObsEnv() if replay_buffer_class == DictReplayBuffer else IdentityEnvBox()
+    buffer = replay_buffer_class(100, env.observation_space, env.action_space)
+    obs = env.reset()
+    for _ in range(50):
+        action = np.array(env.action_space.sample())
+        next_obs, reward, done, info = env.step(action)
+        buffer.add(obs, next_obs, action, reward, done, [info])
+        obs = env.reset() if done else next_obs
+
+    np.random.seed(0)
+    batches = buffer.sample_many(3, 8)
+    np.random.seed(0)
+    expected = buffer.sample(24)
+    assert len(batches) == 3
+    for idx, batch in enumerate(batches):
+        for data, expected_data in zip(batch, expected):
+            if isinstance(data, dict):
+                for key in data.keys():
+                    assert th.allclose(data[key], expected_data[key][idx * 8 : (idx + 1) * 8])
+            else:
+                assert th.allclose(data, expected_data[idx * 8 : (idx + 1) * 8])
+
+
+def test_incremental_checkpoint(tmp_path):
+    env = IdentityEnvBox()
+    buffer = ReplayBuffer(100, env.observation_space, env.action_space, optimize_memory_usage=True)
+
+    def add_transitions(n_transitions):
+        for _ in range(n_transitions):
+            obs = np.random.rand(1, 1).astype(np.float32)
+            buffer.add(obs, obs + 1, np.random.rand(1, 1), np.random.rand(1), np.zeros(1), [{}])
+
+    def chunk_files():
+        return {name: sorted(os.listdir(tmp_path / name)) for name in ["observations", "rewards"]}
+
+    add_transitions(35)
+    save_chunked_replay_buffer(tmp_path, buffer, chunk_size=10)
+    files = chunk_files()
+    assert len(files["observations"]) == 10
+
+    # Only the chunks of the rows written since the last save are saved again
+    add_transitions(12)
+    save_chunked_replay_buffer(tmp_path, buffer, chunk_size=10)
+    new_files = chunk_files()
+    for name in files.keys():
+        assert len(new_files[name]) == 10
+        changed = [idx for idx, (old, new) in enumerate(zip(files[name], new_files[name])) if old != new]
+        assert changed == [3, 4]
+
+    # More transitions than the buffer size
+    add_transitions(150)
+    save_chunked_replay_buffer(tmp_path, buffer, chunk_size=10)
+    loaded_buffer = load_chunked_replay_buffer(tmp_path)
+    assert (loaded_buffer.pos, loaded_buffer.full) == (buffer.pos, buffer.full)
+    for name, array in buffer._checkpoint_arrays().items():
+        assert np.allclose(getattr(loaded_buffer, name), array)
+    assert sorted(os.listdir(tmp_path / "observations")) != new_files["observations"]
+
+    # Another buffer is saved entirely
+    add_transitions(5)
+    other_buffer = deepcopy(buffer)
+    other_buffer._checkpoint_id = None
+    other_buffer.observations[:] = 0
+    save_chunked_replay_buffer(tmp_path, other_buffer, chunk_size=10)
+    assert np.allclose(load_chunked_replay_buffer(tmp_path).observations, 0)
+
+
+def test_incremental_checkpoint_large_extend(tmp_path):
+    env = IdentityEnvBox()
+    buffer = ReplayBuffer(100, env.observation_space, env.action_space)
+
+    def extend(n_transitions):
+        obs = np.random.rand(n_transitions, 1, 1).astype(np.float32)
+        rewards = np.random.rand(n_transitions, 1)
+        buffer.extend(obs, obs + 1, np.random.rand(n_transitions, 1, 1), rewards, np.zeros((n_transitions, 1)))
+
+    extend(10)
+    save_chunked_replay_buffer(tmp_path, buffer, chunk_size=10)
+    # One batch larger than the buffer, `pos` alone cannot tell that every row was written
+    extend(150)
+    save_chunked_replay_buffer(tmp_path, buffer, chunk_size=10)
+    loaded_buffer = load_chunked_replay_buffer(tmp_path)
+    assert (loaded_buffer.pos, loaded_buffer.full) == (buffer.pos, buffer.full)
+    for name, array in buffer._checkpoint_arrays().items():
+        assert np.array_equal(getattr(loaded_buffer, name), array), name
+
+
+def test_tensor_replay_buffer_checkpoint(tmp_path):
+    env = IdentityEnvBox()
+    buffer = TensorReplayBuffer(100, env.observation_space, env.action_space)
+    obs = np.random.rand(30, 1, 1).astype(np.float32)
+    buffer.extend(obs, obs + 1, np.random.rand(30, 1, 1), np.random.rand(30, 1), np.zeros((30, 1)))
+    save_chunked_replay_buffer(tmp_path, buffer, chunk_size=10)
+    assert len(os.listdir(tmp_path / "observations")) == 10
+    buffer.extend(obs[:5], obs[:5] + 1, np.random.rand(5, 1, 1), np.random.rand(5, 1), np.ones((5, 1)))
+    save_chunked_replay_buffer(tmp_path, buffer, chunk_size=10)
+
+    loaded_buffer = load_chunked_replay_buffer(tmp_path)
+    assert isinstance(loaded_buffer, TensorReplayBuffer) and loaded_buffer.pos == 35
+    for name in ["observations", "next_observations", "actions", "rewards", "dones", "timeouts"]:
+        assert isinstance(getattr(loaded_buffer, name), th.Tensor)
+        assert th.equal(getattr(loaded_buffer, name), getattr(buffer, name)), name
+    loaded_buffer.sample(8)
+
+
+def test_incremental_checkpoint_model(tmp_path):
+    model = DQN("MultiInputPolicy", SimpleMultiObsEnv(), learning_starts=100, buffer_size=200)
+    model.learn(total_timesteps=50)
+    model.save_replay_buffer(tmp_path / "buffer", incremental=True, chunk_size=16)
+    model.learn(total_timesteps=30, reset_num_timesteps=False)
+    model.save_replay_buffer(tmp_path / "buffer", incremental=True, chunk_size=16)
+    replay_buffer = model.replay_buffer
+
+    model.load_replay_buffer(tmp_path / "buffer")
+    assert isinstance(model.replay_buffer, DictReplayBuffer)
+    assert model.replay_buffer.pos == replay_buffer.pos > 50
+    for key, obs in replay_buffer.observations.items():
+        assert np.allclose(model.replay_buffer.observations[key], obs)
+        assert np.allclose(model.replay_buffer.next_observations[key], replay_buffer.next_observations[key])
+    assert np.allclose(model.replay_buffer.dones, replay_buffer.dones)
+    model.train(gradient_steps=2, batch_size=8)
+
+
+@pytest.mark.parametrize("mmap_mode", ["c", "r+"])
+def test_mmap_load_replay_buffer(tmp_path, mmap_mode):
+    model = SAC("MlpPolicy", IdentityEnvBox(), learning_starts=100, buffer_size=200)
+    model.learn(total_timesteps=60)
+    model.save_replay_buffer(tmp_path / "buffer", incremental=True, chunk_size=200)
+    observations = model.replay_buffer.observations.copy()
+
+    model.load_replay_buffer(tmp_path / "buffer", mmap_mode=mmap_mode)
+    assert isinstance(model.replay_buffer.observations, np.memmap)
+    assert np.allclose(model.replay_buffer.observations, observations)
+
+    # Continue training with the memory-mapped buffer
+    model.learn(total_timesteps=20, reset_num_timesteps=False)
+    model.train(gradient_steps=2, batch_size=16)
+    assert model.replay_buffer.pos == 80
+    reloaded_buffer = load_chunked_replay_buffer(tmp_path / "buffer", mmap_mode="r")
+    # Copy-on-write does not modify the saved files
+    assert np.allclose(reloaded_buffer.observations[60:80], 0) == (mmap_mode == "c")
+    assert reloaded_buffer.pos == 60
+
+    # Arrays split in several chunks cannot be memory-mapped
+    model.save_replay_buffer(tmp_path / "chunked_buffer", incremental=True, chunk_size=16)
+    with pytest.raises(ValueError, match="chunk_size >= buffer_size"):
+        load_chunked_replay_buffer(tmp_path / "chunked_buffer", mmap_mode="c")
+    with pytest.raises(ValueError):
+        model.load_replay_buffer(tmp_path / "chunked_buffer", mmap_mode="c")
+    replay_buffer = load_chunked_replay_buffer(tmp_path / "chunked_buffer")
+    assert np.allclose(replay_buffer.observations, model.replay_buffer.observations)
+
+
+@pytest.mark.parametrize("optimize_memory_usage", [False, True])
+@pytest.mark.parametrize("n_transitions", [15, 33])
+def test_n_step_replay_buffer(optimize_memory_usage, n_transitions):
+    env = IdentityEnvBox()
+    n_envs, buffer_size, n_steps, gamma = 2, 20, 3, 0.9
+    buffer = NStepReplayBuffer(
+        buffer_size * n_envs,
+        env.observation_space,
+        env.action_space,
+        n_envs=n_envs,
+        optimize_memory_usage=optimize_memory_usage,
+        n_steps=n_steps,
+        gamma=gamma,
+    )
+    obs = np.random.rand(n_envs, 1).astype(np.float32)
+    steps = []
+    for _ in range(n_transitions):
+        next_obs = np.random.rand(n_envs, 1).astype(np.float32)
+        dones = np.random.rand(n_envs) < 0.2
+        timeouts = dones & (np.random.rand(n_envs) < 0.5)
+        infos = [{"TimeLimit.truncated": timeout} for timeout in timeouts]
+        rewards = np.random.rand(n_envs)
+        buffer.add(obs, next_obs, np.zeros((n_envs, 1)), rewards, dones, infos)
+        steps.append((next_obs, rewards, dones, timeouts))
+        obs = next_obs
+
+    # Transitions that are still stored, from the oldest
+    first_step = max(0, n_transitions - buffer_size + int(optimize_memory_usage))
+    batch_inds, env_indices = np.meshgrid(np.arange(first_step, n_transitions) % buffer_size, np.arange(n_envs))
+    samples = buffer._get_samples(batch_inds.ravel(), env_indices=env_indices.ravel())
+
+    idx = 0
+    for env_idx in range(n_envs):
+        for step in range(first_step, n_transitions):
+            expected_return, discount = 0.0, 1.0
+            for step_ in range(step, min(step + n_steps, n_transitions)):
+                next_obs, rewards, dones, timeouts = steps[step_]
+                expected_return += discount * rewards[env_idx]
+                discount *= gamma
+                if dones[env_idx]:
+                    break
+            assert np.isclose(samples.rewards[idx].item(), expected_return, atol=1e-5)
+            assert np.isclose(samples.discounts[idx].item(), discount)
+            assert np.isclose(samples.next_observations[idx].item(), next_obs[env_idx].item())
+            assert samples.dones[idx].item() == float(dones[env_idx] and not timeouts[env_idx])
+            idx += 1
+
+
+@pytest.mark.parametrize("model_class", [DQN, SAC])
+def test_n_step_training(model_class):
+    env = SimpleMultiObsEnv() if model_class == DQN else IdentityEnvBox()
+    policy = "MultiInputPolicy" if model_class == DQN else "MlpPolicy"
+    model = model_class(
+        policy,
+        env,
+        gamma=0.95,
+        learning_starts=100,
+        replay_buffer_class=NStepReplayBuffer,
+        replay_buffer_kwargs=dict(n_steps=4),
+    )
+    assert model.replay_buffer.gamma == 0.95
+    assert isinstance(model.replay_buffer, DictNStepReplayBuffer) == (model_class == DQN)
+    model.learn(total_timesteps=50)
+    model.train(gradient_steps=2, batch_size=16)
+    samples = model.replay_buffer.sample(32)
+    assert th.all(samples.discounts <= 0.95) and th.all(samples.discounts >= 0.95**4)
+
+
+@pytest.mark.parametrize(
+    "replay_buffer_cls", [ReplayBuffer, PrioritizedReplayBuffer, NStepReplayBuffer, CompressedReplayBuffer, TensorReplayBuffer]
+)
+def test_replay_buffer_dtypes(replay_buffer_cls):
+    env = IdentityEnv(5)
+    dtypes = dict(observations=np.uint8, actions=np.int32, rewards=np.float16, dones=np.bool_, timeouts=np.bool_)
+    buffer = replay_buffer_cls(100, gym.spaces.Box(0, 5, (3,)), env.action_space, dtypes=dtypes)
+    assert buffer.actions.dtype in (np.int32, th.int32)
+    assert buffer.dones.dtype in (np.bool_, th.bool)
+
+    for _ in range(20):
+        obs = np.random.randint(0, 5, size=(1, 3))
+        buffer.add(obs, obs + 1, np.array([[3]]), np.array([0.5]), np.array([True]), [{"TimeLimit.truncated": False}])
+
+    samples = buffer.sample(10)
+    # The samples are cast back to the training dtypes
+    assert samples.observations.dtype == th.float32
+    assert samples.actions.dtype == th.int64
+    assert samples.dones.dtype == th.float32
+    assert samples.rewards.dtype == th.float32
+    assert th.allclose(samples.next_observations, samples.observations + 1)
+    assert th.all(samples.actions == 3)
+    assert th.all(samples.dones == 1.0)
+    assert th.allclose(samples.rewards, th.full_like(samples.rewards, 0.5))
+
+
+def test_dict_replay_buffer_dtypes():
+    env = SimpleMultiObsEnv()
+    dtypes = dict(observations=dict(img=np.float16), dones=np.bool_)
+    buffer = DictReplayBuffer(100, env.observation_space, env.action_space, dtypes=dtypes)
+    assert buffer.observations["img"].dtype == np.float16
+    assert buffer.observations["vec"].dtype == env.observation_space["vec"].dtype
+    obs = env.reset()
+    for _ in range(10):
+        next_obs, reward, done, _ = env.step(env.action_space.sample())
+        buffer.add(obs, next_obs, np.array([0]), np.array([reward]), np.array([done]), [{}])
+        obs = next_obs
+    samples = buffer.sample(5)
+    assert samples.observations["img"].dtype == th.uint8
+    assert samples.dones.dtype == th.float32
+
+    with pytest.raises(AssertionError):
+        DictReplayBuffer(100, env.observation_space, env.action_space, dtypes=dict(unknown=np.float16))
+
+
+def test_rollout_buffer_dtypes():
+    env = IdentityEnvBox()
+    dtypes = dict(observations=np.float16, episode_starts=np.bool_, values=np.float16, log_probs=np.float16)
+    buffer = RolloutBuffer(16, env.observation_space, env.action_space, gamma=0.9, n_envs=2, dtypes=dtypes)
+    reference = RolloutBuffer(16, env.observation_space, env.action_space, gamma=0.9, n_envs=2)
+    for step in range(16):
+        obs = np.random.rand(2, 1).astype(np.float32)
+        action = np.random.rand(2, 1).astype(np.float32)
+        reward = np.random.rand(2)
+        episode_start = np.array([step % 5 == 0, step % 7 == 0])
+        # Values exactly representable in float16
+        value = th.as_tensor(np.random.randint(0, 8, size=(2, 1)) / 4)
+        log_prob = th.as_tensor(-np.random.randint(0, 8, size=2) / 4)
+        for buffer_ in (buffer, reference):
+            buffer_.add(obs, action, reward, episode_start, value, log_prob)
+    for buffer_ in (buffer, reference):
+        buffer_.compute_returns_and_advantage(last_values=th.ones(2, 1), dones=np.array([False, True]))
+
+    assert buffer.observations.dtype == np.float16
+    assert buffer.episode_starts.dtype == np.bool_
+    assert np.allclose(buffer.returns, reference.returns, atol=1e-5)
+    # The samples are cast back to float32
+    for samples in buffer.get(8):
+        assert all(tensor.dtype == th.float32 for tensor in samples)
+
+
+@pytest.mark.parametrize("buffer_size", [1, 64])
+@pytest.mark.parametrize("dones_dtype", [np.bool_, np.float32])
+def test_rollout_buffer_gae(buffer_size, dones_dtype):
+    env = IdentityEnvBox()
+    n_envs = 3
+    buffer = RolloutBuffer(buffer_size, env.observation_space, env.action_space, gamma=0.99, gae_lambda=0.95, n_envs=n_envs)
+    buffer.rewards[:] = np.random.randn(buffer_size, n_envs)
+    buffer.values[:] = np.random.randn(buffer_size, n_envs)
+    buffer.episode_starts[:] = np.random.rand(buffer_size, n_envs) < 0.1
+    last_values = th.randn(n_envs, 1)
+    dones = (np.random.rand(n_envs) < 0.5).astype(dones_dtype)
+    buffer.compute_returns_and_advantage(last_values=last_values, dones=dones)
+
+    # Step by step reference
+    last_values = last_values.numpy().flatten()
+    advantages = np.zeros_like(buffer.advantages)
+    last_gae_lam = 0
+    for step in reversed(range(buffer_size)):
+        if step == buffer_size - 1:
+            next_non_terminal = 1.0 - dones
+            next_values = last_values
+        else:
+            next_non_terminal = 1.0 - buffer.episode_starts[step + 1]
+            next_values = buffer.values[step + 1]
+        delta = buffer.rewards[step] + buffer.gamma * next_values * next_non_terminal - buffer.values[step]
+        last_gae_lam = delta + buffer.gamma * buffer.gae_lambda * next_non_terminal * last_gae_lam
+        advantages[step] = last_gae_lam
+    # Same operations in the same order: the results are identical
+    assert np.array_equal(buffer.advantages, advantages)
+    assert np.array_equal(buffer.returns, advantages + buffer.values)
+
+
+@pytest.mark.parametrize("env_cls", [IdentityEnvBox, SimpleMultiObsEnv])
+def test_rollout_buffer_persistent_storage(env_cls):
+    env = env_cls()
+    buffer_cls = DictRolloutBuffer if isinstance(env.observation_space, gym.spaces.Dict) else RolloutBuffer
+    n_steps, n_envs = 8, 3
+    buffer = buffer_cls(n_steps, env.observation_space, env.action_space, n_envs=n_envs, persistent_storage=True)
+    reference = buffer_cls(n_steps, env.observation_space, env.action_space, n_envs=n_envs)
+
+    def get_arrays(buffer_):
+        arrays = [buffer_.actions, buffer_.values, buffer_.log_probs, buffer_.advantages, buffer_.returns]
+        if isinstance(buffer_.observations, dict):
+            return arrays + list(buffer_.observations.values())
+        return arrays + [buffer_.observations]
+
+    storage, flat_storage = None, None
+    for _ in range(3):
+        for buffer_ in (buffer, reference):
+            buffer_.reset()
+        if storage is None:
+            storage = get_arrays(buffer)
+        # The same arrays are reused, zeroed
+        assert all(array is stored for array, stored in zip(get_arrays(buffer), storage))
+        assert all(np.all(array == 0) for array in storage)
+        for _ in range(n_steps):
+            obs = [env.observation_space.sample() for _ in range(n_envs)]
+            if isinstance(env.observation_space, gym.spaces.Dict):
+                obs = {key: np.stack([obs_[key] for obs_ in obs]) for key in env.observation_space.spaces}
+            else:
+                obs = np.stack(obs)
+            action = np.stack([env.action_space.sample() for _ in range(n_envs)]).reshape(n_envs, -1)
+            reward, episode_start = np.random.rand(n_envs), np.random.rand(n_envs) < 0.2
+            value, log_prob = th.randn(n_envs, 1), th.randn(n_envs)
+            for buffer_ in (buffer, reference):
+                buffer_.add(obs, action, reward, episode_start, value, log_prob)
+        for buffer_ in (buffer, reference):
+            buffer_.compute_returns_and_advantage(last_values=th.zeros(n_envs, 1), dones=np.zeros(n_envs, dtype=bool))
+        th.manual_seed(0)
+        samples = list(buffer.get(batch_size=5))
+        th.manual_seed(0)
+        expected_samples = list(reference.get(batch_size=5))
+        for sample, expected_sample in zip(samples, expected_samples):
+            for tensor, expected in zip(sample, expected_sample):
+                if isinstance(tensor, dict):
+                    assert all(th.equal(tensor[key], expected[key]) for key in tensor)
+                else:
+                    assert th.equal(tensor, expected)
+        # The flattened data is also written to the same arrays
+        if flat_storage is None:
+            flat_storage = get_arrays(buffer)
+        assert all(array is stored for array, stored in zip(get_arrays(buffer), flat_storage))
+
+
+def test_rollout_buffer_get():
+    env = IdentityEnvBox()
+    n_steps, n_envs = 10, 3
+    buffer = RolloutBuffer(n_steps, env.observation_space, env.action_space, n_envs=n_envs)
+    for step in range(n_steps):
+        # Tag each transition with its index in the flattened rollout
+        index = np.arange(n_envs) * n_steps + step
+        obs = index.reshape(n_envs, 1).astype(np.float32)
+        buffer.add(obs, -obs, np.zeros(n_envs), np.zeros(n_envs), th.as_tensor(index).float(), th.as_tensor(2 * index).float())
+    buffer.compute_returns_and_advantage(last_values=th.zeros(n_envs, 1), dones=np.zeros(n_envs))
+
+    for _ in range(2):
+        batches = list(buffer.get(batch_size=8))
+        assert [len(batch.observations) for batch in batches] == [8, 8, 8, 6]
+        indices = th.cat([batch.observations.flatten() for batch in batches])
+        # Each transition is seen exactly once per epoch
+        assert sorted(indices.tolist()) == list(range(n_steps * n_envs))
+        for batch in batches:
+            assert all(tensor.dtype == th.float32 for tensor in batch)
+            assert th.equal(batch.actions.flatten(), -batch.observations.flatten())
+            assert th.equal(batch.old_values, batch.observations.flatten())
+            assert th.equal(batch.old_log_prob, 2 * batch.observations.flatten())
+
+
+class CostBitFlippingEnv(BitFlippingEnv):
+    """BitFlippingEnv with a step cost given in the infos"""
+
+    def step(self, action):
+        obs, reward, done, info = super().step(action)
+        info["cost"] = float(self.current_step)
+        return obs, reward - info["cost"], done, info
+
+    def compute_reward(self, achieved_goal, desired_goal, info):
+        reward = super().compute_reward(achieved_goal, desired_goal, None)
+        if info is None:
+            return reward
+        # Columnar infos or array of info dicts
+        cost = info["cost"] if isinstance(info, dict) else np.array([info_["cost"] for info_ in info])
+        return reward - cost
+
+
+@pytest.mark.parametrize("env_cls,info_keys", [(CostBitFlippingEnv, ["cost"]), (BitFlippingEnv, [])])
+@pytest.mark.parametrize("online_sampling", [True, False])
+def test_her_replay_buffer_info_keys(env_cls, info_keys, online_sampling):
+    env = DummyVecEnv([lambda: env_cls(n_bits=4, continuous=True)])
+    kwargs = dict(max_episode_length=4, online_sampling=online_sampling)
+    buffers = []
+    for info_keys_ in (None, info_keys):
+        replay_buffer = None if online_sampling else DictReplayBuffer(200, env.observation_space, env.action_space)
+        buffers.append(HerReplayBuffer(env, 200, replay_buffer=replay_buffer, info_keys=info_keys_, **kwargs))
+    buffer, columnar_buffer = buffers
+    assert columnar_buffer.info_buffer is None
+
+    obs = env.reset()
+    np.random.seed(0)
+    for _ in range(30):
+        action = np.array([env.action_space.sample()])
+        next_obs, reward, done, infos = env.step(action)
+        # Sample the same virtual transitions in both buffers
+        state = np.random.get_state()
+        for buffer_ in buffers:
+            np.random.set_state(state)
+            buffer_.add(obs, next_obs, action, reward, done, infos)
+        obs = next_obs
+
+    if online_sampling:
+        np.random.seed(1)
+        samples = buffer.sample(32, env=None)
+        np.random.seed(1)
+        columnar_samples = columnar_buffer.sample(32, env=None)
+    else:
+        samples, columnar_samples = (
+            buffer_.replay_buffer._get_samples(np.arange(100), env_indices=np.zeros(100, dtype=int)) for buffer_ in buffers
+        )
+    assert th.equal(samples.rewards, columnar_samples.rewards)
+    if info_keys:
+        assert columnar_buffer._info_arrays["cost"].shape == (columnar_buffer.max_episode_stored, 4, 1)
+
+
+def _bit_flipping_reward(achieved_goal, desired_goal, _info):
+    return -(np.abs(achieved_goal - desired_goal).sum(axis=-1) > 0).astype(np.float32)
+
+
+@pytest.mark.parametrize("compute_reward", ["env", _bit_flipping_reward])
+def test_her_replay_buffer_compute_reward(compute_reward):
+    env = SubprocVecEnv([lambda: BitFlippingEnv(n_bits=4, continuous=True)] * 2)
+    kwargs = dict(max_episode_length=4, info_keys=[])
+    buffer = HerReplayBuffer(env, 200, **kwargs)
+    local_buffer = HerReplayBuffer(env, 200, compute_reward=compute_reward, **kwargs)
+    assert buffer._compute_reward_fn is None and callable(local_buffer._compute_reward_fn)
+
+    obs = env.reset()
+    for _ in range(20):
+        action = np.array([env.action_space.sample() for _ in range(env.num_envs)])
+        next_obs, reward, done, infos = env.step(action)
+        for buffer_ in (buffer, local_buffer):
+            buffer_.add(obs, next_obs, action, reward, done, infos)
+        obs = next_obs
+
+    # Same rewards as with ``env_method()``, without calling the env
+    np.random.seed(1)
+    samples = buffer.sample(64, env=None)
+    np.random.seed(1)
+    local_samples = local_buffer.sample(64, env=None)
+    assert th.equal(samples.rewards, local_samples.rewards)
+
+    # The reward function is fetched again after loading
+    local_buffer = pickle.loads(pickle.dumps(local_buffer))
+    assert local_buffer._compute_reward_fn is None
+    local_buffer.set_env(env)
+    assert callable(local_buffer._compute_reward_fn)
+    env.close()
+
+
+def test_her_replay_buffer_multi_env():
+    # Episodes of different lengths in each env
+    env = DummyVecEnv([lambda max_steps=max_steps: BitFlippingEnv(n_bits=4, max_steps=max_steps) for max_steps in [2, 3, 5]])
+    buffer = HerReplayBuffer(env, 500, max_episode_length=5)
+    obs = env.reset()
+    n_episodes = np.zeros(env.num_envs, dtype=int)
+    for _ in range(30):
+        action = np.array([env.action_space.sample() for _ in range(env.num_envs)])
+        new_obs, reward, done, infos = env.step(action)
+        # Use the terminal observation, as the replay buffer would
+        next_obs = {key: obs_.copy() for key, obs_ in new_obs.items()}
+        for idx in np.flatnonzero(done):
+            for key in next_obs:
+                next_obs[key][idx] = infos[idx]["terminal_observation"][key]
+        buffer.add(obs, next_obs, action, reward, done, infos)
+        obs = new_obs
+        n_episodes += done
+
+    assert buffer.n_episodes_stored == n_episodes.sum()
+    # Each stored episode is a trajectory of a single env
+    for episode_idx in range(buffer.n_episodes_stored):
+        length = buffer.episode_lengths[episode_idx]
+        # with its last next observation: a single bit is flipped at each step
+        for key in ["observation", "achieved_goal"]:
+            observations = buffer._buffer[key][episode_idx, : length + 1, 0]
+            assert np.all(np.abs(np.diff(observations, axis=0)).sum(axis=1) == 1)
+        desired_goals = buffer._buffer["desired_goal"][episode_idx, : length + 1, 0]
+        assert np.all(desired_goals == desired_goals[0])
+        assert np.all(buffer._buffer["done"][episode_idx, : length - 1] == 0)
+        assert buffer._buffer["done"][episode_idx, length - 1] == 1
+    samples = buffer.sample(32, env=None)
+    assert samples.rewards.shape == (32, 1)
+
+
+def test_her_replay_buffer_offline():
+    env = DummyVecEnv([lambda: BitFlippingEnv(n_bits=4, max_steps=4)] * 2)
+    replay_buffer = DictReplayBuffer(500, env.observation_space, env.action_space)
+    buffer = HerReplayBuffer(
+        env, 500, replay_buffer=replay_buffer, max_episode_length=4, online_sampling=False, goal_selection_strategy="final"
+    )
+    obs = env.reset()
+    n_steps, n_sampled_goal = 20, buffer.n_sampled_goal
+    for _ in range(n_steps):
+        action = np.array([env.action_space.sample() for _ in range(env.num_envs)])
+        new_obs, reward, done, infos = env.step(action)
+        next_obs = {key: obs_.copy() for key, obs_ in new_obs.items()}
+        for idx in np.flatnonzero(done):
+            for key in next_obs:
+                next_obs[key][idx] = infos[idx]["terminal_observation"][key]
+        buffer.add(obs, next_obs, action, reward, done, infos)
+        obs = new_obs
+
+    # Real transitions and n_sampled_goal virtual transitions per step of the finished episodes
+    n_finished_steps = n_steps * env.num_envs - buffer.current_idx.sum()
+    n_transitions = n_steps * env.num_envs + n_sampled_goal * n_finished_steps
+    assert replay_buffer.pos == n_transitions
+    # The rewards match the (relabeled) goals
+    next_observations = {key: obs_[:n_transitions, 0] for key, obs_ in replay_buffer.next_observations.items()}
+    rewards = env.envs[0].compute_reward(next_observations["achieved_goal"], next_observations["desired_goal"], None)
+    assert np.all(replay_buffer.rewards[:n_transitions, 0] == rewards)
+
+
+def _fill_shared_buffer(buffer, actor_idx, n_steps):
+    for step in range(n_steps):
+        obs = np.full((1, 2), actor_idx * 1000 + step, dtype=np.float32)
+        buffer.add(obs, obs + 1, np.zeros((1, 1)), np.array([actor_idx]), np.array([False]), [{}])
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_shared_memory_replay_buffer(start_method):
+    if start_method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f"{start_method} start method not available")
+    observation_space = gym.spaces.Box(-1e6, 1e6, (2,))
+    buffer = SharedMemoryReplayBuffer(1000, observation_space, gym.spaces.Box(-1, 1, (1,)), start_method=start_method)
+    ctx = multiprocessing.get_context(start_method)
+    actors = [ctx.Process(target=_fill_shared_buffer, args=(buffer, actor_idx, 50)) for actor_idx in range(4)]
+    for actor in actors:
+        actor.start()
+    for actor in actors:
+        actor.join()
+        assert actor.exitcode == 0
+
+    # Every transition of every actor was written in its own row
+    assert buffer.pos == 200 and not buffer.full
+    assert len(np.unique(buffer.observations[:200, 0, 0])) == 200
+    assert np.all(buffer.next_observations[:200] == buffer.observations[:200] + 1)
+    samples = buffer.sample(64)
+    assert th.all(samples.next_observations == samples.observations + 1)
+    assert th.all(samples.rewards == samples.observations[:, :1] // 1000)
+
+    # Pickling outside of process creation copies the data in new blocks
+    buffer_copy = pickle.loads(pickle.dumps(buffer))
+    assert buffer_copy.pos == 200
+    assert np.all(buffer_copy.observations == buffer.observations)
+    _fill_shared_buffer(buffer_copy, 5, 1)
+    assert buffer_copy.pos == 201 and buffer.pos == 200
+    buffer_copy.close()
+    buffer.close()
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_shared_memory_incremental_checkpoint(tmp_path, start_method):
+    if start_method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f"{start_method} start method not available")
+    observation_space = gym.spaces.Box(-1e6, 1e6, (2,))
+    buffer = SharedMemoryReplayBuffer(100, observation_space, gym.spaces.Box(-1, 1, (1,)), start_method=start_method)
+    _fill_shared_buffer(buffer, 0, 10)
+    save_chunked_replay_buffer(tmp_path, buffer, chunk_size=8)
+
+    # The transitions written by an actor process are saved by the next incremental checkpoint
+    actor = multiprocessing.get_context(start_method).Process(target=_fill_shared_buffer, args=(buffer, 1, 25))
+    actor.start()
+    actor.join()
+    assert actor.exitcode == 0
+    assert buffer._rows_written == 35
+    save_chunked_replay_buffer(tmp_path, buffer, chunk_size=8)
+
+    loaded_buffer = load_chunked_replay_buffer(tmp_path)
+    assert isinstance(loaded_buffer, SharedMemoryReplayBuffer)
+    assert (loaded_buffer.pos, loaded_buffer._rows_written) == (35, 35)
+    for name, array in buffer._checkpoint_arrays().items():
+        loaded_array = getattr(loaded_buffer, name)
+        assert np.array_equal(loaded_array, array), name
+        # The loaded arrays are stored in shared memory
+        assert any(loaded_array is shared_array for shared_array in loaded_buffer._shared_arrays.values())
+    _fill_shared_buffer(loaded_buffer, 2, 1)
+    assert loaded_buffer.pos == 36 and buffer.pos == 35
+    loaded_buffer.close()
+    buffer.close()
+
+
+def test_shared_memory_replay_buffer_model(tmp_path):
+    model = DQN(
+        "MultiInputPolicy",
+        SimpleMultiObsEnv(),
+        buffer_size=1000,
+        learning_starts=100,
+        replay_buffer_class=SharedMemoryReplayBuffer,
+    )
+    assert isinstance(model.replay_buffer, DictSharedMemoryReplayBuffer)
+    model.learn(total_timesteps=50)
+    model.train(gradient_steps=2, batch_size=16)
+    pos = model.replay_buffer.pos
+    assert pos > 0
+    model.save_replay_buffer(tmp_path / "shared_replay_buffer.pkl")
+    model.load_replay_buffer(tmp_path / "shared_replay_buffer.pkl")
+    assert isinstance(model.replay_buffer, DictSharedMemoryReplayBuffer)
+    assert model.replay_buffer.pos == pos
+    model.train(gradient_steps=2, batch_size=16)
@@ -6,6 +6,7 @@ import torch as th
 from stable_baselines3 import A2C, PPO
 from stable_baselines3.common.callbacks import BaseCallback
 from stable_baselines3.common.policies import ActorCriticPolicy
+from stable_baselines3.common.vec_env import DummyVecEnv
 
 
 class CustomEnv(gym.Env):
@@ -112,3 +113,44 @@ def test_gae_computation(model_class, gae_lambda, gamma, num_episodes):
     # Change constant value so advantage != returns
     model.policy.constant_value = 1.0
     model.learn(rollout_size, callback=CheckGAECallback())
+
+
+class ObsSumValuePolicy(ActorCriticPolicy):
+    """Custom Policy whose value is the sum of the observation"""
+
+    def predict_values(self, obs):
+        return obs.sum(dim=1, keepdim=True)
+
+
+class StoreTerminalObsCallback(BaseCallback):
+    def __init__(self):
+        super(StoreTerminalObsCallback, self).__init__(verbose=0)
+        self.terminal_obs = []
+
+    def _on_step(self):
+        infos = self.locals["infos"]
+        self.terminal_obs.append([info.get("terminal_observation") for info in infos])
+        return True
+
+
+@pytest.mark.parametrize("columnar_infos", [False, True])
+def test_timeout_bootstrap(columnar_infos):
+    max_episode_steps = [3, 3, 5, 4]
+    env_fns = [
+        lambda max_steps=max_steps: gym.wrappers.TimeLimit(CustomEnv(max_steps=100), max_episode_steps=max_steps)
+        for max_steps in max_episode_steps
+    ]
+    env = DummyVecEnv(env_fns, columnar_infos=columnar_infos)
+    n_steps, gamma = 12, 0.9
+    model = A2C(ObsSumValuePolicy, env, n_steps=n_steps, gamma=gamma, seed=0)
+    callback = StoreTerminalObsCallback()
+    model.learn(n_steps * env.num_envs, callback=callback)
+
+    rewards = model.rollout_buffer.rewards
+    for step in range(n_steps):
+        for env_idx, max_steps in enumerate(max_episode_steps):
+            terminal_obs = callback.terminal_obs[step][env_idx]
+            # All the episodes are truncated, with a reward of zero
+            assert (terminal_obs is not None) == ((step + 1) % max_steps == 0)
+            expected_reward = 0.0 if terminal_obs is None else gamma * terminal_obs.sum()
+            assert np.isclose(rewards[step, env_idx], expected_reward)
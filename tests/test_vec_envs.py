@@ -2,16 +2,25 @@ import collections
 import functools
 import itertools
 import multiprocessing
+import subprocess
+import sys
 
 import gym
 import numpy as np
 import pytest
 
 from stable_baselines3.common.monitor import Monitor
-from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecFrameStack, VecNormalize
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecEnvInfos, VecFrameStack, VecNormalize, get_timeouts
 
 N_ENVS = 3
-VEC_ENV_CLASSES = [DummyVecEnv, SubprocVecEnv]
+# Observations, rewards and dones sent through the pipes or written in shared memory,
+# with one or several envs per process
+VEC_ENV_CLASSES = [
+    DummyVecEnv,
+    SubprocVecEnv,
+    functools.partial(SubprocVecEnv, use_shared_memory=True),
+    functools.partial(SubprocVecEnv, envs_per_worker=2),
+]
 VEC_ENV_WRAPPERS = [None, VecNormalize, VecFrameStack]
 
 
@@ -300,6 +309,31 @@ def test_subproc_start_method():
         check_vecenv_spaces(vec_env_class, space, obs_assert)
 
 
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="Requires the fork start method")
+def test_subproc_shared_memory_fork():
+    """Test the shared memory transport with forked workers."""
+    space = gym.spaces.Box(low=np.zeros(2), high=np.ones(2))
+    vec_env_class = functools.partial(SubprocVecEnv, start_method="fork", use_shared_memory=True)
+    check_vecenv_spaces(vec_env_class, space, lambda obs: check_vecenv_obs(obs, space))
+
+    # In a new interpreter, where the resource tracker is not running yet:
+    # the workers must not start their own one, which unlinks the blocks when they exit
+    script = """
+import gym
+import numpy as np
+from stable_baselines3.common.vec_env import SubprocVecEnv
+
+vec_env = SubprocVecEnv([lambda: gym.make("CartPole-v1")] * 3, start_method="fork", use_shared_memory=True)
+vec_env.reset()
+for _ in range(10):
+    vec_env.step(np.zeros(3, dtype=int))
+vec_env.close()
+"""
+    process = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=120)
+    assert process.returncode == 0, process.stderr
+    assert "resource_tracker" not in process.stderr
+
+
 class CustomWrapperA(VecNormalize):
     def __init__(self, venv):
         VecNormalize.__init__(self, venv)
@@ -440,3 +474,48 @@ def test_vec_env_is_wrapped():
 
     vec_env = VecFrameStack(vec_env, n_stack=2)
     assert vec_env.env_is_wrapped(Monitor) == [False, True]
+
+
+@pytest.mark.parametrize("vec_env_class", VEC_ENV_CLASSES)
+@pytest.mark.parametrize("vec_env_wrapper", VEC_ENV_WRAPPERS)
+def test_vecenv_columnar_infos(vec_env_class, vec_env_wrapper):
+    """Test that the columns of the infos match the info dicts."""
+    step_nums = [i + 5 for i in range(N_ENVS)]
+
+    def make_env(n_steps):
+        # Truncate every other episode
+        env = gym.wrappers.TimeLimit(StepEnv(n_steps), max_episode_steps=n_steps - n_steps % 2)
+        return Monitor(env)
+
+    vec_env = vec_env_class([functools.partial(make_env, n) for n in step_nums], columnar_infos=True)
+    if vec_env_wrapper is not None:
+        if vec_env_wrapper == VecFrameStack:
+            vec_env = vec_env_wrapper(vec_env, n_stack=2)
+        else:
+            vec_env = vec_env_wrapper(vec_env)
+
+    zero_acts = np.zeros((N_ENVS,), dtype="int")
+    vec_env.reset()
+    n_ended, n_timeouts = 0, 0
+    for _ in range(2 * max(step_nums)):
+        _, _, dones, infos = vec_env.step(zero_acts)
+        assert isinstance(infos, VecEnvInfos)
+        assert len(infos) == N_ENVS
+        expected_timeouts = [info.get("TimeLimit.truncated", False) for info in infos]
+        assert np.all(infos.timeouts == expected_timeouts)
+        assert np.all(get_timeouts(infos) == expected_timeouts)
+        n_timeouts += np.sum(expected_timeouts)
+        ended = [idx for idx in range(N_ENVS) if "terminal_observation" in infos[idx]]
+        assert np.all(np.flatnonzero(dones) == ended)
+        assert np.all(infos.terminal_indices == ended)
+        assert np.all(infos.episode_indices == ended)
+        if len(ended) == 0:
+            assert infos.terminal_observations is None
+            continue
+        n_ended += len(ended)
+        expected_obs = np.stack([infos[idx]["terminal_observation"] for idx in ended])
+        assert np.allclose(infos.terminal_observations, expected_obs)
+        assert np.all(infos.episode_lengths == [infos[idx]["episode"]["l"] for idx in ended])
+        assert np.allclose(infos.episode_rewards, [infos[idx]["episode"]["r"] for idx in ended])
+    assert n_ended > 0 and n_timeouts > 0
+    vec_env.close()